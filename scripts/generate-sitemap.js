@@ -1,6 +1,7 @@
 // Generates sitemap.xml for snapcalc.site
-// Run via: node scripts/generate-sitemap.js
-// Vercel runs this automatically as the build step.
+// Run via: node scripts/generate-sitemap.js (npm run build:sitemap-node)
+// Superseded by the sitemap stage of tools/build.py, which the build step now runs
+// (content-hash lastmod, category pages, sitemap index). Kept as a fallback.
 
 const fs = require('fs');
 const path = require('path');
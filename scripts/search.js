@@ -1,6 +1,12 @@
 /* SnapCalc site-wide header search
-   - Fetches /search-index.json (one entry per calculator)
-   - Matches on title, category, aliases (substring, normalized)
+   - Fetches /search-index/manifest.json, then only the shard(s) a query needs
+     (one shard per leading character of a word, built by tools/search_shards.py)
+   - Matches when every query word is a prefix of a title/category/alias word;
+     with fewer than MAX_RESULTS such hits, adds substring hits from
+     /search-index.min.json (a mid-word match like "mortgage" in "remortgage"
+     lives in another letter's shard)
+   - Falls back to /search-index.min.json (or /search-index.json before a build)
+     with substring matching if shards are unavailable
    - Renders a dropdown under the input
 */
 
@@ -13,7 +19,11 @@
   
     const INPUT_ID = "siteSearchInput";
     const RESULTS_ID = "siteSearchResults";
-    const INDEX_URL = "/search-index.json";
+    // Minified copy written by the build; the committed pretty-printed file is the fallback
+    const INDEX_URLS = ["/search-index.min.json", "/search-index.json"];
+    const SHARDS_BASE = "/search-index/";
+    const SHARDS_MANIFEST_URL = SHARDS_BASE + "manifest.json";
+    const SHARD_FORMAT = 1;
     const MAX_RESULTS = 12;
   
     const inputEl = document.getElementById(INPUT_ID);
@@ -23,6 +33,9 @@
   
     let indexData = [];
     let indexLoaded = false;
+    let shardManifest = null; // null = not loaded yet, false = unavailable (use legacy index)
+    let shardManifestPromise = null;
+    const shardPromises = {};
     let activeIndex = -1;
     let lastQuery = "";
   
@@ -51,7 +64,8 @@
       indexLoaded = true;
   
       try {
-        const res = await fetch(INDEX_URL, { cache: "force-cache" });
+        let res = await fetch(INDEX_URLS[0], { cache: "force-cache" });
+        if (!res.ok) res = await fetch(INDEX_URLS[1], { cache: "force-cache" });
         if (!res.ok) throw new Error("Index fetch failed: " + res.status);
   
         const json = await res.json();
@@ -85,6 +99,92 @@
       }
     }
   
+    function loadShardManifestOnce() {
+      if (!shardManifestPromise) {
+        shardManifestPromise = fetch(SHARDS_MANIFEST_URL, { cache: "no-cache" })
+          .then((res) => {
+            if (!res.ok) throw new Error("Manifest fetch failed: " + res.status);
+            return res.json();
+          })
+          .then((json) => {
+            if (!json || json.v !== SHARD_FORMAT || typeof json.shards !== "object") {
+              throw new Error("Unsupported search index manifest");
+            }
+            shardManifest = json;
+          })
+          .catch(() => {
+            shardManifest = false;
+          });
+      }
+      return shardManifestPromise;
+    }
+  
+    function shardKey(word) {
+      const c = word.charAt(0);
+      return c >= "0" && c <= "9" ? "0" : c;
+    }
+  
+    function loadShard(key) {
+      if (!(key in shardPromises)) {
+        const file = shardManifest.shards[key];
+        // No shard means no indexed word starts with this character.
+        shardPromises[key] = !file
+          ? Promise.resolve(null)
+          : fetch(SHARDS_BASE + file, { cache: "force-cache" })
+              .then((res) => (res.ok ? res.json() : null))
+              .then((json) => (json && json.v === SHARD_FORMAT ? json : null))
+              .catch(() => null);
+      }
+      return shardPromises[key];
+    }
+  
+    // Docs (by global id) having a term that starts with word, from that word's shard.
+    function shardPrefixDocs(shard, word) {
+      const out = new Map();
+      if (!shard) return out;
+  
+      const terms = shard.terms;
+      const span = word.length >= 2 ? shard.prefix[word.slice(0, 2)] : [0, terms.length];
+      if (!span) return out;
+  
+      for (let i = span[0]; i < span[1]; i++) {
+        if (!terms[i].startsWith(word)) continue;
+        const posting = shard.postings[i];
+        for (let j = 0; j < posting.length; j++) {
+          const doc = shard.docs[posting[j]];
+          if (out.has(doc[0])) continue;
+          out.set(doc[0], {
+            title: shard.strings[doc[1]],
+            url: shard.strings[doc[2]],
+            category: shard.strings[doc[3]]
+          });
+        }
+      }
+      return out;
+    }
+  
+    async function getShardMatches(queryRaw) {
+      const words = Array.from(new Set(normalize(queryRaw).split(" ").filter(Boolean)));
+      if (!words.length) return [];
+  
+      const shards = await Promise.all(words.map((w) => loadShard(shardKey(w))));
+  
+      // Every word must match; intersect starting from the first word's docs.
+      let hits = shardPrefixDocs(shards[0], words[0]);
+      for (let i = 1; i < words.length && hits.size; i++) {
+        const next = shardPrefixDocs(shards[i], words[i]);
+        for (const id of Array.from(hits.keys())) {
+          if (!next.has(id)) hits.delete(id);
+        }
+      }
+  
+      // Doc ids follow the build's record order, same as the legacy index
+      return Array.from(hits.keys())
+        .sort((a, b) => a - b)
+        .slice(0, MAX_RESULTS)
+        .map((id) => hits.get(id));
+    }
+  
     function hideResults() {
       resultsEl.innerHTML = "";
       resultsEl.classList.remove("open");
@@ -146,7 +246,7 @@
       }
     }
   
-    function getMatches(queryRaw) {
+    function getMatches(queryRaw, limit = MAX_RESULTS) {
       const q = normalize(queryRaw);
       if (!q) return [];
   
@@ -155,7 +255,7 @@
       for (let i = 0; i < indexData.length; i++) {
         const item = indexData[i];
         if (item._search.includes(q)) hits.push(item);
-        if (hits.length >= MAX_RESULTS) break;
+        if (hits.length >= limit) break;
       }
       return hits;
     }
@@ -172,9 +272,25 @@
         return;
       }
   
-      await loadIndexOnce();
+      await loadShardManifestOnce();
+  
+      let matches;
+      if (shardManifest) {
+        matches = await getShardMatches(q);
+        if (matches.length < MAX_RESULTS) {
+          // Substring fallback, prefix hits first
+          await loadIndexOnce();
+          const seen = new Set(matches.map((m) => m.url));
+          const extra = getMatches(q, MAX_RESULTS + matches.length).filter((m) => !seen.has(m.url));
+          matches = matches.concat(extra).slice(0, MAX_RESULTS);
+        }
+      } else {
+        await loadIndexOnce();
+        matches = getMatches(q);
+      }
   
-      const matches = getMatches(q);
+      // A newer keystroke may have finished first
+      if (q !== lastQuery) return;
       showResults(matches, q);
     }
   
@@ -230,7 +346,7 @@
   
     // Load on first focus to reduce initial work
     inputEl.addEventListener("focus", function () {
-      loadIndexOnce();
+      loadShardManifestOnce();
       if ((inputEl.value || "").trim()) handleInput();
     });
   
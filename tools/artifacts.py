@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable, Optional
+
+if TYPE_CHECKING:  # output_stage imports this module
+    from output_stage import OutputStage
+
+
+@dataclass(frozen=True)
+class ArtifactSizes:
+    source: Path
+    raw: int
+    minified: int
+    gz: int  # of the served payload: roughly what the host's own compression sends
+    written: int  # files actually rewritten this build
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    # Temp file in the same directory + os.replace, so readers never see a partial file.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # mkstemp creates 0600; these files are served, so keep the old mode or use 0644
+    mode = path.stat().st_mode & 0o777 if path.exists() else 0o644
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def write_if_changed(path: Path, data: bytes) -> bool:
+    # Compare content hashes; an unchanged artifact keeps its mtime (and CDN etag).
+    if path.exists() and hashlib.sha256(path.read_bytes()).digest() == hashlib.sha256(data).digest():
+        return False
+    atomic_write_bytes(path, data)
+    return True
+
+
+def _file_sha256(path: Path) -> Optional[bytes]:
+    try:
+        with path.open("rb") as f:
+            h = hashlib.sha256()
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+            return h.digest()
+    except OSError:
+        return None
+
+
+def write_chunks_if_changed(path: Path, chunks: Iterable[str]) -> bool:
+    """
+    write_if_changed for output produced piece by piece (json_stream's generators).
+
+    Chunks are encoded and written to a temp file as they arrive, hashing on
+    the way, so the whole content is never held in memory. The temp file
+    replaces path only if the hash differs; otherwise it is dropped and path
+    keeps its mtime.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    mode = path.stat().st_mode & 0o777 if path.exists() else 0o644
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    h = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb", buffering=1 << 16) as f:
+            for chunk in chunks:
+                data = chunk.encode("utf-8")
+                h.update(data)
+                f.write(data)
+        if _file_sha256(path) == h.digest():
+            Path(tmp).unlink()
+            return False
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    return True
+
+
+def minify_json(text: str) -> str:
+    return json.dumps(json.loads(text), ensure_ascii=False, separators=(",", ":"))
+
+
+def gzip_bytes(data: bytes) -> bytes:
+    # mtime=0 keeps the output byte-stable across builds
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def sibling(path: Path, suffix: str) -> Path:
+    return path.with_name(path.name + suffix)
+
+
+def min_path(path: Path) -> Path:
+    # search-index.json -> search-index.min.json
+    return path.with_name(f"{path.stem}.min{path.suffix}")
+
+
+def write_deploy_artifact(source: Path, minify: bool = True, *, out: OutputStage) -> ArtifactSizes:
+    """
+    Emit the file the client fetches for one build output, and report its sizes.
+
+    With minify, JSON is re-serialized compactly into <stem>.min<suffix> (what
+    scripts/search.js loads); otherwise the source is served as it is. No
+    .gz/.br siblings are written: the host compresses responses itself and
+    never serves them, so the gzip size is only reported, as the transfer
+    size to expect. Siblings left by earlier builds are removed. Reads the
+    published source; writes are staged in `out`.
+    """
+    raw = source.read_bytes()
+    if minify:
+        target = min_path(source)
+        payload = (minify_json(raw.decode("utf-8")) + "\n").encode("utf-8")
+    else:
+        target = source
+        payload = raw
+
+    written = int(minify and out.write_bytes(target, payload))
+    for suffix in (".gz", ".br"):
+        out.remove(sibling(target, suffix))
+
+    return ArtifactSizes(
+        source=source,
+        raw=len(raw),
+        minified=len(payload),
+        gz=len(gzip_bytes(payload)),
+        written=written,
+    )
+
+
+def format_size_report(rows: list[ArtifactSizes], repo_root: Path) -> list[str]:
+    def kb(n: int) -> str:
+        return f"{n / 1024:.1f} KB"
+
+    lines = [f"  {'artifact':<24}{'raw':>10}{'minified':>11}{'gzip':>10}"]
+    for r in rows:
+        name = r.source.relative_to(repo_root).as_posix()
+        lines.append(f"  {name:<24}{kb(r.raw):>10}{kb(r.minified):>11}{kb(r.gz):>10}")
+    return lines
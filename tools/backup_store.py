@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Content-addressed backup store shared by the bulk-edit tools.
+
+Before a tool rewrites a file it saves the old bytes here once, keyed by
+sha256 and gzip-compressed, and appends one line to its run manifest:
+
+    tools/.backup/objects/ab/ab12....gz     one object per distinct content
+    tools/.backup/runs/<run id>.ndjson      header line + one line per edited file
+
+Re-running a sitewide edit only adds objects for content the store has not
+seen, so repeated runs cost a manifest, not another copy of the tree.
+
+Run from anywhere:
+    python tools/backup_store.py list
+    python tools/backup_store.py restore RUN_ID [--dry-run] [--force]
+    python tools/backup_store.py drop RUN_ID
+    python tools/backup_store.py import-legacy [--delete]
+"""
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from artifacts import atomic_write_bytes
+from file_discovery import walk
+from output_stage import begin_output
+
+DEFAULT_STORE_DIR = Path(__file__).parent / ".backup"
+
+# Bump if the manifest layout changes; restore refuses runs it does not understand.
+RUN_VERSION = 1
+
+# Pre-store backups left in the tree (see import-legacy)
+LEGACY_TREES = ("_snapcalc_backup_*", "tools/_restore_safety_backup")
+LEGACY_SUFFIX = ".bak"
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@dataclass(frozen=True)
+class RunInfo:
+    run_id: str
+    tool: str
+    created: str
+    files: int
+
+
+@dataclass
+class RestoreResult:
+    restored: list[Path]
+    skipped: list[tuple[Path, str]]
+
+
+class BackupRun:
+    """
+    One tool invocation's backups. Picklable, so parallel_map workers can save
+    their own files: save() writes the object, then appends a single manifest
+    line with one O_APPEND write (safe across processes on a local disk).
+    """
+
+    def __init__(self, store_dir: Path, run_id: str, root: Path) -> None:
+        self.store_dir = store_dir
+        self.run_id = run_id
+        self.root = root
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.store_dir / "runs" / f"{self.run_id}.ndjson"
+
+    def save(self, path: Path, old: bytes, new: Optional[bytes] = None) -> str:
+        """
+        Back up `old` (the content of `path` before the edit); call before writing.
+
+        `new` is the content about to be written; restore uses its hash to
+        refuse clobbering later edits. Returns the object hash.
+        """
+        digest = put_object(self.store_dir, old)
+        entry = {
+            "path": path.relative_to(self.root).as_posix(),
+            "before_sha256": digest,
+            "after_sha256": sha256_hex(new) if new is not None else None,
+        }
+        _append_line(self.manifest_path, entry)
+        return digest
+
+    def entries(self) -> int:
+        if not self.manifest_path.exists():
+            return 0
+        with self.manifest_path.open(encoding="utf-8") as f:
+            return max(0, sum(1 for line in f if line.strip()) - 1)
+
+    def close(self) -> bool:
+        # Drop the manifest of a run that backed nothing up; returns True if the run was kept.
+        if self.entries() == 0:
+            self.manifest_path.unlink(missing_ok=True)
+            return False
+        return True
+
+
+def _append_line(path: Path, obj: dict) -> None:
+    line = (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def object_path(store_dir: Path, digest: str) -> Path:
+    return store_dir / "objects" / digest[:2] / f"{digest}.gz"
+
+
+def put_object(store_dir: Path, data: bytes) -> str:
+    digest = sha256_hex(data)
+    p = object_path(store_dir, digest)
+    if not p.exists():
+        # mtime=0: the same content always compresses to the same bytes
+        atomic_write_bytes(p, gzip.compress(data, compresslevel=6, mtime=0))
+    return digest
+
+
+def get_object(store_dir: Path, digest: str) -> bytes:
+    data = gzip.decompress(object_path(store_dir, digest).read_bytes())
+    if sha256_hex(data) != digest:
+        raise ValueError(f"Corrupt backup object {digest}")
+    return data
+
+
+def begin_run(tool: str, root: Path, store_dir: Path = DEFAULT_STORE_DIR, meta: Optional[dict] = None) -> BackupRun:
+    stamp = datetime.now(timezone.utc)
+    run = BackupRun(store_dir, f"{tool}-{stamp:%Y%m%d_%H%M%S_%f}", root)
+    run.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    header = {
+        "backup_run": RUN_VERSION,
+        "run": run.run_id,
+        "tool": tool,
+        "created": stamp.isoformat(timespec="seconds"),
+        "root": str(root),
+        **(meta or {}),
+    }
+    _append_line(run.manifest_path, header)
+    return run
+
+
+def _run_lines(store_dir: Path, run_id: str) -> tuple[dict, list[dict]]:
+    # (header, every file line in order)
+    path = store_dir / "runs" / f"{run_id}.ndjson"
+    try:
+        lines = path.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        raise ValueError(f"No backup run {run_id!r} in {store_dir}") from None
+    if not lines:
+        raise ValueError(f"Empty backup run: {path}")
+    header = json.loads(lines[0])
+    if header.get("backup_run") != RUN_VERSION:
+        raise ValueError(f"Unsupported backup run format in {path}")
+
+    entries: list[dict] = []
+    for line in lines[1:]:
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue  # truncated last line of an interrupted run
+    return header, entries
+
+
+def _read_run(store_dir: Path, run_id: str) -> tuple[dict, list[dict]]:
+    # One entry per file. A file saved more than once in a run (e.g. a grid rewritten
+    # on every watch rebuild) restores to its first "before" and is checked against its last "after".
+    header, lines = _run_lines(store_dir, run_id)
+    entries: dict[str, dict] = {}
+    for entry in lines:
+        first = entries.setdefault(entry["path"], dict(entry))
+        first["after_sha256"] = entry["after_sha256"]
+    return header, list(entries.values())
+
+
+def list_runs(store_dir: Path = DEFAULT_STORE_DIR) -> list[RunInfo]:
+    runs: list[RunInfo] = []
+    for p in sorted((store_dir / "runs").glob("*.ndjson")):
+        try:
+            header, entries = _read_run(store_dir, p.stem)
+        except ValueError:
+            continue
+        runs.append(RunInfo(p.stem, header.get("tool", "?"), header.get("created", "?"), len(entries)))
+    return runs
+
+
+def restore_run(
+    run_id: str,
+    store_dir: Path = DEFAULT_STORE_DIR,
+    write: bool = True,
+    force: bool = False,
+) -> RestoreResult:
+    """
+    Put back the pre-edit content of every file in a run.
+
+    A file whose current hash is neither the run's "after" hash nor its
+    "before" hash was edited again since the run; it is skipped unless force.
+    """
+    header, entries = _read_run(store_dir, run_id)
+    root = Path(header["root"])
+    result = RestoreResult(restored=[], skipped=[])
+    # Restored files are published together, once every entry has been checked
+    with begin_output("restore", root) as out:
+        for entry in entries:
+            p = root / entry["path"]
+            current = out.read_bytes(p) if out.exists(p) else None
+            digest = sha256_hex(current) if current is not None else None
+            if digest == entry["before_sha256"]:
+                result.skipped.append((p, "already restored"))
+                continue
+            if not force and (current is None or digest != entry["after_sha256"]):
+                reason = "file no longer exists" if current is None else "edited since the run"
+                result.skipped.append((p, f"{reason} (use --force)"))
+                continue
+            data = get_object(store_dir, entry["before_sha256"])
+            if write:
+                out.write_bytes(p, data)
+            result.restored.append(p)
+    return result
+
+
+def drop_run(run_id: str, store_dir: Path = DEFAULT_STORE_DIR) -> int:
+    # Remove a run, then every object no remaining run refers to; returns objects removed.
+    _read_run(store_dir, run_id)
+    (store_dir / "runs" / f"{run_id}.ndjson").unlink()
+
+    # Every line counts, not just the first per file
+    live: set[str] = set()
+    for info in list_runs(store_dir):
+        live.update(e["before_sha256"] for e in _run_lines(store_dir, info.run_id)[1])
+    removed = 0
+    for p in (store_dir / "objects").glob("*/*.gz"):
+        if p.name[: -len(".gz")] not in live:
+            p.unlink()
+            removed += 1
+    return removed
+
+
+def store_size(store_dir: Path = DEFAULT_STORE_DIR) -> tuple[int, int]:
+    # (objects, bytes on disk)
+    sizes = [p.stat().st_size for p in (store_dir / "objects").glob("*/*.gz")]
+    return len(sizes), sum(sizes)
+
+
+def legacy_trees(repo_root: Path) -> list[Path]:
+    return sorted({t for pattern in LEGACY_TREES for t in repo_root.glob(pattern) if t.is_dir()})
+
+
+def legacy_backups(repo_root: Path) -> dict[str, list[tuple[Path, str]]]:
+    """
+    Legacy backups as {run name: [(backup file, repo-relative original path)]}.
+
+    Mirror trees map <tree>/<path> to <path>; a stray <file>.bak maps to <file>.
+    A mirror's own .bak copies go to a separate "<tree>-bak" run, so each run
+    holds one version per file.
+    """
+    trees = legacy_trees(repo_root)
+    found: dict[str, list[tuple[Path, str]]] = {}
+    for tree in trees:
+        name = "-".join(part.strip("_") for part in tree.relative_to(repo_root).parts)
+        # The shared file excludes would hide exactly the .bak files wanted here
+        for rel in walk(tree, exclude_files=()).files:
+            p = tree / rel
+            if rel.endswith(LEGACY_SUFFIX):
+                found.setdefault(f"{name}-bak", []).append((p, rel[: -len(LEGACY_SUFFIX)]))
+            else:
+                found.setdefault(name, []).append((p, rel))
+
+    # The mirror trees themselves are in the shared directory excludes
+    for rel in walk(repo_root, exclude_files=()).files:
+        if rel.endswith(LEGACY_SUFFIX):
+            found.setdefault("bak-files", []).append((repo_root / rel, rel[: -len(LEGACY_SUFFIX)]))
+    return found
+
+
+def import_legacy(repo_root: Path, store_dir: Path, delete: bool) -> int:
+    found = legacy_backups(repo_root)
+    if not found:
+        print("No legacy backups found.")
+        return 0
+
+    raw_total = 0
+    for name, files in found.items():
+        run = begin_run(f"legacy-{name}", repo_root, store_dir)
+        raw = 0
+        for src, rel in files:
+            data = src.read_bytes()
+            raw += len(data)
+            # The original's later content is unknown: restoring these needs --force.
+            run.save(repo_root / rel, data)
+        raw_total += raw
+        print(f"{run.run_id}: {len(files)} file(s), {raw / 1e6:.1f} MB")
+
+        if delete:
+            for src, _ in files:
+                # Only remove what the store can give back byte for byte
+                get_object(store_dir, sha256_hex(src.read_bytes()))
+                src.unlink()
+
+    if delete:
+        # Emptied mirror trees go too (bottom-up; anything not imported keeps its directory)
+        for tree in legacy_trees(repo_root):
+            for dirpath, _, _ in os.walk(tree, topdown=False):
+                if not any(Path(dirpath).iterdir()):
+                    Path(dirpath).rmdir()
+
+    objects, size = store_size(store_dir)
+    print(f"Store: {objects} object(s), {size / 1e6:.1f} MB for {raw_total / 1e6:.1f} MB of legacy backups")
+    if not delete:
+        print("Legacy files left in place; re-run with --delete to remove them.")
+    return 0
+
+
+def main() -> int:
+    repo_root = Path(__file__).resolve().parent.parent
+    parser = argparse.ArgumentParser(description="List, restore or drop runs in the SnapCalc backup store.")
+    parser.add_argument("--store", default=str(DEFAULT_STORE_DIR), help="Store directory. Default: tools/.backup")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List backup runs, oldest first.")
+    p_restore = sub.add_parser("restore", help="Restore the pre-edit content of a run's files.")
+    p_restore.add_argument("run_id")
+    p_restore.add_argument("--dry-run", action="store_true", help="Report what would be restored.")
+    p_restore.add_argument("--force", action="store_true", help="Also overwrite files edited since the run.")
+    p_drop = sub.add_parser("drop", help="Delete a run and the objects only it referenced.")
+    p_drop.add_argument("run_id")
+    p_import = sub.add_parser(
+        "import-legacy", help="Import *.bak files and backup mirror trees into the store (one run each)."
+    )
+    p_import.add_argument("--delete", action="store_true", help="Remove the legacy copies once stored.")
+    args = parser.parse_args()
+
+    store_dir = Path(args.store).resolve()
+    try:
+        if args.command == "list":
+            runs = list_runs(store_dir)
+            for r in runs:
+                print(f"{r.run_id}  {r.tool:<20} {r.created}  {r.files} file(s)")
+            objects, size = store_size(store_dir)
+            print(f"{len(runs)} run(s); {objects} object(s), {size / 1e6:.1f} MB")
+            return 0
+
+        if args.command == "restore":
+            result = restore_run(args.run_id, store_dir, write=not args.dry_run, force=args.force)
+            tag = "[DRY RUN]" if args.dry_run else "[RESTORED]"
+            for p in result.restored:
+                print(f"{tag} {p}")
+            for p, reason in result.skipped:
+                print(f"[SKIPPED] {p}  ({reason})")
+            print(f"Files restored: {len(result.restored)}; skipped: {len(result.skipped)}")
+            return 1 if any(r != "already restored" for _, r in result.skipped) else 0
+
+        if args.command == "drop":
+            removed = drop_run(args.run_id, store_dir)
+            print(f"Dropped {args.run_id}; {removed} unreferenced object(s) removed")
+            return 0
+
+        return import_legacy(repo_root, store_dir, args.delete)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
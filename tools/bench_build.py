@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Per-stage build benchmark on synthetic corpora (see synth_corpus.py).
+
+For each --pages scale, generates (or reuses) a corpus and times the build
+stages in order: scan, parse (parse_calculator_page), aliases (build_aliases),
+search_index (write_search_index_json), search_shards, category_rewrite
+(rewrite_category_pages) and sitemap. Each stage's time is the best of
+--repeat runs, so category_rewrite and sitemap show the steady state (grids
+and sitemap already current) rather than the first write.
+
+Results go to a JSON file. With --baseline, every stage is compared against
+an earlier results file; a stage slower by more than --threshold (and by more
+than --min-delta-ms, to ignore noise on tiny stages) is a regression and the
+exit code is 1. The scaling table shows per-page cost across scales, which
+is where a stage that grows worse than linearly shows up first.
+
+Run from anywhere:
+    python tools/bench_build.py --pages 1000 10000 50000 [--repeat 3] [--jobs 1]
+    python tools/bench_build.py --pages 1000 10000 --baseline tools/.cache/bench/build-<stamp>.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+from calculators_config import get_paths
+from file_discovery import invalidate
+from output_stage import begin_output
+from search_shards import write_search_shards
+from sitemap import write_sitemap
+from synth_corpus import CorpusSpec, generate_corpus
+from utils import (
+    build_aliases,
+    build_category_name_map,
+    parse_calculator_page,
+    rewrite_category_pages,
+    scan_calculator_index_files,
+    write_search_index_json,
+)
+
+# Bump when the results layout changes; --baseline refuses other versions.
+RESULTS_VERSION = 1
+
+STAGES = ("scan", "parse", "aliases", "search_index", "search_shards", "category_rewrite", "sitemap")
+
+# Per-page cost growth (largest scale vs smallest) flagged as worse than linear
+SUPERLINEAR = 1.5
+
+
+def timed(fn: Callable[[], object], repeat: int) -> tuple[list[float], object]:
+    # All run times in seconds, plus the last run's result.
+    runs: list[float] = []
+    result: object = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - t0)
+    return runs, result
+
+
+def corpus_bytes(root: Path) -> int:
+    return sum(p.stat().st_size for p in (root / "calculators").glob("*/*/index.html"))
+
+
+def bench_scale(root: Path, spec: CorpusSpec, repeat: int, jobs: int) -> dict:
+    generated = generate_corpus(root, spec)
+    paths = get_paths(root)
+    stages: dict[str, list[float]] = {}
+
+    def scan():
+        # Time the walk itself, not the cached listing from the previous repeat
+        invalidate()
+        return scan_calculator_index_files(paths.calculators_dir), build_category_name_map(paths.categories_dir)
+
+    stages["scan"], (files, name_map) = timed(scan, repeat)
+
+    def parse():
+        recs = [parse_calculator_page(f, paths.calculators_dir, name_map) for f in files]
+        return sorted((r for r in recs if r is not None), key=lambda r: (r.category_slug.lower(), r.title.lower()))
+
+    stages["parse"], records = timed(parse, repeat)
+
+    stages["aliases"], _ = timed(
+        lambda: [build_aliases(r.title, r.calculator_slug, r.category_name) for r in records], repeat
+    )
+    def published(fn):
+        # Writing stages go through the output layer and are committed, as in the build
+        def run():
+            with begin_output("bench", root) as out:
+                return fn(out)
+
+        return run
+
+    stages["search_index"], _ = timed(
+        published(lambda out: write_search_index_json(paths.search_index_path, records, out=out)), repeat
+    )
+    stages["search_shards"], _ = timed(
+        published(lambda out: write_search_shards(paths.search_shards_dir, records, out=out)), repeat
+    )
+    stages["category_rewrite"], _ = timed(
+        published(lambda out: rewrite_category_pages(paths.categories_dir, records, jobs=jobs, out=out)), repeat
+    )
+
+    stages["sitemap"], _ = timed(published(lambda out: write_sitemap(paths, today="2026-01-01", out=out)), repeat)
+
+    pages = len(files)
+    return {
+        "pages": pages,
+        "categories": spec.categories,
+        "records": len(records),
+        "corpus_bytes": corpus_bytes(root),
+        "corpus_generated": generated,
+        "stages": {
+            name: {
+                "best_s": min(runs),
+                "runs_s": runs,
+                "per_page_us": min(runs) / pages * 1e6,
+            }
+            for name, runs in stages.items()
+        },
+        "total_s": sum(min(runs) for runs in stages.values()),
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_delta_s: float) -> list[str]:
+    # Returns "scale/stage" labels that regressed; prints the comparison table.
+    regressions: list[str] = []
+    print(f"\nAgainst baseline {baseline.get('created', '?')} (threshold +{threshold:.0%}, min delta {min_delta_s * 1000:.0f} ms)")
+    print(f"  {'pages':>7}  {'stage':<18}{'baseline ms':>13}{'current ms':>12}{'change':>9}")
+    for scale, cur in current["scales"].items():
+        base = baseline.get("scales", {}).get(scale)
+        if base is None:
+            print(f"  {scale:>7}  (not in baseline)")
+            continue
+        for stage in STAGES:
+            c = cur["stages"].get(stage)
+            b = base["stages"].get(stage)
+            if c is None or b is None:
+                continue
+            before, after = b["best_s"], c["best_s"]
+            change = after / before - 1 if before > 0 else 0.0
+            bad = change > threshold and after - before > min_delta_s
+            if bad:
+                regressions.append(f"{scale}/{stage}")
+            flag = "  REGRESSION" if bad else ""
+            print(f"  {scale:>7}  {stage:<18}{before * 1000:>13.1f}{after * 1000:>12.1f}{change:>+9.0%}{flag}")
+    return regressions
+
+
+def print_scaling(results: dict) -> None:
+    scales = list(results["scales"].values())
+    header = "".join(f"{s['pages']:>10}" for s in scales)
+    print(f"\n  {'per-page us':<18}{header}" + ("    growth" if len(scales) > 1 else ""))
+    worst: Optional[tuple[float, str]] = None
+    for stage in STAGES:
+        per_page = [s["stages"][stage]["per_page_us"] for s in scales]
+        line = f"  {stage:<18}{''.join(f'{v:>10.1f}' for v in per_page)}"
+        if len(scales) > 1 and per_page[0] > 0:
+            growth = per_page[-1] / per_page[0]
+            line += f"{growth:>9.2f}x" + ("  superlinear" if growth > SUPERLINEAR else "")
+            if worst is None or growth > worst[0]:
+                worst = (growth, stage)
+        print(line)
+    totals = "".join(f"{s['total_s']:>10.2f}" for s in scales)
+    print(f"  {'total s':<18}{totals}")
+    if worst is not None:
+        print(f"  Fastest-growing stage: {worst[1]} ({worst[0]:.2f}x per-page cost from smallest to largest scale)")
+
+
+def main() -> int:
+    repo_root = Path(__file__).resolve().parent.parent
+    parser = argparse.ArgumentParser(description="Benchmark build stages on synthetic calculator corpora.")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1000], help="Corpus sizes. Default: 1000")
+    parser.add_argument("--categories", type=int, default=15, help="Categories per corpus. Default: 15")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus seed. Default: 0")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage (best is kept). Default: 3")
+    parser.add_argument("--jobs", type=int, default=1, help="Workers for category_rewrite. Default: 1")
+    parser.add_argument(
+        "--workdir",
+        default=None,
+        help="Where corpora live (kept and reused across runs). Default: a temp dir removed afterwards.",
+    )
+    parser.add_argument(
+        "--out",
+        default=None,
+        help="Results JSON. Default: tools/.cache/bench/build-<UTC time>.json",
+    )
+    parser.add_argument("--baseline", default=None, help="Earlier results JSON to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown per stage. Default: 0.15 (15%%)")
+    parser.add_argument(
+        "--min-delta-ms", type=float, default=5.0, help="Ignore slowdowns smaller than this. Default: 5"
+    )
+    args = parser.parse_args()
+
+    if args.repeat < 1 or any(n < 1 for n in args.pages):
+        print("ERROR: --repeat and --pages must be at least 1")
+        return 2
+
+    baseline = None
+    if args.baseline:
+        try:
+            baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"ERROR: cannot read baseline {args.baseline}: {e}")
+            return 2
+        if baseline.get("version") != RESULTS_VERSION:
+            print(f"ERROR: baseline {args.baseline} has an unsupported results version")
+            return 2
+
+    workdir = Path(args.workdir).resolve() if args.workdir else Path(tempfile.mkdtemp(prefix="snapcalc-bench-"))
+    stamp = datetime.now(timezone.utc)
+    results = {
+        "version": RESULTS_VERSION,
+        "created": stamp.isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "jobs": args.jobs,
+        "repeat": args.repeat,
+        "scales": {},
+    }
+
+    try:
+        for n in sorted(set(args.pages)):
+            spec = CorpusSpec(pages=n, categories=args.categories, seed=args.seed)
+            root = workdir / f"pages-{n}-cats-{args.categories}-seed-{args.seed}"
+            t0 = time.perf_counter()
+            scale = bench_scale(root, spec, args.repeat, args.jobs)
+            results["scales"][str(n)] = scale
+            print(
+                f"{n} pages ({scale['corpus_bytes'] / 1e6:.0f} MB, "
+                f"{'generated' if scale['corpus_generated'] else 'reused'}): "
+                f"build stages {scale['total_s']:.2f} s, wall {time.perf_counter() - t0:.1f} s"
+            )
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_scaling(results)
+
+    out = Path(args.out) if args.out else repo_root / "tools" / ".cache" / "bench" / f"build-{stamp:%Y%m%d_%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=1) + "\n", encoding="utf-8")
+    print(f"\nResults: {out}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms / 1000)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+        print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
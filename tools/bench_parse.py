@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Per-page parse benchmark: the breadcrumbs category link found with the old
+whole-page DOTALL pattern vs searched from the breadcrumbs <nav> (the build).
+The other head fields are parsed the same way in both.
+
+On well-formed pages both cost about the same; the difference is a page whose
+breadcrumbs lose their </nav> (hand edits), where the old pattern backtracks
+over the rest of the page once per later </a>. That case is timed last.
+
+Run from anywhere:
+    python tools/bench_parse.py [--repeat 5]
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from calculators_config import CANONICAL_RE, H1_TEXT_RE, META_DESC_RE, TITLE_TAG_RE, get_paths
+from utils import (
+    HeadFields,
+    build_category_name_map,
+    head_fields,
+    html_text,
+    re_first,
+    read_text,
+    record_from_head_fields,
+    scan_calculator_index_files,
+)
+
+# The pattern the build used before (one search with DOTALL .*? between nav, link and </nav>)
+LEGACY_BREADCRUMBS_RE = re.compile(
+    r'<nav\s+class="breadcrumbs"[^>]*>.*?<a\s+href="/categories/([^/]+)/"\s*>(.*?)</a>.*?</nav>',
+    re.DOTALL | re.IGNORECASE,
+)
+
+
+def legacy_head_fields(raw: str) -> HeadFields:
+    title = re_first(TITLE_TAG_RE, raw)
+    m = LEGACY_BREADCRUMBS_RE.search(raw)
+    return HeadFields(
+        title=title,
+        description=re_first(META_DESC_RE, raw),
+        canonical=re_first(CANONICAL_RE, raw),
+        breadcrumb_category=(m.group(1), m.group(2)) if m else None,
+        h1=re_first(H1_TEXT_RE, raw) if not html_text(title or "") else None,
+    )
+
+
+def time_per_page(fn: Callable[[str], Optional[HeadFields]], pages: list[str], repeat: int) -> list[float]:
+    # Best-of-N per page, in microseconds, to keep scheduler noise out. Pages are read up front.
+    out: list[float] = []
+    for raw in pages:
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn(raw)
+            best = min(best, time.perf_counter() - t0)
+        out.append(best * 1e6)
+    return out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark calculator page parsing (old vs anchored breadcrumbs).")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repeats per page. Default: 5")
+    parser.add_argument("--links", type=int, default=2000, help="Links in the no-</nav> page. Default: 2000")
+    args = parser.parse_args()
+
+    paths = get_paths(Path(__file__).resolve().parent.parent)
+    category_name_map = build_category_name_map(paths.categories_dir)
+    files = scan_calculator_index_files(paths.calculators_dir)
+    if not files:
+        print("No calculator pages found.")
+        return 1
+    pages = [read_text(p) for p in files]
+
+    mismatches = [
+        p
+        for p, raw in zip(files, pages)
+        if record_from_head_fields(legacy_head_fields(raw), p, paths.calculators_dir, category_name_map)
+        != record_from_head_fields(head_fields(raw), p, paths.calculators_dir, category_name_map)
+    ]
+
+    before = time_per_page(legacy_head_fields, pages, args.repeat)
+    after = time_per_page(head_fields, pages, args.repeat)
+
+    print(f"Pages: {len(files)}  (best of {args.repeat} per page)")
+    print(f"{'':<22}{'mean us':>10}{'median us':>12}{'p95 us':>10}{'total ms':>11}")
+    for label, xs in (("whole-page pattern", before), ("anchored at <nav>", after)):
+        p95 = sorted(xs)[int(len(xs) * 0.95) - 1]
+        print(f"{label:<22}{statistics.mean(xs):>10.1f}{statistics.median(xs):>12.1f}{p95:>10.1f}{sum(xs) / 1000:>11.1f}")
+    print(f"Speedup (total): {sum(before) / sum(after):.2f}x")
+
+    # Breadcrumbs without </nav>, followed by --links ordinary links
+    broken = '<nav class="breadcrumbs"><a href="/categories/x/">X</a>\n' + '<p><a href="/x/">x</a></p>\n' * args.links
+    old_ms, new_ms = (time_per_page(fn, [broken], 1)[0] / 1000 for fn in (legacy_head_fields, head_fields))
+    print(f"No </nav>, {args.links} links after it: {old_ms:.1f} ms -> {new_ms:.2f} ms")
+
+    if mismatches:
+        print(f"WARNING: {len(mismatches)} page(s) parse differently, e.g. {mismatches[0]}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Per-record regex micro-benchmark: raw pattern strings through re.search/re.sub
+(the re module cache lookup on every call) vs the compiled calculators_config registry.
+
+Pages are read up front so only regex work is timed. The saving is small
+(about 4 us per record on the reference machine, 421 pages: roughly 2 ms per
+build) and of the same order as run-to-run noise on a shared CPU, so use a
+high --repeat before reading anything into one result.
+
+Run from anywhere:
+    python tools/bench_regex.py [--repeat 20]
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import time
+from pathlib import Path
+from typing import Callable, Pattern
+
+from calculators_config import (
+    BREADCRUMBS_CATEGORY_LINK_RE,
+    CANONICAL_RE,
+    CATEGORY_GRID_CLOSE,
+    META_DESC_RE,
+    NON_ALNUM_RE,
+    TAG_RE,
+    TITLE_TAG_RE,
+    WHITESPACE_RE,
+    get_paths,
+)
+from utils import read_text, scan_calculator_index_files
+
+_STOP_WORDS = {"and", "or", "the", "a", "an", "of", "to"}
+
+
+def _per_record_strings(raw: str) -> int:
+    # What the build did per record before: every call passes a pattern string plus flags.
+    def first(p: Pattern[str]):
+        return re.search(p.pattern, raw, p.flags)
+
+    def text(s: str) -> str:
+        return re.sub(WHITESPACE_RE.pattern, " ", re.sub(TAG_RE.pattern, "", s)).strip()
+
+    hits = 0
+    for p in (TITLE_TAG_RE, META_DESC_RE, CANONICAL_RE, BREADCRUMBS_CATEGORY_LINK_RE):
+        m = first(p)
+        if m:
+            hits += len(text(m.group(1)))
+    title = text((first(TITLE_TAG_RE) or [""] * 2)[1]).lower()
+    clean = re.sub(WHITESPACE_RE.pattern, " ", re.sub(NON_ALNUM_RE.pattern, " ", title)).strip()
+    hits += len([w for w in re.split(WHITESPACE_RE.pattern, clean) if w and w not in _STOP_WORDS])
+    hits += len(re.findall(CATEGORY_GRID_CLOSE.pattern, raw, CATEGORY_GRID_CLOSE.flags))
+    return hits
+
+
+def _per_record_compiled(raw: str) -> int:
+    # Same work through the compiled registry.
+    def text(s: str) -> str:
+        return WHITESPACE_RE.sub(" ", TAG_RE.sub("", s)).strip()
+
+    hits = 0
+    for p in (TITLE_TAG_RE, META_DESC_RE, CANONICAL_RE, BREADCRUMBS_CATEGORY_LINK_RE):
+        m = p.search(raw)
+        if m:
+            hits += len(text(m.group(1)))
+    title = text((TITLE_TAG_RE.search(raw) or [""] * 2)[1]).lower()
+    clean = WHITESPACE_RE.sub(" ", NON_ALNUM_RE.sub(" ", title)).strip()
+    hits += len([w for w in WHITESPACE_RE.split(clean) if w and w not in _STOP_WORDS])
+    hits += len(CATEGORY_GRID_CLOSE.findall(raw))
+    return hits
+
+
+def best_totals(fns: list[Callable[[str], int]], pages: list[str], repeat: int) -> list[float]:
+    # Best-of-N over the whole set per function, in seconds. The functions take
+    # turns within each repeat, so drift on a busy machine hits both alike.
+    best = [float("inf")] * len(fns)
+    for _ in range(repeat):
+        for k, fn in enumerate(fns):
+            t0 = time.perf_counter()
+            for raw in pages:
+                fn(raw)
+            best[k] = min(best[k], time.perf_counter() - t0)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark string vs precompiled regex patterns per record.")
+    parser.add_argument("--repeat", type=int, default=20, help="Timing repeats over the full set. Default: 20")
+    args = parser.parse_args()
+
+    paths = get_paths(Path(__file__).resolve().parent.parent)
+    pages = [read_text(p) for p in scan_calculator_index_files(paths.calculators_dir)]
+    if not pages:
+        print("No calculator pages found.")
+        return 1
+
+    if [_per_record_strings(r) for r in pages] != [_per_record_compiled(r) for r in pages]:
+        print("WARNING: string and compiled patterns disagree")
+        return 1
+
+    before, after = best_totals([_per_record_strings, _per_record_compiled], pages, args.repeat)
+    n = len(pages)
+
+    print(f"Records: {n}  (best of {args.repeat})")
+    print(f"{'':<22}{'per record us':>15}{'total ms':>11}")
+    for label, t in (("pattern strings", before), ("compiled registry", after)):
+        print(f"{label:<22}{t / n * 1e6:>15.2f}{t * 1000:>11.1f}")
+    print(f"Saved per record: {(before - after) / n * 1e6:.2f} us")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Region locator benchmark on synthetic large category pages: the grid splicer
+and ad-block scan the build used before html_regions vs the current ones.
+
+Pages are built from a real category page with its grid padded to --tiles
+calculator tiles (every tenth tile carries an inline <script> with a "</div>"
+string in it, which the ad-block scan must not take for a tag).
+
+Run from anywhere:
+    python tools/bench_regions.py [--tiles 1000 5000] [--repeat 5]
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import time
+from pathlib import Path
+from typing import Callable
+
+from calculators_config import ADBLOCK_CLASS_RE, CATEGORY_GRID_OPEN, get_paths
+from fill_affiliates import find_ad_block_spans
+from html_regions import find_category_grid
+from utils import read_text, replace_category_grid, scan_category_index_files
+
+_DIV_TAG_RE = re.compile(r"</?div\b[^>]*>", re.IGNORECASE)
+
+
+def legacy_replace_category_grid(category_index_html: str, new_inner_html: str) -> str:
+    # utils.replace_category_grid as the build called it before html_regions:
+    # lowercases the page for </main> and lists every </div> up to it.
+    open_match = CATEGORY_GRID_OPEN.search(category_index_html)
+    open_end = open_match.end()
+    main_close = category_index_html.lower().find("</main>", open_end)
+    between = category_index_html[open_end:main_close]
+    closes = list(re.finditer(r"(?is)</div\s*>", between))
+    grid_close_abs = open_end + closes[-2].start()
+    before = category_index_html[:open_end]
+    after = category_index_html[grid_close_abs:]
+    inner = "\n" + new_inner_html.rstrip() + "\n        "
+    return before + inner + after
+
+
+def legacy_find_ad_block_spans(html: str, max_blocks: int = 4) -> list[tuple[int, int, int, int]]:
+    spans = []
+    stack = []
+    current = None
+    for m in _DIV_TAG_RE.finditer(html):
+        tag = m.group(0)
+        if not tag.startswith("</"):
+            stack.append(m.start())
+            if current is None and len(spans) < max_blocks and ADBLOCK_CLASS_RE.search(tag):
+                current = (m.start(), m.end(), len(stack))
+        else:
+            if stack:
+                stack.pop()
+            if current is not None and len(stack) == current[2] - 1:
+                spans.append((current[0], current[1], m.start(), m.end()))
+                current = None
+                if len(spans) >= max_blocks:
+                    break
+    return spans
+
+
+def make_tile(i: int) -> str:
+    script = f'            <script>window.t{i}="</div>";</script>\n' if i % 10 == 0 else ""
+    return (
+        '          <div class="category-item">\n'
+        f'            <a href="/calculators/bench/calc-{i}/">\n'
+        f'              <div class="category-item-title">Calculator {i} | SnapCalc</div>\n'
+        f'              <p class="category-item-desc">Open Calculator {i} | SnapCalc.</p>\n'
+        "            </a>\n"
+        f"{script}"
+        "          </div>\n"
+    )
+
+
+def make_page(template: str, tiles: int) -> str:
+    # The template's grid padded to `tiles` tiles, with an ad-block just before it.
+    # (After the grid, the ad-block's </div> tags would move the second-last </div> before </main>.)
+    grid = find_category_grid(template)
+    ads = '<div class="ad-block"><div class="ad-placeholder">Ad</div></div>\n        '
+    inner = "\n" + "".join(make_tile(i) for i in range(tiles)) + "        "
+    return template[: grid.open_start] + ads + template[grid.open_start : grid.open_end] + inner + template[grid.close_start :]
+
+
+def best_of(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the category grid / ad-block region locators.")
+    parser.add_argument("--tiles", type=int, nargs="+", default=[1000, 5000], help="Grid sizes. Default: 1000 5000")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repeats per case. Default: 5")
+    args = parser.parse_args()
+
+    paths = get_paths(Path(__file__).resolve().parent.parent)
+    category_pages = scan_category_index_files(paths.categories_dir)
+    if not category_pages:
+        print("No category pages found.")
+        return 1
+    template = read_text(category_pages[0])
+    tiles_html = "".join(make_tile(i) for i in range(10))
+
+    print(f"Template: {category_pages[0].relative_to(paths.repo_root).as_posix()}  (best of {args.repeat})")
+    print(f"{'tiles':>7}{'page KB':>9}  {'case':<22}{'legacy ms':>11}{'regions ms':>12}{'speedup':>9}")
+    for n in args.tiles:
+        page = make_page(template, n)
+        if legacy_replace_category_grid(page, tiles_html) != replace_category_grid(page, tiles_html):
+            print("WARNING: grid splicers disagree")
+            return 1
+        if legacy_find_ad_block_spans(page) != find_ad_block_spans(page):
+            print("WARNING: ad-block scans disagree")
+            return 1
+
+        cases = (
+            ("grid splice", lambda: legacy_replace_category_grid(page, tiles_html), lambda: replace_category_grid(page, tiles_html)),
+            ("ad-block spans", lambda: legacy_find_ad_block_spans(page), lambda: find_ad_block_spans(page)),
+        )
+        for label, old, new in cases:
+            before = best_of(old, args.repeat)
+            after = best_of(new, args.repeat)
+            print(
+                f"{n:>7}{len(page) / 1024:>9.0f}  {label:<22}{before * 1000:>11.2f}{after * 1000:>12.2f}"
+                f"{before / after:>8.1f}x"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
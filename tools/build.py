@@ -1,16 +1,31 @@
 from __future__ import annotations
 
-import sys
+import argparse
 from pathlib import Path
 
-from calculators_config import get_paths
+from artifacts import format_size_report, write_deploy_artifact
+from backup_store import begin_run
+from calc_scripts import build_calc_scripts, format_duplicates
+from build_manifest import BuildManifest, scan_incremental
+from calculators_config import Paths, get_paths
+from dist import build_dist
+from fingerprint import fingerprint_assets
+from html_lint import format_report as format_lint_report, lint_site
+from images import optimize_images
+from instrument import Instrument, Profiler, cpu_note, default_profile_path
+from link_check import check_links, format_report
+from output_stage import OutputStage, begin_output
+from search_shards import MANIFEST_NAME, write_search_shards
+from sitemap import write_sitemap
 from utils import (
     build_category_name_map,
-    parse_calculator_page,
+    record_aliases,
     rewrite_category_pages,
     scan_calculator_index_files,
+    sort_records,
     write_search_index_json,
 )
+from watch import WatchSession, format_rebuild, serve, watch_loop
 
 
 def repo_root_from_tools_dir() -> Path:
@@ -18,7 +33,338 @@ def repo_root_from_tools_dir() -> Path:
     return Path(__file__).resolve().parent.parent
 
 
+def run_build(args: argparse.Namespace, repo_root: Path, paths: Paths, inst: Instrument, out: OutputStage) -> int:
+    # Pages rewritten by the script, fingerprint and category stages go to one backup run
+    backup = None if args.no_backup else begin_run("build", repo_root)
+    # Each writing stage stages its files in `out` and publishes them when it is done,
+    # so the next stage reads them; a failing stage publishes nothing.
+
+    # 0) Opt-in: minified calculator scripts (and the shared runtime) before fingerprinting,
+    # which then hashes scripts/calc-runtime.js like any other script.
+    calc_scripts = None
+    if args.minify_scripts:
+        with inst.stage("calc_scripts") as st:
+            calc_scripts = build_calc_scripts(
+                paths, shared_runtime=args.shared_runtime, jobs=args.jobs, backup=backup, out=out
+            )
+            out.commit()
+            st.files = calc_scripts.minified
+
+    # 0b) Opt-in: hashed copies of styles/ and scripts/, and every page pointed at them.
+    # First, so the manifest and the sitemap hash pages as they will be served.
+    fingerprint = None
+    if args.fingerprint:
+        with inst.stage("fingerprint") as st:
+            fingerprint = fingerprint_assets(paths, jobs=args.jobs, backup=backup, out=out)
+            out.commit()
+            st.files = fingerprint.copies_written + len(fingerprint.pages)
+
+    with inst.stage("scan") as st:
+        # Build category name map from existing category pages (authoritative display names)
+        category_name_map = build_category_name_map(paths.categories_dir)
+
+        # Scan calculator pages
+        calc_files = scan_calculator_index_files(paths.calculators_dir)
+        st.files = len(calc_files)
+    if not calc_files:
+        print("No calculator index.html files found under /calculators/<category>/<calc>/index.html")
+        if backup is not None:
+            backup.close()
+        return 0
+
+    with inst.stage("parse") as st:
+        # Every build refreshes the manifest; only --incremental trusts the previous one.
+        previous = BuildManifest.load(paths.build_manifest_path) if args.incremental else BuildManifest()
+        scan = scan_incremental(
+            calc_files,
+            repo_root,
+            paths.calculators_dir,
+            category_name_map,
+            previous,
+            jobs=args.jobs,
+        )
+        st.files = scan.reparsed
+        skipped = scan.skipped
+
+        records = sort_records(scan.records)
+
+    full = not args.incremental or scan.cold
+    index_stale = (
+        full
+        or bool(scan.changed_categories)
+        or not paths.search_index_path.exists()
+        or not (paths.search_shards_dir / MANIFEST_NAME).exists()
+    )
+
+    # 1) Rebuild search-index.json (full rewrite) and the sharded index search.js loads.
+    # Aliases are computed once for both.
+    shard_files = 0
+    if index_stale:
+        with inst.stage("aliases"):
+            aliases = record_aliases(records)
+        with inst.stage("index_write") as st:
+            write_search_index_json(paths.search_index_path, records, aliases, out=out)
+            shard_files = write_search_shards(paths.search_shards_dir, records, aliases, out=out)
+            out.commit()
+            st.files = 1 + shard_files
+
+    # 2) Rebuild category pages grid (partial rewrite); old pages go to the backup store
+    with inst.stage("category_rewrite") as st:
+        try:
+            touched = rewrite_category_pages(
+                paths.categories_dir,
+                records,
+                only=None if full else scan.changed_categories,
+                jobs=args.jobs,
+                backup=backup,
+                out=out,
+            )
+            out.commit()
+        finally:
+            if backup is not None and not backup.close():
+                backup = None
+        st.files = len(touched)
+
+    # 3) Sitemap of every page on disk, dated from git history.
+    # Runs after the category rewrite so a rewritten category page counts as uncommitted.
+    sitemap = None
+    if not args.no_sitemap:
+        with inst.stage("sitemap") as st:
+            sitemap = write_sitemap(paths, force_index=args.sitemap_index, out=out)
+            out.commit()
+            st.files = sitemap.written
+
+    # 4) Image dimensions and responsive variants (fill_affiliates.py reads the manifest)
+    images = None
+    if not args.no_images:
+        with inst.stage("images") as st:
+            images = optimize_images(paths, out=out)
+            out.commit()
+            st.files = images.written + 1
+
+    # 5) Minified search index for the client, and transfer sizes (rewritten only when it changes)
+    with inst.stage("artifacts") as st:
+        artifacts = [write_deploy_artifact(paths.search_index_path, out=out)]
+        sitemap_files = sitemap.files if sitemap else [paths.sitemap_path]
+        for p in sitemap_files:
+            if p.exists():
+                artifacts.append(write_deploy_artifact(p, minify=False, out=out))
+        out.commit()
+
+        scan.manifest.save(paths.build_manifest_path)
+        st.files = sum(a.written for a in artifacts) + 1
+
+    # 6) Structure of every page this build left on disk (only changed pages are re-checked)
+    lint = None
+    if not args.no_lint:
+        with inst.stage("lint") as st:
+            lint = lint_site(paths, jobs=args.jobs)
+            st.files = lint.linted
+
+    # 7) Internal links and canonicals against what this build left on disk (read-only)
+    links = None
+    if args.check_links:
+        with inst.stage("links") as st:
+            links = check_links(paths, jobs=args.jobs)
+            st.files = links.extracted
+
+    # 8) The deployable tree, from what this build published; left as it was on lint regressions
+    dist = None
+    if args.dist and not (lint and lint.regression_count):
+        with inst.stage("dist") as st:
+            dist = build_dist(paths, clean=args.clean_dist)
+            st.files = dist.linked + dist.copied
+
+    print("Build complete.")
+    print(f"- Calculators parsed: {len(records)} (skipped: {skipped})")
+    if args.incremental:
+        print(f"- Incremental: {scan.reparsed} re-parsed, {scan.reused} cached, {scan.removed} removed")
+    if index_stale:
+        print(f"- Search index written: {paths.search_index_path}")
+        print(f"- Search shards written: {shard_files} file(s) in {paths.search_shards_dir}")
+    else:
+        print("- Search index unchanged")
+    if calc_scripts:
+        print(
+            f"- Calculator scripts: {calc_scripts.scripts} ({calc_scripts.minified} re-minified, "
+            f"{calc_scripts.written} file(s) written), {calc_scripts.raw_bytes / 1024:.1f} KB -> "
+            f"{calc_scripts.min_bytes / 1024:.1f} KB"
+            + (f" + {calc_scripts.runtime_bytes / 1024:.1f} KB shared runtime" if calc_scripts.runtime_bytes else "")
+            + f"; {len(calc_scripts.pages)} page(s) re-pointed"
+        )
+        for p in calc_scripts.failed:
+            print(f"  WARNING: cannot minify {p.relative_to(repo_root).as_posix()}; the page loads it as written")
+        if calc_scripts.duplicates:
+            shared = sum(1 for d in calc_scripts.duplicates if d.shared)
+            print(
+                f"- Duplicated helpers: {len(calc_scripts.duplicates)} ({shared} shared), "
+                f"{calc_scripts.duplicated_bytes / 1024:.1f} KB duplicated across scripts"
+            )
+            for line in format_duplicates(calc_scripts):
+                print(line)
+    if fingerprint:
+        print(
+            f"- Fingerprinted assets: {fingerprint.assets} ({fingerprint.copies_written} copy(ies) written, "
+            f"{fingerprint.copies_removed} removed); {len(fingerprint.pages)} of {fingerprint.pages_scanned} "
+            "page(s) re-pointed"
+        )
+    print(f"- Category pages updated: {len(touched)}")
+    if backup is not None:
+        print(f"- Backup run: {backup.run_id}")
+    if sitemap:
+        layout = f"index + {len(sitemap.files) - 1} child sitemap(s)" if sitemap.split else "single file"
+        print(
+            f"- Sitemap: {sitemap.urls} URL(s), {layout}, {sitemap.lastmod_bumped} lastmod(s) bumped, "
+            f"{sitemap.written} file(s) written"
+        )
+    if images:
+        formats = ", ".join(images.formats) if images.formats else "dimensions only (Pillow not installed)"
+        print(
+            f"- Images: {images.images} ({formats}), {images.processed} processed, {images.reused} unchanged, "
+            f"{images.written} variant(s) written, {images.removed} removed"
+        )
+    print(f"- Deploy artifacts: {sum(a.written for a in artifacts)} file(s) written")
+    for line in format_size_report(artifacts, repo_root):
+        print(line)
+    print(f"- Output: {out.totals.summary()}")
+    if lint:
+        for line in format_lint_report(lint, limit=10):
+            print(line)
+    if links:
+        for line in format_report(links, limit=10):
+            print(line)
+    if dist:
+        print(f"- Dist: {dist.summary()}")
+        print(f"  Manifest: {paths.dist_manifest_path}")
+
+    if lint and lint.regression_count:
+        print(
+            f"ERROR: {lint.regression_count} new structural issue(s) (see above). Fix them, or run "
+            "tools/html_lint.py --update-baseline if they are intended."
+            + (" dist/ was not updated." if args.dist else "")
+        )
+        return 1
+    return 0
+
+
 def main() -> int:
+    parser = argparse.ArgumentParser(description="Rebuild the search index, category grids and sitemap for SnapCalc.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only re-parse pages changed since the last build and only rewrite affected outputs.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes for page parsing and category rewrites (0 = one per CPU). Default: 1",
+    )
+    parser.add_argument(
+        "--no-sitemap",
+        action="store_true",
+        help="Skip the sitemap stage (sitemap.xml and its compressed variants are left as they are).",
+    )
+    parser.add_argument(
+        "--sitemap-index",
+        action="store_true",
+        help="Always write sitemap.xml as an index of per-category sitemaps, even below the size limits.",
+    )
+    parser.add_argument(
+        "--minify-scripts",
+        action="store_true",
+        help="Minify each calculator script.js to script.min.js and point its page at it. "
+        "Rewrites the pages in place: commit them with the script.min.js files.",
+    )
+    parser.add_argument(
+        "--shared-runtime",
+        action="store_true",
+        help="With --minify-scripts: move helpers duplicated across calculator scripts into "
+        "scripts/calc-runtime.js, loaded once and cached by every page.",
+    )
+    parser.add_argument(
+        "--fingerprint",
+        action="store_true",
+        help="Write content-hashed copies of styles/ and scripts/ and point every page at them. "
+        "Rewrites the pages in place: commit them with the copies and tools/asset-manifest.json.",
+    )
+    parser.add_argument(
+        "--no-images",
+        action="store_true",
+        help="Skip the images stage (tools/image-manifest.json and assets/optimized/ are left as they are).",
+    )
+    parser.add_argument(
+        "--no-lint",
+        action="store_true",
+        help="Skip the structural lint (tag balance, grid containment, duplicate ids) that fails the build "
+        "on issues missing from tools/html-lint-baseline.json.",
+    )
+    parser.add_argument(
+        "--check-links",
+        action="store_true",
+        help="After the build, report broken internal links, redirecting links, orphan calculators "
+        "and canonical mismatches (tools/link_check.py; the build does not fail on them).",
+    )
+    parser.add_argument(
+        "--dist",
+        action="store_true",
+        help="After the build, update dist/ with only the published files (hard links; tools/, backups "
+        "and *.bak stay out) and write dist-manifest.json. npm run build (Vercel's build) passes this and "
+        "Vercel publishes dist/; from a local checkout run vercel deploy at the repo root.",
+    )
+    parser.add_argument(
+        "--clean-dist",
+        action="store_true",
+        help="With --dist: rebuild dist/ from scratch instead of updating it.",
+    )
+    parser.add_argument(
+        "--no-backup",
+        action="store_true",
+        help="Do not save category pages to the backup store (tools/.backup) before rewriting them.",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After the build, keep watching calculators/ and categories/ and rebuild only what each save affects.",
+    )
+    parser.add_argument(
+        "--serve",
+        type=int,
+        nargs="?",
+        const=8000,
+        default=None,
+        metavar="PORT",
+        help="With --watch: preview the site at http://127.0.0.1:PORT/ (default 8000).",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=0.25,
+        help="--watch: seconds between file checks. Default: 0.25",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.15,
+        help="--watch: quiet seconds after the last change before rebuilding. Default: 0.15",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="PATH",
+        help="Write a cProfile dump (default tools/.cache/profile/build-<UTC time>.pstats) "
+        "and list the slowest pages.",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=20,
+        help="Functions and pages listed by --profile. Default: 20",
+    )
+    args = parser.parse_args()
+
     repo_root = repo_root_from_tools_dir()
     paths = get_paths(repo_root)
 
@@ -30,39 +376,84 @@ def main() -> int:
         print(f"ERROR: categories folder not found at: {paths.categories_dir}")
         return 1
 
-    # Build category name map from existing category pages (authoritative display names)
-    category_name_map = build_category_name_map(paths.categories_dir)
+    if args.serve is not None and not args.watch:
+        print("ERROR: --serve needs --watch")
+        return 2
+    if args.clean_dist and not args.dist:
+        print("ERROR: --clean-dist needs --dist")
+        return 2
+    if args.shared_runtime and not args.minify_scripts:
+        print("ERROR: --shared-runtime needs --minify-scripts")
+        return 2
+    if args.watch and args.profile is not None:
+        print("ERROR: Use either --watch or --profile, not both.")
+        return 2
 
-    # Scan calculator pages
-    calc_files = scan_calculator_index_files(paths.calculators_dir)
-    if not calc_files:
-        print("No calculator index.html files found under /calculators/<category>/<calc>/index.html")
-        return 0
+    inst = Instrument()
+    profiler = None
+    if args.profile is not None:
+        profiler = Profiler(
+            Path(args.profile) if args.profile else default_profile_path(repo_root, "build"),
+            repo_root,
+            top=args.profile_top,
+        )
+        profiler.start()
+    out = begin_output("build", repo_root)
+    try:
+        rc = run_build(args, repo_root, paths, inst, out)
+    finally:
+        out.close()
+        profile_lines = profiler.stop() if profiler else []
 
-    records = []
-    skipped = 0
-    for p in calc_files:
-        rec = parse_calculator_page(p, paths.calculators_dir, category_name_map)
-        if rec is None:
-            skipped += 1
-            continue
-        records.append(rec)
+    print("Stages:")
+    for line in inst.report_lines():
+        print(line)
+    if profiler:
+        note = cpu_note(args.jobs)
+        if note:
+            print(note)
+        for line in profile_lines:
+            print(line)
+    if rc != 0 or not args.watch:
+        return rc
+    return run_watch(args, repo_root, paths)
 
-    # Stable ordering for outputs
-    records = sorted(records, key=lambda r: (r.category_slug.lower(), r.title.lower()))
 
-    # 1) Rebuild search-index.json (full rewrite)
-    write_search_index_json(paths.search_index_path, records)
+def run_watch(args: argparse.Namespace, repo_root: Path, paths: Paths) -> int:
+    backup = None if args.no_backup else begin_run("watch", repo_root)
+    session = WatchSession(repo_root, paths, backup=backup)
+    session.start()
+    server = None
+    if args.serve is not None:
+        try:
+            server = serve(repo_root, args.serve)
+        except OSError as e:
+            print(f"ERROR: cannot serve on port {args.serve}: {e}")
+            return 2
+        print(f"Serving {repo_root} at http://127.0.0.1:{args.serve}/")
+    print(f"Watching {len(session.snapshot)} page(s) in calculators/ and categories/ (Ctrl+C to stop)")
 
-    # 2) Rebuild category pages grid (partial rewrite)
-    touched = rewrite_category_pages(paths.categories_dir, records)
-
-    # Sitemap intentionally paused
-    print("Build complete.")
-    print(f"- Calculators parsed: {len(records)} (skipped: {skipped})")
-    print(f"- Search index written: {paths.search_index_path}")
-    print(f"- Category pages updated: {len(touched)}")
+    def on_error(e: Exception) -> None:
+        print(f"ERROR: rebuild failed: {e}")
 
+    try:
+        watch_loop(
+            session,
+            args.poll_interval,
+            args.debounce,
+            on_rebuild=lambda result: print(format_rebuild(result, repo_root)),
+            on_error=on_error,
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.shutdown()
+        # The next --incremental build starts from what watch mode last saw
+        session.save_manifest()
+        if backup is not None and backup.close():
+            print(f"Backup run: {backup.run_id}")
+    print("Stopped. Sitemap and compressed artifacts are refreshed by the next build.")
     return 0
 
 
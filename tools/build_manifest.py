@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import chain
+from pathlib import Path
+from typing import Optional
+
+from artifacts import write_chunks_if_changed
+from json_stream import iter_ndjson
+from parallel import parallel_map
+from utils import CalculatorRecord, parse_calculator_html
+
+# Bump when the manifest layout or the parser output changes, so stale caches are ignored.
+MANIFEST_VERSION = 2
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    mtime_ns: int
+    size: int
+    sha256: str
+    # Cached CalculatorRecord fields (minus source_path), or None if the page was skipped
+    record: Optional[dict]
+
+
+@dataclass
+class BuildManifest:
+    category_map_sha256: str = ""
+    entries: dict[str, ManifestEntry] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path) -> "BuildManifest":
+        """
+        Read a manifest saved by save(): NDJSON, a header line then one line per
+        page, read line by line so memory grows with the entries kept, not the
+        file. A missing, unreadable or outdated manifest just means a full build.
+        """
+        entries: dict[str, ManifestEntry] = {}
+        try:
+            with path.open(encoding="utf-8") as f:
+                header = json.loads(f.readline() or "null")
+                if not isinstance(header, dict) or header.get("version") != MANIFEST_VERSION:
+                    return cls()
+                for line in f:
+                    try:
+                        e = json.loads(line)
+                        entries[e["path"]] = ManifestEntry(
+                            mtime_ns=int(e["mtime_ns"]),
+                            size=int(e["size"]),
+                            sha256=str(e["sha256"]),
+                            record=e.get("record"),
+                        )
+                    except (KeyError, TypeError, ValueError):
+                        continue
+        except (OSError, ValueError):
+            return cls()
+        return cls(category_map_sha256=str(header.get("category_map_sha256", "")), entries=entries)
+
+    def save(self, path: Path) -> None:
+        # Streamed: one line per entry is encoded and written at a time. Fields are
+        # listed by hand: asdict() deep-copies every cached record first.
+        header = {"version": MANIFEST_VERSION, "category_map_sha256": self.category_map_sha256}
+        lines = (
+            {"path": rel, "mtime_ns": e.mtime_ns, "size": e.size, "sha256": e.sha256, "record": e.record}
+            for rel, e in sorted(self.entries.items())
+        )
+        write_chunks_if_changed(path, iter_ndjson(chain([header], lines)))
+
+
+@dataclass
+class IncrementalScan:
+    records: list[CalculatorRecord]
+    skipped: int
+    manifest: BuildManifest
+    reused: int = 0
+    reparsed: int = 0
+    removed: int = 0
+    # Category slugs whose record set differs from the previous manifest
+    changed_categories: set[str] = field(default_factory=set)
+    # True when there was no usable previous manifest (everything counts as changed)
+    cold: bool = False
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def category_map_sha256(category_name_map: dict[str, str]) -> str:
+    blob = json.dumps(category_name_map, ensure_ascii=False, sort_keys=True)
+    return sha256_bytes(blob.encode("utf-8"))
+
+
+def manifest_key(path: Path, repo_root: Path) -> str:
+    return path.relative_to(repo_root).as_posix()
+
+
+def record_to_dict(r: CalculatorRecord) -> dict:
+    return {
+        "title": r.title,
+        "url": r.url,
+        "category_slug": r.category_slug,
+        "category_name": r.category_name,
+        "description": r.description,
+        "calculator_slug": r.calculator_slug,
+    }
+
+
+def record_from_dict(d: dict, source_path: Path) -> CalculatorRecord:
+    return CalculatorRecord(
+        title=d["title"],
+        url=d["url"],
+        category_slug=d["category_slug"],
+        category_name=d["category_name"],
+        description=d["description"],
+        calculator_slug=d["calculator_slug"],
+        source_path=source_path,
+    )
+
+
+def load_entry(
+    p: Path,
+    prev: Optional[ManifestEntry],
+    calculators_dir: Path,
+    category_name_map: dict[str, str],
+) -> tuple[ManifestEntry, bool]:
+    # Hash one page and parse it unless the hash matches the previous entry.
+    # Returns (entry, reparsed).
+    st = p.stat()
+    data = p.read_bytes()
+    digest = sha256_bytes(data)
+    if prev is not None and prev.sha256 == digest:
+        return ManifestEntry(st.st_mtime_ns, st.st_size, digest, prev.record), False
+
+    # Decode exactly like utils.read_text (universal newlines included)
+    raw = data.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+    rec = parse_calculator_html(raw, p, calculators_dir, category_name_map)
+    record = record_to_dict(rec) if rec is not None else None
+    return ManifestEntry(st.st_mtime_ns, st.st_size, digest, record), True
+
+
+def _load_entry(
+    task: tuple[Path, Optional[ManifestEntry]],
+    calculators_dir: Path,
+    category_name_map: dict[str, str],
+) -> tuple[ManifestEntry, bool]:
+    # Worker: load_entry for one (path, previous entry) task.
+    p, prev = task
+    return load_entry(p, prev, calculators_dir, category_name_map)
+
+
+def _records_by_category(entries: dict[str, ManifestEntry]) -> dict[str, list[dict]]:
+    out: dict[str, list[dict]] = {}
+    for rel in sorted(entries):
+        rec = entries[rel].record
+        if rec is not None:
+            out.setdefault(rec["category_slug"], []).append(rec)
+    return out
+
+
+def scan_incremental(
+    calc_files: list[Path],
+    repo_root: Path,
+    calculators_dir: Path,
+    category_name_map: dict[str, str],
+    previous: BuildManifest,
+    jobs: int = 1,
+) -> IncrementalScan:
+    """
+    Parse calculator pages, reusing cached records for pages whose content did not change.
+
+    A page is reused without being read when mtime and size match the manifest.
+    Otherwise it is read and hashed; only a differing hash triggers a re-parse.
+    If the category name map changed, every page is re-parsed because the
+    breadcrumb fallback depends on it. Reading, hashing and parsing run on
+    `jobs` worker processes; records come back in calc_files order.
+    """
+    map_sha = category_map_sha256(category_name_map)
+    cold = not previous.entries
+    prev_entries = previous.entries if previous.category_map_sha256 == map_sha else {}
+
+    manifest = BuildManifest(category_map_sha256=map_sha)
+    scan = IncrementalScan(records=[], skipped=0, manifest=manifest, cold=cold)
+
+    # Cheap stat check in this process; everything else goes to the workers.
+    entries: list[Optional[ManifestEntry]] = []
+    pending: list[tuple[int, Path, Optional[ManifestEntry]]] = []
+    for p in calc_files:
+        st = p.stat()
+        prev = prev_entries.get(manifest_key(p, repo_root))
+        if prev is not None and prev.mtime_ns == st.st_mtime_ns and prev.size == st.st_size:
+            entries.append(prev)
+            scan.reused += 1
+        else:
+            entries.append(None)
+            pending.append((len(entries) - 1, p, prev))
+
+    load = partial(_load_entry, calculators_dir=calculators_dir, category_name_map=category_name_map)
+    results = parallel_map(load, [(p, prev) for _, p, prev in pending], jobs=jobs)
+    for (i, _, _), (entry, reparsed) in zip(pending, results):
+        entries[i] = entry
+        if reparsed:
+            scan.reparsed += 1
+        else:
+            scan.reused += 1
+
+    for p, entry in zip(calc_files, entries):
+        assert entry is not None
+        manifest.entries[manifest_key(p, repo_root)] = entry
+        if entry.record is None:
+            scan.skipped += 1
+        else:
+            scan.records.append(record_from_dict(entry.record, p))
+
+    scan.removed = len(set(previous.entries) - set(manifest.entries))
+
+    old_by_cat = _records_by_category(previous.entries)
+    new_by_cat = _records_by_category(manifest.entries)
+    for slug in set(old_by_cat) | set(new_by_cat):
+        if old_by_cat.get(slug) != new_by_cat.get(slug):
+            scan.changed_categories.add(slug)
+
+    return scan
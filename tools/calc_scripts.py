@@ -0,0 +1,443 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+from artifacts import write_if_changed
+from backup_store import BackupRun
+from build_manifest import sha256_bytes
+from calculators_config import (
+    CALC_SCRIPT_MIN_NAME,
+    CALC_SCRIPT_NAME,
+    CALC_SCRIPT_TAG_RE,
+    SHARED_RUNTIME_GLOBALS,
+    SHARED_RUNTIME_MIN_USES,
+    SHARED_RUNTIME_PAGE_SCRIPTS,
+    Paths,
+)
+from file_discovery import listing
+from jsmin import JSMIN_VERSION, PUNCT, STRING, WORD, JSSyntaxError, Token, join_pieces, tokenize
+from output_stage import OutputStage
+from parallel import parallel_map
+
+# Bump when the cached analysis changes; the minifier version is part of the key as well.
+ANALYSIS_VERSION = 1
+CACHE_VERSION = f"{JSMIN_VERSION}.{ANALYSIS_VERSION}"
+
+# Global the shared runtime defines; wrappers call into it
+RUNTIME_GLOBAL = "__snapcalc"
+
+_KEYWORDS = frozenset(
+    "break case catch class const continue debugger default delete do else export extends false finally "
+    "for function if import in instanceof let new null return super switch throw true try typeof var void "
+    "while with yield async await of static get set".split()
+)
+
+
+@dataclass(frozen=True)
+class Helper:
+    name: str
+    sha256: str  # of its minified declaration
+    start: int  # span of the declaration in the minified script
+    end: int
+    # Names it uses that it does not declare: shareable when all are page globals.
+    # None when it can never move (nested functions, template expressions, ...).
+    free: Optional[tuple[str, ...]]
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start
+
+
+@dataclass(frozen=True)
+class ScriptAnalysis:
+    minified: str
+    helpers: tuple[Helper, ...]
+
+
+@dataclass(frozen=True)
+class DuplicateHelper:
+    name: str  # first name seen; copies may be named differently
+    sha256: str
+    uses: int
+    size: int  # minified bytes per copy
+    shared: bool  # moved to the runtime this build
+
+    @property
+    def duplicated_bytes(self) -> int:
+        return self.size * (self.uses - 1)
+
+
+@dataclass
+class CalcScriptsResult:
+    scripts: int = 0
+    minified: int = 0  # cache misses (re-minified this build)
+    raw_bytes: int = 0
+    min_bytes: int = 0  # script.min.js total, after moving shared helpers out
+    written: int = 0
+    failed: list[Path] = field(default_factory=list)  # could not be tokenized; left unminified
+    duplicates: list[DuplicateHelper] = field(default_factory=list)  # most duplicated bytes first
+    runtime_bytes: int = 0  # 0 without --shared-runtime
+    pages: list[Path] = field(default_factory=list)  # pages whose script tags changed
+
+    @property
+    def duplicated_bytes(self) -> int:
+        return sum(d.duplicated_bytes for d in self.duplicates)
+
+
+def _matching(tokens: list[Token], i: int, open_: str, close: str) -> int:
+    # Index of the token closing the bracket at tokens[i]
+    depth = 0
+    for j in range(i, len(tokens)):
+        t = tokens[j]
+        if t.kind == PUNCT:
+            if t.text == open_:
+                depth += 1
+            elif t.text == close:
+                depth -= 1
+                if depth == 0:
+                    return j
+    raise JSSyntaxError(f"unbalanced {open_!r} at offset {tokens[i].start}")
+
+
+def _is_statement_start(tokens: list[Token], i: int) -> bool:
+    return i == 0 or tokens[i - 1].text in ("{", "}", ";") or tokens[i].newline_before
+
+
+def _function_scope(tokens: list[Token], i: int) -> tuple[Optional[set[str]], int]:
+    """
+    (free names, index of the closing brace) of the function starting at
+    tokens[i] ("function"). Nested function expressions are their own scope;
+    what they use from outside counts as used here.
+
+    None for anything the analysis does not model: arrow functions, default
+    or destructured parameters, template literals with ${...} (not tokenized
+    inside). A name is only declared by var/let/const, catch (...) or a
+    nested function declaration, so anything unusual counts as free.
+    """
+    j = i + 1
+    bound: set[str] = set()
+    if tokens[j].kind == WORD:
+        bound.add(tokens[j].text)  # its own name, for recursion
+        j += 1
+    params_end = _matching(tokens, j, "(", ")")
+    for t in tokens[j + 1 : params_end]:
+        if t.kind == WORD and t.text not in _KEYWORDS:
+            bound.add(t.text)
+        elif t.text != ",":
+            return None, params_end
+    if params_end + 1 >= len(tokens) or tokens[params_end + 1].text != "{":
+        return None, params_end
+    body_end = _matching(tokens, params_end + 1, "{", "}")
+
+    used: set[str] = set()
+    k = params_end + 2
+    while k < body_end:
+        t = tokens[k]
+        prev = tokens[k - 1].text
+        if (t.kind == PUNCT and t.text == "=>") or (t.kind == STRING and t.text[0] == "`" and "${" in t.text):
+            return None, body_end
+        if t.kind == WORD and t.text == "function" and prev not in (".", "?."):
+            inner, inner_end = _function_scope(tokens, k)
+            if inner is None:
+                return None, body_end
+            if tokens[k + 1].kind == WORD and _is_statement_start(tokens, k):
+                bound.add(tokens[k + 1].text)
+            used |= inner
+            k = inner_end + 1
+            continue
+        if t.kind == WORD and t.text not in _KEYWORDS and not t.text[0].isdigit():
+            nxt = tokens[k + 1].text
+            if prev in ("var", "let", "const") or (prev == "(" and tokens[k - 2].text == "catch"):
+                bound.add(t.text)
+            elif prev in (".", "?."):
+                pass  # property
+            elif nxt == ":" and prev in ("{", ","):
+                pass  # object key
+            else:
+                used.add(t.text)
+        k += 1
+    return used - bound, body_end
+
+
+def _free_names(tokens: list[Token]) -> Optional[tuple[str, ...]]:
+    # For a helper: names it uses without declaring; all page globals means it can run
+    # unchanged from the shared runtime
+    free, _ = _function_scope(tokens, 0)
+    return None if free is None else tuple(sorted(free))
+
+
+def top_level_names(src: str) -> set[str]:
+    # Functions and variables a classic script declares at its top level (page globals)
+    names: set[str] = set()
+    depth = 0
+    tokens = tokenize(src)
+    for k, t in enumerate(tokens):
+        if t.kind == PUNCT and t.text in ("{", "(", "["):
+            depth += 1
+        elif t.kind == PUNCT and t.text in ("}", ")", "]"):
+            depth -= 1
+        elif depth == 0 and t.kind == WORD and k > 0 and tokens[k - 1].text in ("function", "var", "let", "const"):
+            names.add(t.text)
+    return names
+
+
+def analyze_script(src: str) -> ScriptAnalysis:
+    """
+    Minify one calculator script and find its helper functions.
+
+    Helpers are the outermost function declarations (nested ones travel with
+    their parent), wherever they sit: in these scripts that is usually inside
+    the DOMContentLoaded callback.
+    """
+    tokens = tokenize(src)
+    pieces = join_pieces(tokens)
+    offsets = [0]
+    for p in pieces:
+        offsets.append(offsets[-1] + len(p))
+    minified = "".join(pieces)
+
+    helpers: list[Helper] = []
+    i = 0
+    n = len(tokens)
+    while i < n:
+        t = tokens[i]
+        if (
+            t.kind == WORD
+            and t.text == "function"
+            and i + 2 < n
+            and tokens[i + 1].kind == WORD
+            and tokens[i + 2].text == "("
+            and _is_statement_start(tokens, i)
+            and not (i > 0 and tokens[i - 1].text == "async")
+        ):
+            params_end = _matching(tokens, i + 2, "(", ")")
+            if params_end + 1 < n and tokens[params_end + 1].text == "{":
+                end = _matching(tokens, params_end + 1, "{", "}")
+                name = tokens[i + 1].text
+                # Spans exclude the separator in front of "function"
+                start = offsets[i] + len(pieces[i]) - len(t.text)
+                stop = offsets[end + 1]
+                helpers.append(
+                    Helper(
+                        name=name,
+                        sha256=sha256_bytes(minified[start:stop].encode("utf-8")),
+                        start=start,
+                        end=stop,
+                        free=_free_names(tokens[i : end + 1]),
+                    )
+                )
+                i = end + 1
+                continue
+        i += 1
+    return ScriptAnalysis(minified, tuple(helpers))
+
+
+def _analysis_to_json(a: ScriptAnalysis) -> dict:
+    return {
+        "version": CACHE_VERSION,
+        "minified": a.minified,
+        "helpers": [[h.name, h.sha256, h.start, h.end, h.free] for h in a.helpers],
+    }
+
+
+def _analysis_from_json(d: dict) -> Optional[ScriptAnalysis]:
+    if d.get("version") != CACHE_VERSION:
+        return None
+    return ScriptAnalysis(
+        d["minified"],
+        tuple(Helper(name, sha, start, end, None if free is None else tuple(free)) for name, sha, start, end, free in d["helpers"]),
+    )
+
+
+def _load_cached(cache_dir: Path, digest: str) -> Optional[ScriptAnalysis]:
+    try:
+        return _analysis_from_json(json.loads((cache_dir / f"{digest}.json").read_text(encoding="utf-8")))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _analyze_file(src: Path) -> Optional[ScriptAnalysis]:
+    # Worker: None when the script cannot be tokenized (it is then shipped as written)
+    try:
+        return analyze_script(src.read_text(encoding="utf-8"))
+    except (JSSyntaxError, UnicodeDecodeError):
+        return None
+
+
+def _page_script_globals(repo_root: Path) -> set[str]:
+    # Globals from the site-wide scripts every calculator page loads before its own
+    names: set[str] = set()
+    for rel in SHARED_RUNTIME_PAGE_SCRIPTS:
+        try:
+            names |= top_level_names((repo_root / rel).read_text(encoding="utf-8"))
+        except (OSError, JSSyntaxError):
+            continue
+    return names
+
+
+def wrapper(h: Helper) -> str:
+    # Same name and hoisting as the declaration it replaces; this and arguments pass through
+    return f"function {h.name}(){{return {RUNTIME_GLOBAL}.h{h.sha256[:10]}.apply(this,arguments)}}"
+
+
+def runtime_source(decls: dict[str, str]) -> str:
+    # decls: helper sha256 -> minified declaration (a named function expression in the object)
+    body = ",".join(f"h{sha[:10]}:{decl}" for sha, decl in sorted(decls.items()))
+    return f"var {RUNTIME_GLOBAL}={{{body}}};\n"
+
+
+def _script_tag_edit(data: bytes, script_name: str, use_runtime: bool, runtime_url: bytes) -> bytes:
+    m = CALC_SCRIPT_TAG_RE.search(data)
+    if not m:
+        return data
+    tag = b"<script" + m["before"] + script_name.encode("ascii") + m["after"] + b"></script>"
+    if use_runtime:
+        # Existing tag kept as is (the fingerprint stage may have hashed its name)
+        runtime = m["runtime"] or (b"<script" + m["before"] + runtime_url + m["after"] + b"></script>\n")
+        tag = runtime + tag
+    return data[: m.start()] + tag + data[m.end() :]
+
+
+def _rewrite_page(
+    task: tuple[Path, str, bool],
+    runtime_url: bytes,
+    out: OutputStage,
+    backup: Optional[BackupRun] = None,
+) -> bool:
+    # Worker: point one calculator page at its script (and the runtime, if it uses it)
+    page, script_name, use_runtime = task
+    data = page.read_bytes()
+    new = _script_tag_edit(data, script_name, use_runtime, runtime_url)
+    if new == data:
+        return False
+    if backup is not None:
+        backup.save(page, data, new)
+    out.write_bytes(page, new)
+    return True
+
+
+def build_calc_scripts(
+    paths: Paths,
+    shared_runtime: bool = False,
+    jobs: int = 1,
+    backup: Optional[BackupRun] = None,
+    *,
+    out: OutputStage,
+) -> CalcScriptsResult:
+    """
+    Calculator scripts stage: minify every calculators/<category>/<calc>/script.js
+    to script.min.js, report helper functions duplicated across scripts, and
+    point each page at the minified file.
+
+    Minified scripts and their helper analysis are cached by source sha256
+    (tools/.cache/calc-scripts), so only edited scripts are re-minified.
+
+    With shared_runtime, duplicated helpers that use no closure variables
+    are written once to scripts/calc-runtime.js; each script keeps a one-line
+    wrapper per helper and its page loads the runtime first. Without it the
+    runtime is removed and pages load script.min.js alone.
+
+    Site files are staged in `out`; the cache is written directly.
+    """
+    result = CalcScriptsResult()
+    cache_dir = paths.calc_scripts_cache_dir
+    sources = listing(paths.calculators_dir).glob(f"*/*/{CALC_SCRIPT_NAME}")
+    result.scripts = len(sources)
+
+    digests: list[str] = []
+    analyses: list[Optional[ScriptAnalysis]] = []
+    for src in sources:
+        data = src.read_bytes()
+        result.raw_bytes += len(data)
+        digests.append(sha256_bytes(data))
+        analyses.append(_load_cached(cache_dir, digests[-1]))
+
+    misses = [k for k, a in enumerate(analyses) if a is None]
+    for k, a in zip(misses, parallel_map(_analyze_file, [sources[k] for k in misses], jobs=jobs)):
+        analyses[k] = a
+        if a is None:
+            result.failed.append(sources[k])
+            continue
+        result.minified += 1
+        write_if_changed(cache_dir / f"{digests[k]}.json", json.dumps(_analysis_to_json(a)).encode("utf-8"))
+
+    # Helpers by declaration hash, across scripts (with the script of the first copy)
+    uses: dict[str, list[Helper]] = {}
+    first_in: dict[str, ScriptAnalysis] = {}
+    for a in analyses:
+        for h in a.helpers if a else ():
+            uses.setdefault(h.sha256, []).append(h)
+            first_in.setdefault(h.sha256, a)
+
+    shared: dict[str, str] = {}
+    if shared_runtime:
+        page_globals = SHARED_RUNTIME_GLOBALS | _page_script_globals(paths.repo_root)
+        for sha, hs in uses.items():
+            h = hs[0]
+            shareable = h.free is not None and all(n in page_globals for n in h.free)
+            if len(hs) >= SHARED_RUNTIME_MIN_USES and shareable and len(wrapper(h)) < h.size:
+                shared[sha] = first_in[sha].minified[h.start : h.end]
+
+    result.duplicates = sorted(
+        (
+            DuplicateHelper(hs[0].name, sha, len(hs), hs[0].size, sha in shared)
+            for sha, hs in uses.items()
+            if len(hs) > 1
+        ),
+        key=lambda d: (-d.duplicated_bytes, d.name),
+    )
+
+    tasks: list[tuple[Path, str, bool]] = []
+    for src, a in zip(sources, analyses):
+        page = src.with_name("index.html")
+        if a is None:
+            # Unminifiable: the page goes back to the source, and no stale minified copy stays around
+            out.remove(src.with_name(CALC_SCRIPT_MIN_NAME))
+            if page.exists():
+                tasks.append((page, CALC_SCRIPT_NAME, False))
+            continue
+        code = a.minified
+        wrapped = False
+        # Right to left, so earlier spans stay valid
+        for h in sorted(a.helpers, key=lambda h: h.start, reverse=True):
+            if h.sha256 in shared:
+                code = code[: h.start] + wrapper(h) + code[h.end :]
+                wrapped = True
+        payload = (code + "\n").encode("utf-8")
+        result.min_bytes += len(payload)
+        result.written += out.write_bytes(src.with_name(CALC_SCRIPT_MIN_NAME), payload)
+        if page.exists():
+            tasks.append((page, CALC_SCRIPT_MIN_NAME, wrapped))
+
+    if shared:
+        runtime = runtime_source(shared).encode("utf-8")
+        result.runtime_bytes = len(runtime)
+        result.written += out.write_bytes(paths.calc_runtime_path, runtime)
+    else:
+        out.remove(paths.calc_runtime_path)
+
+    runtime_url = ("/" + paths.calc_runtime_path.relative_to(paths.repo_root).as_posix()).encode("ascii")
+    changed = parallel_map(partial(_rewrite_page, runtime_url=runtime_url, out=out, backup=backup), tasks, jobs=jobs)
+    result.pages = [task[0] for task, did_change in zip(tasks, changed) if did_change]
+
+    # Cache entries for sources that no longer exist
+    live = {f"{d}.json" for d in digests}
+    for p in cache_dir.glob("*.json"):
+        if p.name not in live:
+            p.unlink()
+    return result
+
+
+def format_duplicates(result: CalcScriptsResult, top: int = 10) -> list[str]:
+    lines = [f"  {'helper':<32} {'uses':>5} {'bytes':>7} {'duplicated':>11}  shared"]
+    for d in result.duplicates[:top]:
+        lines.append(
+            f"  {d.name[:32]:<32} {d.uses:>5} {d.size:>7} {d.duplicated_bytes / 1024:>8.1f} KB  {'yes' if d.shared else '-'}"
+        )
+    if len(result.duplicates) > top:
+        lines.append(f"  ... {len(result.duplicates) - top} more")
+    return lines
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import re
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -10,34 +11,281 @@ class Paths:
     calculators_dir: Path
     categories_dir: Path
     search_index_path: Path
+    search_shards_dir: Path
+    sitemap_path: Path
+    # Per-category child sitemaps, used once sitemap.xml becomes an index
+    sitemaps_dir: Path
+    hubpages_dir: Path
+    assets_dir: Path
+    # Resized/recompressed image variants written by the images stage (served)
+    image_variants_dir: Path
+    # Dimensions, source hash and variants per image (committed; read by the HTML builders)
+    image_manifest_path: Path
+    # Current and previous hashed name per fingerprinted asset (build.py --fingerprint; drives pruning)
+    asset_manifest_path: Path
+    # Helpers shared by several calculator scripts (written with build.py --shared-runtime)
+    calc_runtime_path: Path
+    cache_dir: Path
+    build_manifest_path: Path
+    # Minified calculator scripts and their helper analysis, one file per source sha256
+    calc_scripts_cache_dir: Path
+    # Links and canonical extracted per page, keyed by page sha256 (link_check.py)
+    link_cache_path: Path
+    # Structural issues already known per page (committed; html_lint.py fails only on new ones)
+    lint_baseline_path: Path
+    # Structural issues per page, keyed by page sha256 (html_lint.py)
+    lint_cache_path: Path
+    # Deploy tree assembled by dist.py (build.py --dist) from the DIST_* allowlist
+    dist_dir: Path
+    # sha256 and size per file in dist_dir (kept outside it, so it is not published)
+    dist_manifest_path: Path
 
 
 def get_paths(repo_root: Path) -> Paths:
+    cache_dir = repo_root / "tools" / ".cache"
     return Paths(
         repo_root=repo_root,
         calculators_dir=repo_root / "calculators",
         categories_dir=repo_root / "categories",
         search_index_path=repo_root / "search-index.json",
+        search_shards_dir=repo_root / "search-index",
+        sitemap_path=repo_root / "sitemap.xml",
+        sitemaps_dir=repo_root / "sitemaps",
+        hubpages_dir=repo_root / "hubpages",
+        assets_dir=repo_root / "assets",
+        image_variants_dir=repo_root / "assets" / "optimized",
+        image_manifest_path=repo_root / "tools" / "image-manifest.json",
+        asset_manifest_path=repo_root / "tools" / "asset-manifest.json",
+        calc_runtime_path=repo_root / "scripts" / "calc-runtime.js",
+        cache_dir=cache_dir,
+        build_manifest_path=cache_dir / "build-manifest.ndjson",
+        calc_scripts_cache_dir=cache_dir / "calc-scripts",
+        link_cache_path=cache_dir / "link-check.json",
+        lint_baseline_path=repo_root / "tools" / "html-lint-baseline.json",
+        lint_cache_path=cache_dir / "html-lint.json",
+        dist_dir=repo_root / "dist",
+        dist_manifest_path=repo_root / "dist-manifest.json",
     )
 
 
+# File discovery (file_discovery.py): names skipped by every tool that walks the tree.
+# Glob patterns, matched case-insensitively against a single directory or file name.
+EXCLUDE_DIRS = (
+    ".git",
+    "node_modules",
+    ".venv",
+    "venv",
+    "dist",
+    "build",
+    ".next",
+    ".cache",
+    ".backup",
+    ".journal",
+    # Writes staged by output_stage.py, not yet published
+    ".staging",
+    "__pycache__",
+    # Snapshot trees left by earlier bulk edits (see backup_store.py import-legacy)
+    "_snapcalc_backup_*",
+    "_restore_safety_backup",
+)
+EXCLUDE_FILES = (
+    "*.bak",
+    # Temp files from atomic writes (artifacts.atomic_write_bytes)
+    ".*.tmp",
+    "_snapcalc_*_log_*.json",
+)
+
+
+# Images stage (images.py): variant widths in CSS px, capped at each source's own width.
+# .ad-block img is at most 300px wide, so 300/600/900 cover 1x-3x screens.
+IMAGE_WIDTHS = (300, 600, 900, 1200)
+IMAGE_SOURCE_EXTS = (".jpg", ".jpeg", ".png")
+# Encoder quality per output format (the source format is re-encoded too)
+IMAGE_QUALITY = {"avif": 55, "webp": 78, "jpeg": 82}
+# sizes= for affiliate images in .ad-block slots
+AFFILIATE_IMG_SIZES = "(max-width: 340px) calc(100vw - 40px), 300px"
+
+
+# Asset fingerprinting (fingerprint.py): files served with "immutable" caching (vercel.json)
+# that pages reference. Globs are relative to the repo root.
+FINGERPRINT_GLOBS = ("styles/*.css", "scripts/*.js")
+# Node build script kept in scripts/, never loaded by a page
+FINGERPRINT_SKIP = ("scripts/generate-sitemap.js",)
+# Hex digits of the sha256 in a hashed name (main.css -> main.<hash>.css)
+FINGERPRINT_HASH_LEN = 10
+
+
+# Deploy tree (dist.py): only these are published. Files are taken from the shared
+# listing, so EXCLUDE_DIRS/EXCLUDE_FILES (backups, *.bak, edit logs) never get in.
+# Whole directories, relative to the repo root:
+DIST_DIRS = (
+    "assets",
+    "calculators",
+    "categories",
+    "diagnostic-insights",
+    "hubpages",
+    "scripts",
+    "search-index",
+    "sitemaps",
+    "styles",
+)
+# Files at the repo root (globs). Not vercel.json: Vercel reads it from the project root,
+# and it is not something the site should serve.
+DIST_ROOT_FILES = (
+    "*.html",
+    "ads.txt",
+    "robots.txt",
+    "favicon.ico",
+    "CNAME",
+    "search-index.json",
+    "search-index.min.json",
+    "sitemap.xml",
+)
+# File names never published, even inside DIST_DIRS
+DIST_SKIP_NAMES = (".gitkeep", "*.md", "*.ps1", "generate-sitemap.js")
+
+
+# Calculator scripts (calc_scripts.py): each calculators/<category>/<calc>/script.js is
+# minified to script.min.js, which the page then loads instead.
+CALC_SCRIPT_NAME = "script.js"
+CALC_SCRIPT_MIN_NAME = "script.min.js"
+# --shared-runtime: a helper moves to scripts/calc-runtime.js once this many scripts define it
+SHARED_RUNTIME_MIN_USES = 3
+# Globals a shared helper may use (anything else it references must be a parameter or local)
+SHARED_RUNTIME_GLOBALS = frozenset(
+    "Math Number String Boolean Array Object JSON Date Intl RegExp Error TypeError RangeError "
+    "Symbol Map Set Promise parseFloat parseInt isNaN isFinite Infinity NaN undefined "
+    "encodeURIComponent decodeURIComponent encodeURI decodeURI console window document navigator "
+    "location setTimeout clearTimeout setInterval clearInterval requestAnimationFrame alert "
+    "localStorage sessionStorage URL URLSearchParams this arguments".split()
+)
+# ...plus whatever these site-wide scripts (loaded on every calculator page) declare at top level
+SHARED_RUNTIME_PAGE_SCRIPTS = ("scripts/main.js",)
+
+
+# Sitemap: public origin, and root pages listed as (file, changefreq, priority)
+SITE_URL = "https://snapcalc.site"
+SITEMAP_ROOT_PAGES = (
+    ("index.html", "weekly", "1.0"),
+    ("hubs.html", "monthly", "0.8"),
+    ("about.html", "monthly", "0.5"),
+    ("methodology.html", "monthly", "0.5"),
+    ("accuracy.html", "monthly", "0.5"),
+    ("contact.html", "monthly", "0.4"),
+    ("products.html", "monthly", "0.4"),
+    ("privacy-policy.html", "yearly", "0.3"),
+    ("terms.html", "yearly", "0.3"),
+    ("disclaimer.html", "yearly", "0.3"),
+)
+
+
+# Patterns are compiled once here, with their flags spelled out, and used as-is
+# everywhere (pattern.search(...)), so hot loops never go through re's cache.
+_HTML = re.DOTALL | re.IGNORECASE
+
 # Category page rewrite boundary
-CATEGORY_GRID_OPEN = r'<div\s+class="category-grid"\s*>'
-CATEGORY_GRID_CLOSE = r"</div>"
+CATEGORY_GRID_OPEN = re.compile(r'<div\s+class="category-grid"\s*>', re.IGNORECASE)
+CATEGORY_GRID_CLOSE = re.compile(r"</div\s*>", _HTML)
+MAIN_CLOSE = re.compile(r"</main>", re.IGNORECASE)
 
 # Calculator page parsing
-TITLE_TAG_RE = r"<title>\s*(.*?)\s*</title>"
-META_DESC_RE = r'<meta\s+name="description"\s+content="([^"]*)"\s*/?>'
-CANONICAL_RE = r'<link\s+rel="canonical"\s+href="([^"]+)"\s*/?>'
+TITLE_TAG_RE = re.compile(r"<title>\s*(.*?)\s*</title>", _HTML)
+META_DESC_RE = re.compile(r'<meta\s+name="description"\s+content="([^"]*)"\s*/?>', _HTML)
+CANONICAL_RE = re.compile(r'<link\s+rel="canonical"\s+href="([^"]+)"\s*/?>', _HTML)
+# Title fallback when <title> is empty
+H1_TEXT_RE = re.compile(r"<h1>\s*(.*?)\s*</h1>", _HTML)
 
 # Breadcrumbs category link (preferred authority)
 # Example:
 # <nav class="breadcrumbs"> ... <a href="/categories/business-accounting/">Business &amp; Accounting</a> ...
-BREADCRUMBS_CATEGORY_LINK_RE = (
-    r'<nav\s+class="breadcrumbs"[^>]*>.*?'
-    r'<a\s+href="/categories/([^/]+)/"\s*>(.*?)</a>.*?'
-    r"</nav>"
-)
+# Three anchored searches (nav, then link, then a </nav> after it) instead of one
+# pattern with a DOTALL .*? between each part, which backtracks over the rest of the
+# page for every later </a> when the </nav> is missing.
+BREADCRUMBS_NAV_OPEN_RE = re.compile(r'<nav\s+class="breadcrumbs"[^>]*>', _HTML)
+BREADCRUMBS_CATEGORY_LINK_RE = re.compile(r'<a\s+href="/categories/([^/]+)/"\s*>(.*?)</a>', _HTML)
+NAV_CLOSE_RE = re.compile(r"</nav>", re.IGNORECASE)
 
 # Category page category name (fallback authority)
-CATEGORY_H1_RE = r"<h1>\s*(.*?)\s*</h1>"
+CATEGORY_H1_RE = re.compile(r"<h1>\s*(.*?)\s*</h1>", _HTML)
+
+# Text helpers (utils.normalize_ws / strip_tags / build_aliases)
+WHITESPACE_RE = re.compile(r"\s+")
+TAG_RE = re.compile(r"<[^>]+>")
+NON_ALNUM_RE = re.compile(r"[^a-z0-9\s]+")
+
+# Sharded search index (search_shards): query normalization and shard file names
+SEARCH_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+SEARCH_SHARD_FILE_RE = re.compile(r"^[a-z0-9]+\.[0-9a-f]+\.json$")
+
+# fingerprint: a styles/ or scripts/ file name in a page, hashed already or not. Starts at
+# the literal directory (an attribute-first pattern is ~10x slower over every page);
+# ASSET_REF_ATTR_RE then checks the text just before it is href="/, src="../../ and so on.
+ASSET_REF_RE = re.compile(
+    rb"(?P<dir>styles|scripts)/(?P<stem>[A-Za-z0-9_.-]+?)(?:\.[0-9a-f]{%d})?(?P<ext>\.css|\.js)(?=[\"?#])"
+    % FINGERPRINT_HASH_LEN
+)
+ASSET_REF_ATTR_RE = re.compile(rb'\b(?:href|src)\s*=\s*"(?:/|(?:\.\./)+)?\Z', re.IGNORECASE)
+HASHED_ASSET_NAME_RE = re.compile(r"^(?P<stem>.+)\.[0-9a-f]{%d}(?P<ext>\.[a-z]+)$" % FINGERPRINT_HASH_LEN)
+
+# calc_scripts: a page's own script tag, with the shared-runtime tag in front of it if present
+CALC_SCRIPT_TAG_RE = re.compile(
+    rb'(?P<runtime><script\b[^>]*\bsrc="/scripts/calc-runtime(?:\.[0-9a-f]{%d})?\.js"[^>]*>\s*</script>\s*)?'
+    rb'<script(?P<before>\b[^>]*?\bsrc=")script(?:\.min)?\.js(?P<after>"[^>]*)>\s*</script>' % FINGERPRINT_HASH_LEN
+)
+
+# link_check: tags that can carry a link, in one pass. Comments and raw-text bodies are
+# skipped (a <script> open tag still reports its src); attributes are quote-aware.
+LINK_SCAN_RE = re.compile(
+    r"""<(?:(?P<comment>!--)"""
+    r"""|(?P<raw>script|style|textarea)\b(?P<raw_attrs>[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*)>"""
+    r"""|(?P<tag>a|link|img|iframe|source)\b(?P<attrs>[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*)>)""",
+    re.IGNORECASE,
+)
+LINK_ATTR_RE = re.compile(r"""\b(?:href|src)\s*=\s*(?:"([^"]*)"|'([^']*)')""", re.IGNORECASE)
+REL_CANONICAL_RE = re.compile(r"""\brel\s*=\s*["']?canonical\b""", re.IGNORECASE)
+
+# html_lint: every tag in one pass (comments and raw-text bodies are skipped by the scanner)
+LINT_TAG_RE = re.compile(
+    r"""<(?:(?P<comment>!--)"""
+    r"""|(?P<close>/)?(?P<name>[a-zA-Z][a-zA-Z0-9-]*)(?P<attrs>[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*)>)"""
+)
+LINT_CLASS_RE = re.compile(r"""(?<![\w-])class\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.IGNORECASE)
+LINT_ID_RE = re.compile(r"""(?<![\w-])id\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.IGNORECASE)
+# Elements whose open and close tags must pair up. Void elements and elements
+# with optional end tags (<p>, <li>, <td>, <option>, ...) are not tracked.
+LINT_BALANCED_TAGS = frozenset(
+    "a article aside button div figure footer form h1 h2 h3 h4 h5 h6 header label main nav ol "
+    "picture section select span table ul".split()
+)
+# (class, container, direct child only): a container is ".class" or a tag name.
+# A stray </div> inside the grid ends .page-grid early and orphans the slots after it.
+LINT_CONTAINMENT = (
+    ("page-grid", "main", False),
+    ("grid-slot", ".page-grid", True),
+    ("ad-block", ".grid-slot", False),
+    ("category-grid", "main", False),
+    ("category-item", ".category-grid", True),
+)
+
+# fill_affiliates: detect whether an ad-block already has content
+AD_IMG_RE = re.compile(r"<img\s", re.IGNORECASE)
+AD_SCRIPT_RE = re.compile(r"<script\s", re.IGNORECASE)
+AD_LINK_RE = re.compile(r"<a\s", re.IGNORECASE)
+
+# fill_affiliates: body insertion for Adsterra scripts
+BODY_OPEN_RE = re.compile(r"<body[^>]*>", re.IGNORECASE)
+BODY_CLOSE_RE = re.compile(r"</body\s*>", re.IGNORECASE)
+
+# sitemap: (loc, lastmod) pairs in a previously written sitemap (seeds lastmod on first run)
+SITEMAP_URL_LASTMOD_RE = re.compile(r"<loc>([^<]*)</loc>\s*<lastmod>([^<]*)</lastmod>")
+
+# find_replace: SCOPE=head / SCOPE=body regions, and text that could move their boundaries
+HEAD_OPEN_RE = re.compile(r"<head(?:\s[^>]*)?>", re.IGNORECASE)
+HEAD_CLOSE_RE = re.compile(r"</head\s*>", re.IGNORECASE)
+REGION_MARKER_RE = re.compile(r"</?(?:head|body)\b", re.IGNORECASE)
+
+# fill_affiliates: .ad-block open tags (nesting is handled by html_regions)
+ADBLOCK_CLASS_RE = re.compile(
+    r'\bclass\s*=\s*["\'][^"\']*\bad-block\b[^"\']*["\']',
+    re.IGNORECASE,
+)
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import difflib
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, Optional
+
+from output_stage import begin_output
+
+# Bump if the line layout changes; --revert refuses journals it does not understand.
+JOURNAL_VERSION = 2
+# Version 1 hunks have no context line; they still revert, but only at their recorded offset
+# or wherever their new text (if any) sits.
+READABLE_JOURNAL_VERSIONS = (1, 2)
+
+# A hunk: [start, old, new, context]. start is a byte offset in the *edited* file; old/new
+# are the replaced byte ranges as text (utf-8 with surrogateescape, so any bytes round-trip);
+# context is the line just before the hunk ("" at the top of the file), used to find the
+# hunk again after other edits have moved it.
+Hunk = list
+
+
+def _b2s(b: bytes) -> str:
+    return b.decode("utf-8", errors="surrogateescape")
+
+
+def _s2b(s: str) -> bytes:
+    return s.encode("utf-8", errors="surrogateescape")
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_hunks(old: bytes, new: bytes) -> list[Hunk]:
+    # Line-granular byte-range patches, small enough to keep for every edited file.
+    a = old.splitlines(keepends=True)
+    b = new.splitlines(keepends=True)
+    hunks: list[Hunk] = []
+    pos_new = 0
+    sm = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    for tag, i1, i2, j1, j2 in sm.get_opcodes():
+        new_chunk = b"".join(b[j1:j2])
+        if tag != "equal":
+            context = b[j1 - 1] if j1 else b""
+            hunks.append([pos_new, _b2s(b"".join(a[i1:i2])), _b2s(new_chunk), _b2s(context)])
+        pos_new += len(new_chunk)
+    return hunks
+
+
+def unified_diff(old_text: str, new_text: str, path: str) -> str:
+    return "".join(
+        difflib.unified_diff(
+            old_text.splitlines(keepends=True),
+            new_text.splitlines(keepends=True),
+            fromfile=f"a/{path}",
+            tofile=f"b/{path}",
+        )
+    )
+
+
+def default_journal_path(journal_dir: Path) -> Path:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S_%f")
+    return journal_dir / f"find-replace-{stamp}.ndjson"
+
+
+class JournalWriter:
+    """
+    Append-only NDJSON journal: one header line, then one line per edited file.
+
+    Each file line is flushed before the file itself is rewritten, so an
+    interrupted run still leaves a journal covering every edit that happened.
+    """
+
+    def __init__(self, path: Path, root: Path, meta: dict) -> None:
+        self.path = path
+        self.root = root
+        self.entries = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._f: IO[str] = path.open("x", encoding="utf-8")
+        header = {
+            "journal": JOURNAL_VERSION,
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "root": str(root),
+            **meta,
+        }
+        self._write(header)
+
+    def _write(self, obj: dict) -> None:
+        self._f.write(json.dumps(obj, separators=(",", ":")) + "\n")
+        self._f.flush()
+
+    def record(self, path: Path, old: bytes, new: bytes) -> None:
+        self._write(
+            {
+                "path": path.relative_to(self.root).as_posix(),
+                "before_sha256": sha256_hex(old),
+                "after_sha256": sha256_hex(new),
+                "hunks": make_hunks(old, new),
+            }
+        )
+        self.entries += 1
+
+    def close(self) -> None:
+        self._f.close()
+
+
+@dataclass
+class RevertResult:
+    reverted: list[Path]
+    skipped: list[tuple[Path, str]]
+
+
+def _find_hunk(data: bytes, start: int, new_b: bytes, context_b: bytes) -> int:
+    # Offset of the hunk's new text in data, or -1. The recorded offset wins; otherwise
+    # the line-aligned occurrence of context + new closest to it, like patch(1) with
+    # one line of leading context.
+    if data[start : start + len(new_b)] == new_b and data[:start].endswith(context_b):
+        return start
+    needle = context_b + new_b
+    if not needle:
+        return -1
+    best = -1
+    i = data.find(needle)
+    while i != -1:
+        if i == 0 or data[i - 1 : i] == b"\n":
+            pos = i + len(context_b)
+            if best == -1 or abs(pos - start) < abs(best - start):
+                best = pos
+        i = data.find(needle, i + 1)
+    return best
+
+
+def _revert_bytes(current: bytes, hunks: list[Hunk]) -> Optional[bytes]:
+    # Undo hunks back to front; None if any hunk can no longer be found in the file.
+    out = current
+    for hunk in reversed(hunks):
+        start, old, new = hunk[:3]
+        new_b = _s2b(new)
+        pos = _find_hunk(out, start, new_b, _s2b(hunk[3]) if len(hunk) > 3 else b"")
+        if pos == -1:
+            return None
+        out = out[:pos] + _s2b(old) + out[pos + len(new_b) :]
+    return out
+
+
+def revert_journal(journal_path: Path, write: bool = True) -> RevertResult:
+    """
+    Undo the edits recorded in a journal, newest file entry first.
+
+    Hunks are located by their new text and the line before them, so later
+    edits elsewhere in the file survive even when they move the hunks (lines
+    inserted or removed above them). A file is only touched if every one of its
+    hunks is found; edits to a hunk or to the line just above it are reported
+    instead of clobbered. A file already back at its original hash is left alone.
+    """
+    lines = journal_path.read_text(encoding="utf-8").splitlines()
+    if not lines:
+        raise ValueError(f"Empty journal: {journal_path}")
+    header = json.loads(lines[0])
+    if header.get("journal") not in READABLE_JOURNAL_VERSIONS:
+        raise ValueError(f"Unsupported journal format in {journal_path}")
+    root = Path(header["root"])
+
+    result = RevertResult(reverted=[], skipped=[])
+    # Reverted files are published together, once every entry has been checked
+    with begin_output("revert", root) as out:
+        for line in reversed(lines[1:]):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A run killed mid-write leaves a truncated last line; its file was not written yet.
+                continue
+            p = root / entry["path"]
+            if not out.exists(p):
+                result.skipped.append((p, "file no longer exists"))
+                continue
+
+            current = out.read_bytes(p)
+            digest = sha256_hex(current)
+            if digest == entry["before_sha256"]:
+                result.skipped.append((p, "already reverted"))
+                continue
+
+            restored = _revert_bytes(current, entry["hunks"])
+            if restored is None:
+                result.skipped.append((p, "edited since the journaled run (hunks do not match)"))
+                continue
+            if digest == entry["after_sha256"] and sha256_hex(restored) != entry["before_sha256"]:
+                result.skipped.append((p, "restored content does not match the journal hash"))
+                continue
+
+            if write:
+                out.write_bytes(p, restored)
+            result.reverted.append(p)
+    return result
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Deploy tree: dist/ holds exactly the files the site publishes (the DIST_*
+allowlist in calculators_config.py), so a deploy uploads no backups, *.bak
+files, edit logs or tools/.
+
+    python tools/build.py --dist      (or, after a build: python tools/dist.py)
+
+That is the build script in package.json, so Vercel's git builds run it
+and publish dist/ (outputDirectory in vercel.json). From a local checkout,
+run vercel deploy at the repo root, not in dist/: the headers and URL rules
+in vercel.json only apply from the project root.
+
+Files in dist/ are hard links to the repo's files (copies where the
+filesystem cannot link), so assembling it takes no extra space and almost
+no time. The previous dist/ is reused: a file still linked to its source is
+left alone, and dist-manifest.json (sha256 and size per file, kept next to
+dist/) spares unchanged files a re-hash. The site tools replace files
+instead of editing them in place (output_stage.py), so a rebuilt page gets
+a new link rather than changing dist/ underneath the manifest.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Optional
+
+from artifacts import write_if_changed
+from build_manifest import sha256_bytes
+from calculators_config import DIST_DIRS, DIST_ROOT_FILES, DIST_SKIP_NAMES, Paths, get_paths
+from file_discovery import listing, walk
+
+# Bump when the manifest layout changes (an unknown manifest means every file is re-hashed).
+DIST_MANIFEST_VERSION = 1
+
+
+@dataclass(frozen=True)
+class DistFile:
+    sha256: str
+    size: int
+    mtime_ns: int  # of the source file, to tell whether it changed since
+
+
+@dataclass
+class DistResult:
+    files: int = 0
+    bytes: int = 0
+    linked: int = 0
+    copied: int = 0  # where hard links are not possible (another filesystem)
+    reused: int = 0  # already in place from the previous dist/
+    removed: int = 0
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.files} file(s) ({self.bytes / (1024 * 1024):.1f} MB): {self.linked} linked, "
+            f"{self.copied} copied, {self.reused} unchanged, {self.removed} removed in {self.seconds:.2f} s"
+        )
+
+
+def dist_files(repo_root: Path) -> list[str]:
+    # Repo-relative paths to publish, from the shared listing (so the excludes already apply)
+    out = []
+    for rel in listing(repo_root).files:
+        top, sep, _ = rel.partition("/")
+        name = rel.rsplit("/", 1)[-1]
+        if any(fnmatchcase(name, p) for p in DIST_SKIP_NAMES):
+            continue
+        if sep:
+            published = top in DIST_DIRS
+        else:
+            published = any(fnmatchcase(rel, p) for p in DIST_ROOT_FILES)
+        if published:
+            out.append(rel)
+    return out
+
+
+def _load_manifest(path: Path) -> dict[str, DistFile]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != DIST_MANIFEST_VERSION:
+        return {}
+    out: dict[str, DistFile] = {}
+    for rel, d in (data.get("files") or {}).items():
+        try:
+            out[rel] = DistFile(str(d["sha256"]), int(d["size"]), int(d["mtime_ns"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return out
+
+
+def _place(src: Path, dst: Path) -> bool:
+    # Hard link src at dst (True), or copy it where linking fails (False); dst flips atomically
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+    tmp.unlink(missing_ok=True)
+    try:
+        os.link(src, tmp)
+        linked = True
+    except OSError:
+        shutil.copy2(src, tmp)
+        linked = False
+    os.replace(tmp, dst)
+    return linked
+
+
+def _in_place(src: os.stat_result, dst: Optional[os.stat_result]) -> bool:
+    # Same inode (our link), or a copy with the source's size and mtime (copy2 keeps it)
+    if dst is None:
+        return False
+    if (dst.st_ino, dst.st_dev) == (src.st_ino, src.st_dev):
+        return True
+    return dst.st_size == src.st_size and dst.st_mtime_ns == src.st_mtime_ns
+
+
+def build_dist(paths: Paths, clean: bool = False) -> DistResult:
+    """
+    Bring dist/ in line with the allowlisted files of the repo.
+
+    New or changed files are linked (or copied) in, files no longer
+    published are removed, and the manifest is rewritten when anything in
+    it changed. With clean, dist/ is rebuilt from scratch.
+    """
+    t0 = time.perf_counter()
+    repo_root, dist_dir = paths.repo_root, paths.dist_dir
+    if clean:
+        shutil.rmtree(dist_dir, ignore_errors=True)
+    previous = {} if clean else _load_manifest(paths.dist_manifest_path)
+
+    result = DistResult()
+    files: dict[str, DistFile] = {}
+    for rel in dist_files(repo_root):
+        src, dst = repo_root / rel, dist_dir / rel
+        st = src.stat()
+        try:
+            dst_st: Optional[os.stat_result] = dst.stat()
+        except FileNotFoundError:
+            dst_st = None
+
+        if _in_place(st, dst_st):
+            result.reused += 1
+            prev = previous.get(rel)
+            if prev is not None and prev.size == st.st_size and prev.mtime_ns == st.st_mtime_ns:
+                files[rel] = prev
+                continue
+        elif _place(src, dst):
+            result.linked += 1
+        else:
+            result.copied += 1
+        files[rel] = DistFile(sha256_bytes(src.read_bytes()), st.st_size, st.st_mtime_ns)
+
+    # Whatever else is in dist/: files no longer published, and what it leaves empty
+    on_disk = walk(dist_dir, (), ())
+    for rel in on_disk.files:
+        if rel not in files:
+            (dist_dir / rel).unlink()
+            result.removed += 1
+    if result.removed:
+        for d in sorted({p.parent for p in on_disk.paths(on_disk.files)}, key=lambda d: len(d.parts), reverse=True):
+            while d != dist_dir and d.is_dir() and not any(d.iterdir()):
+                d.rmdir()
+                d = d.parent
+
+    manifest = {
+        "version": DIST_MANIFEST_VERSION,
+        "files": {
+            rel: {"sha256": f.sha256, "size": f.size, "mtime_ns": f.mtime_ns} for rel, f in sorted(files.items())
+        },
+    }
+    write_if_changed(paths.dist_manifest_path, (json.dumps(manifest, indent=1) + "\n").encode("utf-8"))
+
+    result.files = len(files)
+    result.bytes = sum(f.size for f in files.values())
+    result.seconds = time.perf_counter() - t0
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Assemble dist/, the deployable tree of the site, from an allowlist.")
+    parser.add_argument("--clean", action="store_true", help="Rebuild dist/ from scratch instead of updating it.")
+    args = parser.parse_args()
+
+    paths = get_paths(Path(__file__).resolve().parent.parent)
+    result = build_dist(paths, clean=args.clean)
+    print(f"dist/: {result.summary()}")
+    print(f"Manifest: {paths.dist_manifest_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import os
+import re
+from dataclasses import dataclass
+from fnmatch import translate
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable, Optional
+
+from calculators_config import EXCLUDE_DIRS, EXCLUDE_FILES
+
+
+@dataclass(frozen=True)
+class FileListing:
+    """
+    Every file under root that survives the excludes, as sorted relative posix paths.
+
+    Walked once (directories and files in sorted order, like the old per-tool
+    walkers) and then filtered in memory: by extension, or by a glob that
+    must match the whole relative path, one path segment per pattern segment.
+    """
+
+    root: Path
+    files: tuple[str, ...]
+
+    def paths(self, rels: Iterable[str]) -> list[Path]:
+        return [self.root / rel for rel in rels]
+
+    def with_suffix(self, exts: Iterable[str]) -> list[Path]:
+        exts = tuple(e.lower() for e in exts)
+        return self.paths(rel for rel in self.files if rel.lower().endswith(exts))
+
+    def glob(self, pattern: str) -> list[Path]:
+        # With equal segment counts a "*" can never reach across a "/", so one
+        # whole-path match per file gives per-segment glob semantics.
+        depth = pattern.count("/")
+        match = _glob_re(pattern).match
+        return self.paths(rel for rel in self.files if rel.count("/") == depth and match(rel))
+
+
+@lru_cache(maxsize=64)
+def _glob_re(pattern: str) -> re.Pattern[str]:
+    return re.compile(translate(pattern))
+
+
+@lru_cache(maxsize=16)
+def _exclude_re(patterns: tuple[str, ...]) -> Optional[re.Pattern[str]]:
+    # All patterns as one case-insensitive regex (so the same config works on
+    # Windows checkouts): one match per name instead of one fnmatch per pattern.
+    if not patterns:
+        return None
+    return re.compile("|".join(translate(p) for p in patterns), re.IGNORECASE)
+
+
+def walk(
+    root: Path,
+    exclude_dirs: Iterable[str] = EXCLUDE_DIRS,
+    exclude_files: Iterable[str] = EXCLUDE_FILES,
+) -> FileListing:
+    skip_dir = _exclude_re(tuple(exclude_dirs))
+    skip_file = _exclude_re(tuple(exclude_files))
+    out: list[str] = []
+    if root.is_dir():
+        _scan(str(root), "", skip_dir, skip_file, out)
+    return FileListing(root, tuple(out))
+
+
+def _scan(
+    dirpath: str,
+    prefix: str,
+    skip_dir: Optional[re.Pattern[str]],
+    skip_file: Optional[re.Pattern[str]],
+    out: list[str],
+) -> None:
+    # Same order as a sorted top-down os.walk: a directory's files, then each subdirectory.
+    # Symlinked directories are not followed.
+    with os.scandir(dirpath) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    subdirs = []
+    for e in entries:
+        if e.is_dir():
+            if not e.is_symlink() and not (skip_dir and skip_dir.match(e.name)):
+                subdirs.append(e)
+        elif not (skip_file and skip_file.match(e.name)):
+            out.append(prefix + e.name)
+    for e in subdirs:
+        _scan(e.path, prefix + e.name + "/", skip_dir, skip_file, out)
+
+
+# Listings reused within one process (one build, one tool run), keyed by root and excludes
+_cache: dict[tuple[Path, tuple[str, ...], tuple[str, ...]], FileListing] = {}
+
+
+def listing(
+    root: Path,
+    exclude_dirs: Iterable[str] = EXCLUDE_DIRS,
+    exclude_files: Iterable[str] = EXCLUDE_FILES,
+) -> FileListing:
+    """
+    Cached walk(): the first call per (root, excludes) walks the tree, later calls reuse it.
+
+    Call invalidate() when files may have been added or removed since (the
+    --watch poller does, before every check).
+    """
+    key = (root.resolve(), tuple(sorted(exclude_dirs)), tuple(sorted(exclude_files)))
+    cached = _cache.get(key)
+    if cached is None:
+        cached = _cache[key] = walk(root, key[1], key[2])
+    return cached if cached.root == root else FileListing(root, cached.files)
+
+
+def invalidate(root: Optional[Path] = None) -> None:
+    # Drop cached listings that overlap root (all of them if root is None).
+    if root is None:
+        _cache.clear()
+        return
+    root = root.resolve()
+    for key in [k for k in _cache if k[0] == root or root in k[0].parents or k[0] in root.parents]:
+        del _cache[key]
+
+
+def iter_files(
+    root: Path,
+    exts: Iterable[str],
+    exclude_dirs: Iterable[str] = EXCLUDE_DIRS,
+    exclude_files: Iterable[str] = EXCLUDE_FILES,
+) -> list[Path]:
+    # Files under root with one of exts (".html", ...), in walk order
+    return listing(root, exclude_dirs, exclude_files).with_suffix(exts)
@@ -1,17 +1,42 @@
+import argparse
+import html
+import os
 import random
 import re
+from functools import partial
 from pathlib import Path
 
-INVENTORY_PATH = Path(__file__).parent / "affiliate_inventory.txt"
-
-# Detect whether an ad-block already has content
-IMG_RE = re.compile(r"<img\s", re.IGNORECASE)
-SCRIPT_RE = re.compile(r"<script\s", re.IGNORECASE)
-LINK_RE = re.compile(r"<a\s", re.IGNORECASE)
+from backup_store import begin_run
+from calculators_config import (
+    AD_IMG_RE,
+    AD_LINK_RE,
+    AD_SCRIPT_RE,
+    ADBLOCK_CLASS_RE,
+    AFFILIATE_IMG_SIZES,
+    BODY_CLOSE_RE,
+    BODY_OPEN_RE,
+    EXCLUDE_DIRS,
+    get_paths,
+)
+from file_discovery import iter_files
+from html_regions import find_elements
+from images import load_image_manifest, picture_html
+from instrument import Instrument, Profiler, cpu_note, default_profile_path
+from output_stage import begin_output
+from parallel import parallel_map
 
-# Body insertion for Adsterra scripts
-BODY_OPEN_RE = re.compile(r"<body[^>]*>", re.IGNORECASE)
-BODY_CLOSE_RE = re.compile(r"</body\s*>", re.IGNORECASE)
+INVENTORY_PATH = Path(__file__).parent / "affiliate_inventory.txt"
+IMAGE_MANIFEST_PATH = get_paths(Path(__file__).resolve().parent.parent).image_manifest_path
+
+# A block written by build_img_block, whatever image markup it got: a bare <img> from before
+# the image manifest, a sized <img>, or a <picture> (src/alt are read from its <img>)
+IMG_BLOCK_RE = re.compile(
+    r'<a class="affiliate-link" href="(?P<href>[^"]*)" target="_blank" rel="nofollow sponsored noopener">\s*'
+    r'(?:<picture>.*?<img\b(?P<picture_img>[^>]*)>\s*</picture>|<img\b(?P<img>[^>]*)>)\s*</a>\n?',
+    re.DOTALL,
+)
+IMG_SRC_ATTR_RE = re.compile(r'\ssrc="([^"]*)"')
+IMG_ALT_ATTR_RE = re.compile(r'\salt="([^"]*)"')
 
 ADSTERRA_FOOTER = (
     '<script src="https://pl28401807.effectivegatecpm.com/16/d6/13/'
@@ -25,13 +50,6 @@ ADSTERRA_NATIVE = (
     '<div id="container-0ebd073c7baf207558a86b92738ee2ed"></div>'
 )
 
-# Robust .ad-block detection (div nesting aware)
-ADBLOCK_CLASS_RE = re.compile(
-    r'\bclass\s*=\s*["\'][^"\']*\bad-block\b[^"\']*["\']',
-    re.IGNORECASE,
-)
-DIV_TAG_RE = re.compile(r"</?div\b[^>]*>", re.IGNORECASE)
-
 
 def parse_inventory(path: Path):
     sections = {}
@@ -75,34 +93,75 @@ def parse_inventory(path: Path):
 
 
 def is_filled(inner: str) -> bool:
-    return bool(IMG_RE.search(inner) or SCRIPT_RE.search(inner) or LINK_RE.search(inner))
+    return bool(AD_IMG_RE.search(inner) or AD_SCRIPT_RE.search(inner) or AD_LINK_RE.search(inner))
 
 
-def build_img_block(item):
+def build_img_block(item, images=None):
+    # Sized, lazy <img>; a <picture> with AVIF/WebP srcsets when the images stage made variants
+    info = images.get(item["img"]) if images else None
     return (
         f'<a class="affiliate-link" href="{item["href"]}" '
         f'target="_blank" rel="nofollow sponsored noopener">\n'
-        f'  <img src="{item["img"]}" alt="{item["alt"]}">\n'
+        f'{picture_html(item["img"], item["alt"], info, AFFILIATE_IMG_SIZES)}'
         f'</a>\n'
     )
 
 
-def ensure_adsterra_scripts(text: str) -> str:
+def refresh_img_block_edits(text: str, start: int, end: int, images):
+    # Rebuild affiliate image blocks inside text[start:end] from href/src/alt with the current manifest
+    edits = []
+    for m in IMG_BLOCK_RE.finditer(text, start, end):
+        attrs = m["img"] if m["img"] is not None else m["picture_img"]
+        src = IMG_SRC_ATTR_RE.search(attrs)
+        if not src:
+            continue
+        alt = IMG_ALT_ATTR_RE.search(attrs)
+        item = {"href": m["href"], "img": src[1], "alt": html.unescape(alt[1]) if alt else ""}
+        new = build_img_block(item, images)
+        if new != m.group(0):
+            edits.append((m.start(), m.end(), new))
+    return edits
+
+
+def splice(text, edits):
+    """
+    Apply (start, end, replacement) edits, given in original-text coordinates,
+    building the output string once. Edits must not overlap.
+    """
+    parts = []
+    pos = 0
+    for start, end, replacement in sorted(edits, key=lambda e: (e[0], e[1])):
+        parts.append(text[pos:start])
+        parts.append(replacement)
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def adsterra_script_edits(text: str):
     # If either marker is present, assume already inserted
     if ADSTERRA_FOOTER in text or ADSTERRA_NATIVE in text:
-        return text
+        return []
 
+    edits = []
     body_open = BODY_OPEN_RE.search(text)
-    body_close = BODY_CLOSE_RE.search(text)
-
     if body_open:
-        insert_at = body_open.end()
-        text = text[:insert_at] + "\n\n" + ADSTERRA_NATIVE + "\n\n" + text[insert_at:]
+        edits.append((body_open.end(), body_open.end(), "\n\n" + ADSTERRA_NATIVE + "\n\n"))
 
+    body_close = BODY_CLOSE_RE.search(text, body_open.end() if body_open else 0)
     if body_close:
-        text = text[:body_close.start()] + "\n\n" + ADSTERRA_FOOTER + "\n" + text[body_close.start():]
+        edits.append((body_close.start(), body_close.start(), "\n\n" + ADSTERRA_FOOTER + "\n"))
+
+    return edits
 
-    return text
+
+def ensure_adsterra_scripts(text: str) -> str:
+    return splice(text, adsterra_script_edits(text))
+
+
+def _is_ad_block_tag(tag: str) -> bool:
+    # Substring check first: the class regex only runs on the few candidate tags
+    return "ad-block" in tag and ADBLOCK_CLASS_RE.search(tag) is not None
 
 
 def find_ad_block_spans(html: str, max_blocks: int = 4):
@@ -110,96 +169,182 @@ def find_ad_block_spans(html: str, max_blocks: int = 4):
     Returns spans for the first max_blocks .ad-block divs.
     Each item: (open_start, open_end, close_start, close_end)
 
-    This is div-nesting aware and will not stop at inner placeholder </div>.
+    This is div-nesting aware and will not stop at inner placeholder </div>;
+    markup inside comments and <script>/<style> is ignored.
     """
-    spans = []
-    stack = []
-    current = None  # dict with keys: open_start, open_end, depth
-
-    for m in DIV_TAG_RE.finditer(html):
-        tag = m.group(0)
-        is_close = tag.startswith("</")
-
-        if not is_close:
-            stack.append(m.start())
-
-            if current is None and len(spans) < max_blocks and ADBLOCK_CLASS_RE.search(tag):
-                current = {
-                    "open_start": m.start(),
-                    "open_end": m.end(),
-                    "depth": len(stack),
-                }
-        else:
-            if stack:
-                stack.pop()
+    if "ad-block" not in html:
+        return []
+    return [
+        (r.open_start, r.open_end, r.close_start, r.close_end)
+        for r in find_elements(html, "div", _is_ad_block_tag, limit=max_blocks)
+    ]
 
-            # When we exit the ad-block's nesting depth, we've found its closing </div>
-            if current is not None and len(stack) == current["depth"] - 1:
-                spans.append((current["open_start"], current["open_end"], m.start(), m.end()))
-                current = None
 
-                if len(spans) >= max_blocks:
-                    break
+def fill_file(path: Path, inv, root: Path, seed: int, backup=None, images=None, refresh_images=False, *, out):
+    """
+    Worker: add the Adsterra scripts and fill empty ad-blocks in one file.
+
+    All edits are collected against the original text and spliced in once.
+    The RNG is seeded from the file's path relative to root, so the chosen
+    affiliates do not depend on traversal order or on the worker count.
+    Image blocks use the image manifest (images) for sizes and srcsets; with
+    refresh_images, image blocks in already-filled slots are rebuilt too.
+    With a backup run, the original bytes are saved before the file is rewritten.
+    The new file is staged in out (an OutputStage) and published when it commits.
+    Returns (blocks_filled, script_added, blocks_refreshed).
+    """
+    data = path.read_bytes()
+    # Same text path.read_text() gives (universal newlines)
+    text = data.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+    rng = random.Random(f"{seed}:{path.relative_to(root).as_posix()}")
+
+    edits = adsterra_script_edits(text)
+    script_added = bool(edits)
+
+    filled = refreshed = 0
+    for i, (open_start, open_end, close_start, close_end) in enumerate(find_ad_block_spans(text, max_blocks=4)):
+        if is_filled(text[open_end:close_start]):
+            if refresh_images:
+                block_edits = refresh_img_block_edits(text, open_end, close_start, images)
+                edits += block_edits
+                refreshed += len(block_edits)
+            continue
 
-    return spans
+        if i == 0:
+            content = inv["ADSTERRA"]
+        elif i == 1:
+            content = build_img_block(rng.choice(inv["AFFILIATES"]), images)
+        elif i == 2:
+            content = build_img_block(rng.choice(inv["BOOKS"]), images)
+        else:
+            content = build_img_block(inv["AMAZON"], images)
 
+        edits.append((open_end, close_start, "\n" + content + "\n"))
+        filled += 1
 
-def main():
-    inv = parse_inventory(INVENTORY_PATH)
-    rng = random.Random(12345)
-
-    files_changed = 0
-    blocks_filled = 0
-    scripts_added = 0
-
-    for path in Path(".").rglob("*.html"):
-        text = path.read_text(encoding="utf-8", errors="replace")
-
-        updated_text = ensure_adsterra_scripts(text)
-        script_modified = updated_text != text
-
-        spans = find_ad_block_spans(updated_text, max_blocks=4)
-        replaced = 0
-
-        # Replace from the end so earlier indices remain valid after edits
-        for i, (open_start, open_end, close_start, close_end) in reversed(list(enumerate(spans))):
-            inner = updated_text[open_end:close_start]
-
-            if is_filled(inner):
-                continue
-
-            if i == 0:
-                content = inv["ADSTERRA"]
-            elif i == 1:
-                content = build_img_block(rng.choice(inv["AFFILIATES"]))
-            elif i == 2:
-                content = build_img_block(rng.choice(inv["BOOKS"]))
-            else:
-                content = build_img_block(inv["AMAZON"])
-
-            updated_text = (
-                updated_text[:open_end]
-                + "\n"
-                + content
-                + "\n"
-                + updated_text[close_start:]
-            )
+    if edits:
+        # What path.write_text() would write, so the backup records the exact new bytes
+        new = splice(text, edits).replace("\n", os.linesep).encode("utf-8")
+        if backup is not None:
+            backup.save(path, data, new)
+        out.write_bytes(path, new)
+    return filled, script_added, refreshed
 
-            replaced += 1
-            blocks_filled += 1
 
-        if replaced > 0 or script_modified:
-            path.write_text(updated_text, encoding="utf-8")
-            files_changed += 1
-            if script_modified:
-                scripts_added += 1
+def main():
+    parser = argparse.ArgumentParser(description="Fill empty .ad-block slots and add Adsterra scripts to HTML pages.")
+    parser.add_argument("--root", default=".", help="Site root to scan. Default: current directory.")
+    parser.add_argument(
+        "--exclude-dirs",
+        default=",".join(sorted(EXCLUDE_DIRS)),
+        help="Comma-separated directory names (glob patterns allowed) to skip.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes (0 = one per CPU). Default: 1",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=12345,
+        help="Base seed for affiliate picks; each file gets its own stream. Default: 12345",
+    )
+    parser.add_argument(
+        "--refresh-images",
+        action="store_true",
+        help="Also rebuild affiliate images in already-filled slots with the sizes and variants "
+        "from tools/image-manifest.json (run build.py first).",
+    )
+    parser.add_argument(
+        "--no-backup",
+        action="store_true",
+        help="Do not save pre-edit files to the backup store (tools/.backup).",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="PATH",
+        help="Write a cProfile dump (default tools/.cache/profile/fill-affiliates-<UTC time>.pstats) "
+        "and list the slowest files.",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=20,
+        help="Functions and files listed by --profile. Default: 20",
+    )
+    args = parser.parse_args()
+
+    root = Path(args.root).resolve()
+    exclude_dirs = {d.strip() for d in args.exclude_dirs.split(",") if d.strip()}
+
+    inst = Instrument()
+    backup = None if args.no_backup else begin_run("fill-affiliates", root)
+    out = begin_output("fill-affiliates", root)
+    profiler = None
+    if args.profile is not None:
+        profile_path = Path(args.profile) if args.profile else default_profile_path(root, "fill-affiliates")
+        profiler = Profiler(profile_path, root, top=args.profile_top)
+        profiler.start()
+    try:
+        with inst.stage("discover") as st:
+            inv = parse_inventory(INVENTORY_PATH)
+            images = load_image_manifest(IMAGE_MANIFEST_PATH)
+            files = list(iter_files(root, [".html"], exclude_dirs))
+            st.files = len(files)
+
+        # Workers read, edit and stage each file; all of them go live together
+        with inst.stage("fill") as st:
+            work = partial(
+                fill_file,
+                inv=inv,
+                root=root,
+                seed=args.seed,
+                backup=backup,
+                images=images,
+                refresh_images=args.refresh_images,
+                out=out,
+            )
+            results = parallel_map(work, files, jobs=args.jobs)
+            st.files = sum(1 for r in results if any(r))
+            out.commit()
+    finally:
+        out.close()
+        profile_lines = profiler.stop() if profiler else []
+        if backup is not None and not backup.close():
+            backup = None
+
+    files_changed = sum(1 for r in results if any(r))
+    blocks_filled = sum(filled for filled, _, _ in results)
+    scripts_added = sum(1 for _, script_added, _ in results if script_added)
+    blocks_refreshed = sum(refreshed for _, _, refreshed in results)
 
     print(
         "Done.\n"
         f"Files changed: {files_changed}\n"
         f"Ad-blocks filled: {blocks_filled}\n"
-        f"Adsterra scripts added: {scripts_added}"
+        f"Adsterra scripts added: {scripts_added}\n"
+        f"Output: {out.totals.summary()}"
     )
+    if args.refresh_images:
+        print(f"Affiliate images refreshed: {blocks_refreshed}")
+    if not images:
+        print("Note: no image manifest (run build.py); affiliate images have no width/height or variants.")
+    if backup is not None:
+        print(f"Backup run: {backup.run_id} (restore with: python tools/backup_store.py restore {backup.run_id})")
+    print("Stages:")
+    for line in inst.report_lines():
+        print(line)
+    if profiler:
+        note = cpu_note(args.jobs)
+        if note:
+            print(note)
+        for line in profile_lines:
+            print(line)
 
 
 if __name__ == "__main__":
@@ -2,38 +2,43 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
+import json
 import os
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
+from functools import partial
 from pathlib import Path
-from typing import Iterable, List
+from typing import List, Optional
+
+from backup_store import BackupRun, begin_run
+from calculators_config import EXCLUDE_DIRS
+from change_journal import JournalWriter, default_journal_path, revert_journal, sha256_hex, unified_diff
+from file_discovery import iter_files
+from instrument import Instrument, Profiler, cpu_note, default_profile_path
+from output_stage import OutputStage, begin_output
+from parallel import parallel_map
+from replace_engine import ENGINE_VERSION, ReplaceEngine, Rule, validate_rule
 
 
 DEFAULT_RULES_PATH = Path(__file__).parent / "find_replace_rules.txt"
+# Parsed + planned rule sets, keyed by a hash of the rules file
+DEFAULT_CACHE_DIR = Path(__file__).parent / ".cache" / "find-replace"
+# Change journals written by --apply (undo with --revert <journal>)
+DEFAULT_JOURNAL_DIR = Path(__file__).parent / ".journal"
 DEFAULT_EXTS = [".html", ".htm", ".css", ".js"]
-DEFAULT_EXCLUDE_DIRS = {".git", "node_modules", ".venv", "venv", "dist", "build", ".next", ".cache"}
-
-
-@dataclass(frozen=True)
-class Rule:
-    name: str
-    find: str
-    replace: str
-
-
-def iter_files(root: Path, exts: List[str], exclude_dirs: set[str]) -> Iterable[Path]:
-    exclude_lower = {d.lower() for d in exclude_dirs}
-    for dirpath, dirnames, filenames in os.walk(root):
-        dirnames[:] = [d for d in dirnames if d.lower() not in exclude_lower]
-        for fn in filenames:
-            p = Path(dirpath) / fn
-            if p.suffix.lower() in exts:
-                yield p
+# Directory names skipped by default; the shared list lives in calculators_config
+DEFAULT_EXCLUDE_DIRS = set(EXCLUDE_DIRS)
 
 
 def read_text(path: Path) -> str:
     return path.read_text(encoding="utf-8", errors="replace")
 
 
+def decode_text(data: bytes) -> str:
+    # Same result as read_text on the same bytes (utf-8 with replacement, universal newlines)
+    return data.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+
+
 def write_text(path: Path, content: str) -> None:
     path.write_text(content, encoding="utf-8")
 
@@ -44,6 +49,9 @@ def parse_rules(text: str) -> List[Rule]:
 
     [RULE]
     NAME=Something
+    KIND=literal        (optional: literal | regex | ws)
+    SCOPE=all           (optional: all | head | body)
+    FLAGS=i             (optional, regex/ws/literal: i, s, m)
     [FIND]
     ...
     [/FIND]
@@ -53,6 +61,11 @@ def parse_rules(text: str) -> List[Rule]:
     [/RULE]
 
     Multiple rules can be separated by "----" but that is optional.
+
+    KIND=regex takes a Python regex and a replacement that may use \\1 or \\g<name>.
+    KIND=ws matches the FIND text with any run of whitespace standing for any
+    other run (indentation, line breaks). SCOPE=head/body restricts a rule to
+    the inside of the first <head>/<body> element.
     """
     lines = text.splitlines()
 
@@ -82,6 +95,9 @@ def parse_rules(text: str) -> List[Rule]:
             continue
 
         name = "Unnamed rule"
+        kind = "literal"
+        scope = "all"
+        flags = ""
         find = None
         replace = None
 
@@ -94,6 +110,21 @@ def parse_rules(text: str) -> List[Rule]:
                 i += 1
                 continue
 
+            if cur.startswith("KIND="):
+                kind = cur.split("=", 1)[1].strip().lower()
+                i += 1
+                continue
+
+            if cur.startswith("SCOPE="):
+                scope = cur.split("=", 1)[1].strip().lower()
+                i += 1
+                continue
+
+            if cur.startswith("FLAGS="):
+                flags = "".join(sorted(set(cur.split("=", 1)[1].strip().lower())))
+                i += 1
+                continue
+
             if cur == "[FIND]":
                 find_block, i = collect_until("[/FIND]", i + 1)
                 find = find_block
@@ -113,31 +144,103 @@ def parse_rules(text: str) -> List[Rule]:
         if find is None or replace is None:
             raise ValueError(f"Rule '{name}' missing [FIND] or [REPLACE] block.")
 
-        rules.append(Rule(name=name, find=find, replace=replace))
+        rule = Rule(name=name, find=find, replace=replace, kind=kind, scope=scope, flags=flags)
+        validate_rule(rule)
+        rules.append(rule)
 
     return rules
 
 
-def apply_rules(content: str, rules: List[Rule]) -> tuple[str, int, List[str]]:
+def compile_rules(rules: List[Rule]) -> ReplaceEngine:
+    return ReplaceEngine(rules)
+
+
+def load_engine(rules_text: str, cache_dir: Optional[Path]) -> tuple[ReplaceEngine, bool]:
+    """
+    Parse and plan a rules file, reusing the cached result for identical text.
+
+    Returns (engine, from_cache). The cache holds the parsed rules and the stage
+    plan (generated regex sources), so a hit skips parsing, validation and the
+    pairwise rule analysis; only re.compile of the stage patterns remains.
     """
-    Applies rules sequentially. Returns:
+    key = hashlib.sha256(f"{ENGINE_VERSION}\n{rules_text}".encode("utf-8")).hexdigest()
+    cache_path = cache_dir / f"{key}.json" if cache_dir is not None else None
+
+    if cache_path is not None and cache_path.exists():
+        try:
+            data = json.loads(read_text(cache_path))
+            return ReplaceEngine([Rule(**r) for r in data["rules"]], plan=data["plan"]), True
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # unreadable cache entry: rebuild it below
+
+    rules = parse_rules(rules_text)
+    plan = ReplaceEngine.make_plan(rules)
+    engine = ReplaceEngine(rules, plan=plan)
+
+    if cache_path is not None and rules:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"rules": [asdict(r) for r in rules], "plan": plan}
+        write_text(cache_path, json.dumps(data, ensure_ascii=False))
+    return engine, False
+
+
+def apply_rules(content: str, engine: ReplaceEngine) -> tuple[str, int, List[str]]:
+    """
+    Applies rules with the same result as running them one at a time in file
+    order (see replace_engine.plan_stages). Returns:
     - new_content
     - total_replacements (count of rules that triggered at least once)
     - list of rule names that triggered
     """
-    new = content
-    triggered: List[str] = []
-    triggers_count = 0
+    new, triggered = engine.apply(content)
+    return new, len(triggered), triggered
+
+
+def encode_text(content: str) -> bytes:
+    # The bytes write_text would produce
+    return content.replace("\n", os.linesep).encode("utf-8")
 
-    for r in rules:
-        if r.find in new:
-            new2 = new.replace(r.find, r.replace)
-            if new2 != new:
-                new = new2
-                triggered.append(r.name)
-                triggers_count += 1
 
-    return new, triggers_count, triggered
+@dataclass(frozen=True)
+class FileChange:
+    triggered: List[str]
+    old: bytes
+    new: bytes
+    diff: Optional[str]
+
+
+def process_file(path: Path, engine: ReplaceEngine, root: Path, want_diff: bool) -> Optional[FileChange]:
+    # Worker: computes the edit without writing it; None if the file does not change.
+    data = path.read_bytes()
+    if not engine.matches(data):
+        return None
+
+    original = decode_text(data)
+    updated, _, triggered_names = apply_rules(original, engine)
+    if updated == original:
+        return None
+
+    diff = unified_diff(original, updated, path.relative_to(root).as_posix()) if want_diff else None
+    return FileChange(triggered=triggered_names, old=data, new=encode_text(updated), diff=diff)
+
+
+def run_revert(journal: Path, dry_run: bool) -> int:
+    try:
+        result = revert_journal(journal, write=not dry_run)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}")
+        return 2
+
+    tag = "[DRY RUN] would revert" if dry_run else "[REVERTED]"
+    for p in result.reverted:
+        print(f"{tag} {p}")
+    for p, reason in result.skipped:
+        print(f"[SKIPPED] {p}  ({reason})")
+    print("")
+    print(f"{'REVERT DRY RUN' if dry_run else 'REVERT'} complete.")
+    print(f"Files reverted: {len(result.reverted)}")
+    print(f"Files skipped: {len(result.skipped)}")
+    return 1 if any(r != "already reverted" for _, r in result.skipped) else 0
 
 
 def main() -> int:
@@ -156,17 +259,65 @@ def main() -> int:
     parser.add_argument(
         "--exclude-dirs",
         default=",".join(sorted(DEFAULT_EXCLUDE_DIRS)),
-        help="Comma-separated directory names to skip.",
+        help="Comma-separated directory names (glob patterns allowed) to skip.",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes for scanning files (0 = one per CPU). Default: 1",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always re-parse the rules file instead of using tools/.cache/find-replace.",
     )
     parser.add_argument("--dry-run", action="store_true", help="Report changes without writing.")
     parser.add_argument("--apply", action="store_true", help="Write changes to disk.")
+    parser.add_argument("--diff", action="store_true", help="Print a unified diff for every changed file.")
+    parser.add_argument(
+        "--journal",
+        help="Where --apply records its edits. Default: tools/.journal/find-replace-<UTC time>.ndjson",
+    )
+    parser.add_argument("--no-journal", action="store_true", help="Apply without writing a change journal.")
+    parser.add_argument(
+        "--no-backup",
+        action="store_true",
+        help="Apply without saving pre-edit files to the backup store (tools/.backup).",
+    )
+    parser.add_argument(
+        "--revert",
+        metavar="JOURNAL",
+        help="Undo the edits recorded in a journal (combine with --dry-run to preview).",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="PATH",
+        help="Write a cProfile dump (default tools/.cache/profile/find-replace-<UTC time>.pstats) "
+        "and list the slowest files.",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=20,
+        help="Functions and files listed by --profile. Default: 20",
+    )
     args = parser.parse_args()
 
+    if args.revert:
+        if args.apply:
+            print("ERROR: Use either --revert or --apply, not both.")
+            return 2
+        return run_revert(Path(args.revert).resolve(), args.dry_run)
+
     if args.dry_run and args.apply:
         print("ERROR: Use either --dry-run or --apply, not both.")
         return 2
     if not args.dry_run and not args.apply:
-        print("ERROR: Choose one: --dry-run or --apply")
+        print("ERROR: Choose one: --dry-run, --apply or --revert <journal>")
         return 2
 
     root = Path(args.root).resolve()
@@ -180,39 +331,108 @@ def main() -> int:
     exts = [e if e.startswith(".") else f".{e}" for e in exts]
     exclude_dirs = {d.strip() for d in args.exclude_dirs.split(",") if d.strip()}
 
-    rules = parse_rules(read_text(rules_path))
+    inst = Instrument()
+    try:
+        with inst.stage("rules"):
+            engine, from_cache = load_engine(read_text(rules_path), None if args.no_cache else DEFAULT_CACHE_DIR)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return 2
+    rules = engine.rules
     if not rules:
         print("ERROR: No rules found in rules file.")
         return 2
 
-    scanned = 0
+    # The call profile covers the file passes (rule loading is timed above)
+    profiler = None
+    if args.profile is not None:
+        profile_path = Path(args.profile) if args.profile else default_profile_path(root, "find-replace")
+        profiler = Profiler(profile_path, root, top=args.profile_top)
+        profiler.start()
+
+    with inst.stage("discover") as st:
+        files = list(iter_files(root, exts, exclude_dirs))
+        st.files = len(files)
+    scanned = len(files)
     changed_files = 0
     total_rule_triggers = 0
 
-    for p in iter_files(root, exts, exclude_dirs):
-        scanned += 1
-        original = read_text(p)
-        updated, triggers_count, triggered_names = apply_rules(original, rules)
-
-        if updated == original:
-            continue
-
-        changed_files += 1
-        total_rule_triggers += triggers_count
-
-        if args.dry_run:
-            print(f"[DRY RUN] {p}  (rules triggered: {', '.join(triggered_names)})")
-        else:
-            write_text(p, updated)
-            print(f"[UPDATED] {p}  (rules triggered: {', '.join(triggered_names)})")
+    with inst.stage("match") as st:
+        work = partial(process_file, engine=engine, root=root, want_diff=args.diff)
+        changes = parallel_map(work, files, jobs=args.jobs)
+        st.files = scanned
+
+    journal: Optional[JournalWriter] = None
+    if args.apply and not args.no_journal:
+        journal_path = Path(args.journal).resolve() if args.journal else default_journal_path(DEFAULT_JOURNAL_DIR)
+        meta = {"rules": str(rules_path), "rules_sha256": sha256_hex(rules_path.read_bytes())}
+        journal = JournalWriter(journal_path, root, meta)
+    backup: Optional[BackupRun] = None
+    if args.apply and not args.no_backup:
+        backup = begin_run("find-replace", root, meta={"rules": str(rules_path)})
+    # Applied changes are staged and published together once every file is done
+    out: Optional[OutputStage] = begin_output("find-replace", root) if args.apply else None
+
+    try:
+        with inst.stage("dry_run" if args.dry_run else "write") as st:
+            for p, change in zip(files, changes):
+                if change is None:
+                    continue
+
+                changed_files += 1
+                total_rule_triggers += len(change.triggered)
+
+                if args.dry_run:
+                    print(f"[DRY RUN] {p}  (rules triggered: {', '.join(change.triggered)})")
+                else:
+                    # Journal and backup first, then write: an interrupted run stays revertible
+                    if journal is not None:
+                        journal.record(p, change.old, change.new)
+                    if backup is not None:
+                        backup.save(p, change.old, change.new)
+                    out.write_bytes(p, change.new)
+                    print(f"[UPDATED] {p}  (rules triggered: {', '.join(change.triggered)})")
+                if change.diff:
+                    print(change.diff, end="" if change.diff.endswith("\n") else "\n")
+            st.files = 0 if args.dry_run else changed_files
+            if out is not None:
+                out.commit()
+    finally:
+        if out is not None:
+            out.close()
+        if journal is not None:
+            journal.close()
+        if backup is not None and not backup.close():
+            backup = None
+        profile_lines = profiler.stop() if profiler else []
+    if journal is not None and journal.entries == 0:
+        journal.path.unlink()
+        journal = None
 
     mode = "DRY RUN" if args.dry_run else "APPLIED"
     print("")
     print(f"{mode} complete.")
-    print(f"Rules loaded: {len(rules)}")
+    print(f"Rules loaded: {len(rules)} (passes: {len(engine.stages)}{', cached' if from_cache else ''})")
     print(f"Files scanned: {scanned}")
     print(f"Files changed: {changed_files}")
     print(f"Rule triggers (file-level): {total_rule_triggers}")
+    if out is not None:
+        print(f"Output: {out.totals.summary()}")
+    if journal is not None:
+        print(f"Journal: {journal.path}")
+        print(f"Undo with: python tools/find_replace.py --revert {journal.path}")
+    if backup is not None:
+        print(f"Backup run: {backup.run_id}")
+        print(f"Restore with: python tools/backup_store.py restore {backup.run_id}")
+    print("Stages:")
+    for line in inst.report_lines():
+        print(line)
+    if profiler:
+        note = cpu_note(args.jobs)
+        if note:
+            print(note)
+        for line in profile_lines:
+            print(line)
     return 0
 
 
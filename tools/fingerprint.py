@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+from backup_store import BackupRun
+from build_manifest import sha256_bytes
+from calculators_config import (
+    ASSET_REF_ATTR_RE,
+    ASSET_REF_RE,
+    FINGERPRINT_GLOBS,
+    FINGERPRINT_HASH_LEN,
+    FINGERPRINT_SKIP,
+    HASHED_ASSET_NAME_RE,
+    Paths,
+)
+from file_discovery import listing
+from output_stage import OutputStage
+from parallel import parallel_map
+
+# Bump when the manifest layout changes (an unknown manifest is treated as empty).
+ASSET_MANIFEST_VERSION = 1
+
+
+@dataclass(frozen=True)
+class FingerprintResult:
+    assets: int
+    copies_written: int  # hashed copies (re)written this build
+    copies_removed: int  # hashed copies older than the previous build's
+    pages_scanned: int
+    pages: list[Path]  # pages whose references were rewritten
+
+
+def hashed_name(rel: str, data: bytes) -> str:
+    # styles/main.css -> styles/main.<sha256 prefix>.css
+    p = Path(rel)
+    digest = sha256_bytes(data)[:FINGERPRINT_HASH_LEN]
+    return (p.parent / f"{p.stem}.{digest}{p.suffix}").as_posix()
+
+
+def fingerprint_sources(repo_root: Path) -> list[Path]:
+    # Editable originals only: hashed copies sit next to them and are never hashed again
+    root = listing(repo_root)
+    out: dict[Path, None] = {}
+    for pattern in FINGERPRINT_GLOBS:
+        for p in root.glob(pattern):
+            rel = p.relative_to(repo_root).as_posix()
+            if rel not in FINGERPRINT_SKIP and not HASHED_ASSET_NAME_RE.match(p.name):
+                out[p] = None
+    return list(out)
+
+
+def _load_manifest(path: Path) -> dict:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != ASSET_MANIFEST_VERSION:
+        return {}
+    return data
+
+
+def rewrite_asset_refs(data: bytes, names: dict[str, str]) -> bytes:
+    """
+    Point every styles/ and scripts/ reference in a page at its hashed copy.
+
+    names maps "styles/main.css" to "styles/main.<hash>.css". References to a
+    stale hash are moved to the current one; the path prefix (absolute or
+    "../") and any query string are kept. Only href/src attribute values are
+    touched, and unknown files are left alone.
+    """
+
+    def sub(m: re.Match[bytes]) -> bytes:
+        target = names.get((m["dir"] + b"/" + m["stem"] + m["ext"]).decode("ascii"))
+        if target is None or not ASSET_REF_ATTR_RE.search(data, max(0, m.start() - 64), m.start()):
+            return m.group(0)
+        return target.encode("ascii")
+
+    return ASSET_REF_RE.sub(sub, data)
+
+
+def _rewrite_page(
+    path: Path,
+    names: dict[str, str],
+    out: OutputStage,
+    backup: Optional[BackupRun] = None,
+) -> bool:
+    # Worker: rewrite one page's asset references in place (bytes, so line endings survive)
+    data = path.read_bytes()
+    if b"styles/" not in data and b"scripts/" not in data:
+        return False
+    new = rewrite_asset_refs(data, names)
+    if new == data:
+        return False
+    if backup is not None:
+        backup.save(path, data, new)
+    out.write_bytes(path, new)
+    return True
+
+
+def fingerprint_assets(
+    paths: Paths,
+    jobs: int = 1,
+    backup: Optional[BackupRun] = None,
+    *,
+    out: OutputStage,
+) -> FingerprintResult:
+    """
+    Fingerprint stage: write content-hashed copies of styles/ and scripts/ and
+    point every page at them, so vercel.json's immutable caching never serves
+    a stale file.
+
+    Copies are written next to the originals (which stay the files to edit).
+    Only pages whose references change are rewritten. The copies from the
+    previous build are kept, so pages still cached at the edge keep working
+    through a deploy; anything older is removed. Everything goes through
+    `out`, so it is published when the caller commits.
+    """
+    repo_root = paths.repo_root
+    previous = _load_manifest(paths.asset_manifest_path)
+    prev_current: dict[str, str] = previous.get("assets") or {}
+    prev_previous: dict[str, str] = previous.get("previous") or {}
+
+    names: dict[str, str] = {}
+    written = 0
+    for src in fingerprint_sources(repo_root):
+        rel = src.relative_to(repo_root).as_posix()
+        data = src.read_bytes()
+        names[rel] = hashed_name(rel, data)
+        written += out.write_bytes(repo_root / names[rel], data)
+
+    # The name each asset had before this build, if it changed (else the one before that)
+    older = {
+        rel: prev_current[rel] if prev_current.get(rel, name) != name else prev_previous.get(rel)
+        for rel, name in names.items()
+    }
+    older = {rel: name for rel, name in older.items() if name and name != names[rel]}
+    # An asset whose source is gone keeps its last copy for one more build
+    older.update({rel: name for rel, name in prev_current.items() if rel not in names})
+
+    pages = listing(repo_root).with_suffix([".html"])
+    changed = parallel_map(partial(_rewrite_page, names=names, out=out, backup=backup), pages, jobs=jobs)
+
+    # Hashed copies of each asset other than the current and the previous one
+    keep = set(names.values()) | set(older.values())
+    removed = 0
+    for rel in sorted(set(names) | set(prev_current) | set(prev_previous)):
+        r = Path(rel)
+        for p in listing(repo_root).glob(f"{r.parent.as_posix()}/{r.stem}.*{r.suffix}"):
+            m = HASHED_ASSET_NAME_RE.match(p.name)
+            if m and m["stem"] == r.stem and p.relative_to(repo_root).as_posix() not in keep:
+                removed += out.remove(p)
+
+    manifest = {"version": ASSET_MANIFEST_VERSION, "assets": dict(sorted(names.items()))}
+    if older:
+        manifest["previous"] = dict(sorted(older.items()))
+    out.write_text(paths.asset_manifest_path, json.dumps(manifest, indent=1) + "\n")
+
+    return FingerprintResult(
+        assets=len(names),
+        copies_written=written,
+        copies_removed=removed,
+        pages_scanned=len(pages),
+        pages=[p for p, did_change in zip(pages, changed) if did_change],
+    )
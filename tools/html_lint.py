@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from build_manifest import sha256_bytes
+from calculators_config import (
+    LINT_BALANCED_TAGS,
+    LINT_CLASS_RE,
+    LINT_CONTAINMENT,
+    LINT_ID_RE,
+    LINT_TAG_RE,
+    Paths,
+    get_paths,
+)
+from file_discovery import listing
+from parallel import parallel_map
+
+# Bump when the checks change (cached results are recomputed).
+LINT_VERSION = 1
+
+_RAW_TEXT_TAGS = ("script", "style", "textarea")
+_RAW_CLOSE_RES = {name: re.compile(rf"</{name}\s*>", re.IGNORECASE) for name in _RAW_TEXT_TAGS}
+_CONTAINMENT_BY_CLASS = {cls: (container, direct) for cls, container, direct in LINT_CONTAINMENT}
+
+
+@dataclass(frozen=True)
+class LintIssue:
+    line: int
+    kind: str  # "unclosed", "stray-close", "containment", "duplicate-id"
+    detail: str  # no line numbers: (kind, detail) is what the baseline compares
+
+    @property
+    def key(self) -> str:
+        return f"{self.kind}: {self.detail}"
+
+
+class _Open(NamedTuple):
+    name: str
+    classes: tuple[str, ...]
+    line: int
+    label: str  # <div class="page-grid"> as it reads in a message
+
+
+@dataclass
+class LintReport:
+    pages: int = 0
+    linted: int = 0  # cache misses (read and checked this run)
+    issues: dict[str, list[LintIssue]] = field(default_factory=dict)  # page -> issues
+    regressions: dict[str, list[LintIssue]] = field(default_factory=dict)  # issues not in the baseline
+    fixed: int = 0  # baseline issues no longer present
+    seconds: float = 0.0
+
+    @property
+    def issue_count(self) -> int:
+        return sum(len(v) for v in self.issues.values())
+
+    @property
+    def regression_count(self) -> int:
+        return sum(len(v) for v in self.regressions.values())
+
+
+def _attr(rx: re.Pattern[str], attrs: str) -> Optional[str]:
+    m = rx.search(attrs)
+    if not m:
+        return None
+    return next(g for g in m.groups() if g is not None)
+
+
+def _label(name: str, classes: tuple[str, ...], element_id: Optional[str]) -> str:
+    if classes:
+        return f'<{name} class="{" ".join(classes)}">'
+    if element_id:
+        return f'<{name} id="{element_id}">'
+    return f"<{name}>"
+
+
+def _matches(el: _Open, container: str) -> bool:
+    return container[1:] in el.classes if container.startswith(".") else el.name == container
+
+
+def lint_html(html: str) -> list[LintIssue]:
+    """
+    Structural issues in one page, in a single forward pass over its tags.
+
+    - tag balance for LINT_BALANCED_TAGS: a close tag with no open element
+      ("stray-close"), or an element left open when an outer one closes or
+      the page ends ("unclosed")
+    - LINT_CONTAINMENT: .page-grid and .category-grid inside <main>, grid
+      slots and category tiles directly in their grid, ad blocks in a slot
+    - ids used more than once
+
+    Comments and <script>/<style>/<textarea> bodies are skipped.
+    """
+    issues: list[LintIssue] = []
+    stack: list[_Open] = []
+    ids: set[str] = set()
+    line, last = 1, 0
+    finditer = LINT_TAG_RE.finditer
+    pos = 0
+    n = len(html)
+    while pos < n:
+        for m in finditer(html, pos):
+            line += html.count("\n", last, m.start())
+            last = m.start()
+            if m.group("comment"):
+                end = html.find("-->", m.end())
+                pos = n if end == -1 else end + 3
+                break
+
+            name = m.group("name").lower()
+            if m.group("close"):
+                if name not in LINT_BALANCED_TAGS:
+                    continue
+                for depth in range(len(stack) - 1, -1, -1):
+                    if stack[depth].name == name:
+                        break
+                else:
+                    issues.append(LintIssue(line, "stray-close", f"</{name}> with no open <{name}>"))
+                    continue
+                # Everything opened inside it and still open is closed by this tag (as a browser would)
+                for el in reversed(stack[depth + 1 :]):
+                    issues.append(LintIssue(el.line, "unclosed", f"{el.label} not closed before </{name}>"))
+                del stack[depth:]
+                continue
+
+            attrs = m.group("attrs")
+            element_id = _attr(LINT_ID_RE, attrs) if "id" in attrs else None
+            if element_id:
+                if element_id in ids:
+                    issues.append(LintIssue(line, "duplicate-id", f'id "{element_id}" used again'))
+                else:
+                    ids.add(element_id)
+            class_value = _attr(LINT_CLASS_RE, attrs) if "class" in attrs else None
+            classes = tuple(class_value.split()) if class_value else ()
+            el = _Open(name, classes, line, _label(name, classes, element_id))
+
+            for cls in classes:
+                rule = _CONTAINMENT_BY_CLASS.get(cls)
+                if rule is None:
+                    continue
+                container, direct = rule
+                ok = (stack and _matches(stack[-1], container)) if direct else any(
+                    _matches(a, container) for a in stack
+                )
+                if not ok:
+                    where = "directly inside" if direct else "inside"
+                    parent = f" (parent: {stack[-1].label})" if direct and stack else ""
+                    issues.append(LintIssue(line, "containment", f"{el.label} not {where} {container}{parent}"))
+
+            if name in _RAW_CLOSE_RES:
+                close = _RAW_CLOSE_RES[name].search(html, m.end())
+                pos = n if close is None else close.end()
+                break
+            if name in LINT_BALANCED_TAGS and not attrs.endswith("/"):
+                stack.append(el)
+        else:
+            break
+
+    for el in reversed(stack):
+        issues.append(LintIssue(el.line, "unclosed", f"{el.label} never closed"))
+    return issues
+
+
+def lint_page(path: Path) -> tuple[str, list[LintIssue]]:
+    # Worker: (sha256, issues) for one page
+    data = path.read_bytes()
+    return sha256_bytes(data), lint_html(data.decode("utf-8", errors="replace"))
+
+
+def _settings_key() -> str:
+    # Cached results are only reused under the same checks
+    blob = json.dumps([LINT_VERSION, sorted(LINT_BALANCED_TAGS), LINT_CONTAINMENT])
+    return sha256_bytes(blob.encode("utf-8"))[:16]
+
+
+def _issues_from_json(rows: list) -> list[LintIssue]:
+    return [LintIssue(int(line), str(kind), str(detail)) for line, kind, detail in rows]
+
+
+def _load_cache(path: Path) -> dict[str, tuple[str, list[LintIssue]]]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("settings") != _settings_key():
+        return {}
+    out: dict[str, tuple[str, list[LintIssue]]] = {}
+    for rel, d in (data.get("pages") or {}).items():
+        try:
+            out[rel] = (d["sha256"], _issues_from_json(d["issues"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return out
+
+
+def _save_cache(path: Path, pages: dict[str, tuple[str, list[LintIssue]]]) -> None:
+    data = {
+        "settings": _settings_key(),
+        "pages": {
+            rel: {"sha256": sha, "issues": [[i.line, i.kind, i.detail] for i in issues]}
+            for rel, (sha, issues) in sorted(pages.items())
+        },
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+
+
+def load_baseline(path: Path) -> dict[str, Counter]:
+    # page -> Counter of issue keys; missing file = no known issues
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return {rel: Counter(keys) for rel, keys in (data.get("pages") or {}).items()}
+
+
+def save_baseline(path: Path, issues: dict[str, list[LintIssue]]) -> None:
+    pages = {rel: dict(sorted(Counter(i.key for i in v).items())) for rel, v in sorted(issues.items()) if v}
+    data = {"version": LINT_VERSION, "pages": pages}
+    path.write_text(json.dumps(data, indent=1, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+def lint_site(
+    paths: Paths,
+    jobs: int = 1,
+    files: Optional[list[Path]] = None,
+    use_cache: bool = True,
+) -> LintReport:
+    """
+    Lint every page (or just `files`) and compare against the committed baseline.
+
+    Only pages whose sha256 changed since the last run are read and checked
+    (across `jobs` workers); the rest reuse their cached issues. An issue is a
+    regression when a page has more of it than the baseline records, so known
+    problems do not fail the build but a new stray </div> does.
+    """
+    t0 = time.perf_counter()
+    repo_root = paths.repo_root
+    report = LintReport()
+    partial_run = files is not None
+    if files is None:
+        files = listing(repo_root).with_suffix([".html"])
+    report.pages = len(files)
+
+    cached = _load_cache(paths.lint_cache_path) if use_cache else {}
+    results: dict[str, tuple[str, list[LintIssue]]] = {}
+    misses: list[Path] = []
+    for p in files:
+        rel = p.relative_to(repo_root).as_posix()
+        hit = cached.get(rel)
+        if hit is not None and hit[0] == sha256_bytes(p.read_bytes()):
+            results[rel] = hit
+        else:
+            misses.append(p)
+    for p, result in zip(misses, parallel_map(lint_page, misses, jobs=jobs)):
+        results[p.relative_to(repo_root).as_posix()] = result
+    report.linted = len(misses)
+
+    baseline = load_baseline(paths.lint_baseline_path)
+    for rel in sorted(results):
+        issues = results[rel][1]
+        if issues:
+            report.issues[rel] = issues
+        known = Counter(baseline.get(rel, {}))
+        seen: Counter = Counter()
+        new: list[LintIssue] = []
+        for i in issues:
+            seen[i.key] += 1
+            if seen[i.key] > known[i.key]:
+                new.append(i)
+        if new:
+            report.regressions[rel] = new
+        report.fixed += sum((known - seen).values())
+
+    if use_cache:
+        # Keep entries for pages outside `files` so a partial run does not evict them
+        merged = {**cached, **results} if partial_run else results
+        _save_cache(paths.lint_cache_path, merged)
+    report.seconds = time.perf_counter() - t0
+    return report
+
+
+def format_report(report: LintReport, limit: int = 20) -> list[str]:
+    lines = [
+        f"Linted {report.pages} page(s) ({report.linted} checked, {report.pages - report.linted} cached) "
+        f"in {report.seconds:.2f} s: {report.issue_count} issue(s) on {len(report.issues)} page(s), "
+        f"{report.regression_count} new",
+    ]
+    shown = 0
+    for rel, issues in report.regressions.items():
+        for i in issues:
+            if shown == limit:
+                lines.append(f"    ... {report.regression_count - limit} more")
+                return lines
+            lines.append(f"    {rel}:{i.line} {i.kind}: {i.detail}")
+            shown += 1
+    if report.fixed:
+        lines.append(f"- {report.fixed} baseline issue(s) fixed (run html_lint.py --update-baseline)")
+    return lines
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Check tag balance, grid and ad-block containment, and duplicate ids on every page."
+    )
+    parser.add_argument("files", nargs="*", type=Path, help="Pages to lint (default: every .html page).")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes (0 = one per CPU). Default: 1",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=20,
+        help="New issues listed (all are counted). Default: 20",
+    )
+    parser.add_argument("--all", action="store_true", help="List every issue, not only those missing from the baseline.")
+    parser.add_argument("--no-cache", action="store_true", help="Re-check every page (the cache is not used or updated).")
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Record the current issues as known (tools/html-lint-baseline.json) and exit 0.",
+    )
+    args = parser.parse_args()
+
+    repo_root = Path(__file__).resolve().parent.parent
+    paths = get_paths(repo_root)
+    files = None
+    if args.files:
+        if args.update_baseline:
+            print("ERROR: --update-baseline records the whole site; do not pass files.")
+            return 1
+        files = [p.resolve() for p in args.files]
+        outside = [p for p in files if repo_root not in p.parents]
+        if outside:
+            print(f"ERROR: not inside the repository: {outside[0]}")
+            return 1
+
+    report = lint_site(paths, jobs=args.jobs, files=files, use_cache=not args.no_cache)
+    if args.update_baseline:
+        save_baseline(paths.lint_baseline_path, report.issues)
+        print(f"Baseline written: {report.issue_count} issue(s) on {len(report.issues)} page(s)")
+        return 0
+
+    for line in format_report(report, args.limit):
+        print(line)
+    if args.all:
+        for rel, issues in report.issues.items():
+            for i in issues:
+                print(f"  {rel}:{i.line} {i.kind}: {i.detail}")
+    return 1 if report.regression_count else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterator, NamedTuple, Optional, Pattern, Sequence
+
+from calculators_config import CATEGORY_GRID_CLOSE, CATEGORY_GRID_OPEN, MAIN_CLOSE
+
+# Elements whose content is raw text: tags inside them are not real tags
+RAW_TEXT_TAGS = ("script", "style")
+
+_COMMENT_CLOSE = "-->"
+_RAW_CLOSE_RES = {name: re.compile(rf"</{name}\s*>", re.IGNORECASE) for name in RAW_TEXT_TAGS}
+
+# First window (chars before </main>) searched for the category grid's </div>
+_GRID_CLOSE_WINDOW = 4096
+
+
+class Tag(NamedTuple):
+    # A NamedTuple rather than a dataclass: one is built per scanned tag.
+    start: int  # index of '<'
+    end: int  # index just past '>'
+    name: str  # lowercased
+    closing: bool
+
+
+@dataclass(frozen=True)
+class Region:
+    # An element: open tag [open_start, open_end), content, close tag [close_start, close_end)
+    open_start: int
+    open_end: int
+    close_start: int
+    close_end: int
+
+
+def _token_re(names: Sequence[str]) -> Pattern[str]:
+    # Next comment, raw-text element or tag named in `names`. The leading literal
+    # '<' lets sre skip plain text in C; every other tag is never surfaced.
+    # m.lastgroup is "comment", "raw", "open" or "close", so one call classifies a match.
+    wanted = "|".join(re.escape(n) for n in names)
+    raw = "|".join(RAW_TEXT_TAGS)
+    return re.compile(
+        rf"<(?:(?P<comment>!--)|(?P<raw>{raw})\b[^>]*>|(?P<open>{wanted})\b[^>]*>|/(?P<close>{wanted})\b[^>]*>)",
+        re.IGNORECASE,
+    )
+
+
+_TOKEN_RES: dict[tuple[str, ...], Pattern[str]] = {}
+
+
+def _token_re_for(names: Sequence[str]) -> Pattern[str]:
+    key = tuple(n.lower() for n in names)
+    rx = _TOKEN_RES.get(key)
+    if rx is None:
+        rx = _TOKEN_RES[key] = _token_re(key)
+    return rx
+
+
+def _tag_matches(html: str, names: Sequence[str], pos: int, endpos: Optional[int]) -> Iterator[re.Match[str]]:
+    # Matches whose lastgroup is "open" or "close"; comments and raw text are
+    # skipped by restarting finditer past them. Match objects are yielded as-is
+    # because building anything per tag roughly doubles the cost of a scan.
+    finditer = _token_re_for(names).finditer
+    if endpos is None:
+        endpos = len(html)
+    while True:
+        for m in finditer(html, pos, endpos):
+            kind = m.lastgroup
+            if kind == "open" or kind == "close":
+                yield m
+                continue
+            if kind == "comment":
+                end = html.find(_COMMENT_CLOSE, m.end(), endpos)
+                if end == -1:
+                    return
+                pos = end + len(_COMMENT_CLOSE)
+            else:
+                close = _RAW_CLOSE_RES[m.group("raw").lower()].search(html, m.end(), endpos)
+                if not close:
+                    return
+                pos = close.end()
+            break
+        else:
+            return
+
+
+def iter_tags(html: str, names: Sequence[str], pos: int = 0, endpos: Optional[int] = None) -> Iterator[Tag]:
+    """
+    Yield the open/close tags named in `names` within html[pos:endpos], in order.
+
+    One forward pass, no lowercased or sliced copies of the page: comments and
+    <script>/<style> bodies are jumped over, so markup inside them is ignored.
+    An unterminated comment or raw-text element ends the scan (as it would in
+    a browser, everything after it is not markup).
+    """
+    for m in _tag_matches(html, names, pos, endpos):
+        kind = m.lastgroup
+        yield Tag(m.start(), m.end(), m.group(kind).lower(), kind == "close")
+
+
+def matching_close(html: str, open_end: int, name: str = "div", endpos: Optional[int] = None) -> Optional[Tag]:
+    # Close tag matching the <name ...> that ended at open_end (depth counted), or None.
+    depth = 1
+    for m in _tag_matches(html, (name,), open_end, endpos):
+        if m.lastgroup == "open":
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 0:
+            return Tag(m.start(), m.end(), name.lower(), True)
+    return None
+
+
+def find_elements(
+    html: str,
+    name: str,
+    is_target: Callable[[str], bool],
+    limit: Optional[int] = None,
+) -> list[Region]:
+    """
+    Regions of the first `limit` <name> elements whose open tag text satisfies is_target.
+
+    Nesting aware: inner </name> tags do not end a region. Targets nested in a
+    target are not reported separately.
+    """
+    regions: list[Region] = []
+    depth = 0
+    current: Optional[re.Match[str]] = None
+    current_depth = 0
+    for m in _tag_matches(html, (name,), 0, None):
+        if m.lastgroup == "open":
+            depth += 1
+            if current is None and is_target(m.group(0)):
+                current, current_depth = m, depth
+            continue
+        if depth:
+            depth -= 1
+        if current is not None and depth == current_depth - 1:
+            regions.append(Region(current.start(), current.end(), m.start(), m.end()))
+            current = None
+            if limit is not None and len(regions) >= limit:
+                break
+    return regions
+
+
+def find_category_grid(html: str) -> Region:
+    """
+    Bounds of <div class="category-grid"> on a category page.
+
+    The grid closes at the second-last </div> before </main> (the last one
+    closes the content block that follows the grid). Unlike depth counting,
+    this holds when hand-edited tiles leave a stray </div>, so the whole old
+    grid is still replaced. The closes are searched backwards from </main> in
+    a window that doubles until it holds two, so only the tail of the page is
+    scanned, not every tile.
+    """
+    open_match = CATEGORY_GRID_OPEN.search(html)
+    if not open_match:
+        raise ValueError('Could not find <div class="category-grid"> in category page.')
+    open_end = open_match.end()
+
+    main_match = MAIN_CLOSE.search(html, open_end)
+    if not main_match:
+        raise ValueError("Could not find </main> after category-grid open.")
+    main_close = main_match.start()
+
+    # A </div> can't straddle the window start and still be one of the last two
+    # closes: matches start with '<' and contain no other '<'.
+    window = _GRID_CLOSE_WINDOW
+    while True:
+        lo = max(open_end, main_close - window)
+        last: Optional[re.Match[str]] = None
+        second_last: Optional[re.Match[str]] = None
+        for m in CATEGORY_GRID_CLOSE.finditer(html, lo, main_close):
+            second_last, last = last, m
+        if second_last is not None:
+            return Region(open_match.start(), open_end, second_last.start(), second_last.end())
+        if lo == open_end:
+            raise ValueError("Not enough </div> tags between category-grid and </main> to identify grid close.")
+        window *= 2
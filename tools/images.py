@@ -0,0 +1,305 @@
+from __future__ import annotations
+
+import io
+import json
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from build_manifest import sha256_bytes
+from calculators_config import IMAGE_QUALITY, IMAGE_SOURCE_EXTS, IMAGE_WIDTHS, Paths
+from file_discovery import listing, walk
+from output_stage import OutputStage
+from utils import escape_html
+
+try:
+    from PIL import Image, ImageOps  # optional: pip install Pillow
+except ImportError:  # pragma: no cover - depends on the environment
+    Image = None
+    ImageOps = None
+
+if Image is not None:
+    try:
+        import pillow_avif  # noqa: F401  AVIF for Pillow < 11.2 (pip install pillow-avif-plugin)
+    except ImportError:  # pragma: no cover - depends on the environment
+        pass
+
+# Bump when the manifest layout or the encoding changes; every image is re-processed.
+IMAGE_MANIFEST_VERSION = 1
+
+MIME = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg", "png": "image/png"}
+EXT = {"avif": ".avif", "webp": ".webp", "jpeg": ".jpg", "png": ".png"}
+
+
+@dataclass(frozen=True)
+class ImageVariant:
+    url: str
+    width: int
+    format: str  # key of MIME
+
+
+@dataclass(frozen=True)
+class ImageInfo:
+    url: str  # the source image as pages reference it (/assets/...)
+    width: int
+    height: int
+    sha256: str
+    variants: tuple[ImageVariant, ...] = ()
+
+    def srcset(self, fmt: str) -> str:
+        return ", ".join(f"{v.url} {v.width}w" for v in self.variants if v.format == fmt)
+
+
+@dataclass(frozen=True)
+class ImagesResult:
+    images: int
+    processed: int  # sources (re-)encoded this build
+    reused: int  # unchanged sources, variants kept
+    written: int  # variant files written
+    removed: int  # stale variant files deleted
+    formats: tuple[str, ...]  # formats produced ("" when Pillow is missing)
+
+
+def available_formats() -> tuple[str, ...]:
+    # Modern formats this Pillow can encode, best first; empty without Pillow
+    if Image is None:
+        return ()
+    Image.init()
+    return tuple(f for f in ("avif", "webp") if f.upper() in Image.SAVE)
+
+
+def image_size(data: bytes) -> Optional[tuple[int, int]]:
+    """
+    (width, height) from a PNG or JPEG header, without decoding the image.
+
+    Used when Pillow is missing; EXIF orientation is not applied.
+    """
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR":
+        return struct.unpack(">II", data[16:24])
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:  # no length field
+            i += 2
+            continue
+        (length,) = struct.unpack(">H", data[i + 2 : i + 4])
+        # SOF0-SOF15 carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) share the range
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[i + 5 : i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def variant_widths(src_width: int, widths: tuple[int, ...] = IMAGE_WIDTHS) -> list[int]:
+    # Configured widths below the source, plus the source width itself (never upscaled)
+    return [w for w in widths if w < src_width] + [src_width]
+
+
+def _settings_key(widths: tuple[int, ...]) -> str:
+    # Stored per image: changing widths or quality re-encodes everything. Deliberately
+    # not whether Pillow is installed (or which formats it has): a build without it
+    # must still recognise the entries a Pillow build made.
+    blob = json.dumps([IMAGE_MANIFEST_VERSION, widths, IMAGE_QUALITY])
+    return sha256_bytes(blob.encode("utf-8"))[:16]
+
+
+def _encode(im, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    if fmt == "png":
+        im.save(buf, "PNG", optimize=True)
+    elif fmt == "jpeg":
+        im.convert("RGB").save(buf, "JPEG", quality=IMAGE_QUALITY["jpeg"], optimize=True, progressive=True)
+    elif fmt == "webp":
+        im.save(buf, "WEBP", quality=IMAGE_QUALITY["webp"], method=6)
+    else:
+        im.save(buf, fmt.upper(), quality=IMAGE_QUALITY[fmt])
+    return buf.getvalue()
+
+
+def _process(
+    src: Path,
+    data: bytes,
+    rel: str,
+    paths: Paths,
+    formats: tuple[str, ...],
+    widths: tuple[int, ...],
+    out: OutputStage,
+) -> tuple[int, int, list[ImageVariant], int]:
+    # (width, height, variants, files written) for one source image
+    source_fmt = "png" if src.suffix.lower() == ".png" else "jpeg"
+    out_dir = paths.image_variants_dir / Path(rel).parent
+
+    with Image.open(io.BytesIO(data)) as opened:
+        im = ImageOps.exif_transpose(opened)
+        im.load()
+    src_w, src_h = im.size
+
+    variants: list[ImageVariant] = []
+    written = 0
+    for w in variant_widths(src_w, widths):
+        resized = im if w == src_w else im.resize((w, max(1, round(src_h * w / src_w))), Image.LANCZOS)
+        for fmt in (*formats, source_fmt):
+            payload = _encode(resized, fmt)
+            if fmt == source_fmt and w == src_w and len(payload) >= len(data):
+                payload = data  # re-encoding did not help; ship the original bytes
+            target = out_dir / f"{src.stem}-{w}w{EXT[fmt]}"
+            written += out.write_bytes(target, payload)
+            variants.append(ImageVariant("/" + target.relative_to(paths.repo_root).as_posix(), w, fmt))
+    return src_w, src_h, variants, written
+
+
+def _info_from_json(url: str, d: dict) -> ImageInfo:
+    return ImageInfo(
+        url=url,
+        width=int(d["width"]),
+        height=int(d["height"]),
+        sha256=str(d["sha256"]),
+        variants=tuple(ImageVariant(v["url"], int(v["width"]), v["format"]) for v in d.get("variants", [])),
+    )
+
+
+def load_image_manifest(path: Path) -> dict[str, ImageInfo]:
+    # url -> ImageInfo; empty when the images stage has not run (builders fall back to a plain <img>)
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != IMAGE_MANIFEST_VERSION:
+        return {}
+    out: dict[str, ImageInfo] = {}
+    for url, d in (data.get("images") or {}).items():
+        try:
+            out[url] = _info_from_json(url, d)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return out
+
+
+def optimize_images(paths: Paths, widths: tuple[int, ...] = IMAGE_WIDTHS, *, out: OutputStage) -> ImagesResult:
+    """
+    Images stage: record dimensions for every JPEG/PNG under assets/ and, with
+    Pillow, write resized AVIF/WebP/re-encoded variants to assets/optimized/.
+
+    A source whose sha256 and encoder settings match the manifest, and whose
+    variants are all on disk, is not decoded again; with Pillow, it is also
+    re-encoded when Pillow can now write formats it could not before.
+
+    Without Pillow nothing is encoded and no variant is deleted: an entry whose
+    source is unchanged is kept with its variants even if the settings moved on,
+    and a new or changed source only gets its dimensions (read from the file
+    header), which is enough for width/height attributes. assets/optimized/ and
+    the manifest are committed, since Vercel builds run without Pillow; run a
+    build with Pillow locally after adding or changing images.
+    Variants and the manifest are staged in `out`.
+    """
+    formats = available_formats()
+    settings = _settings_key(widths)
+    try:
+        previous = json.loads(paths.image_manifest_path.read_text(encoding="utf-8"))
+        if previous.get("version") != IMAGE_MANIFEST_VERSION:
+            previous = {}
+    except (OSError, ValueError, AttributeError):
+        previous = {}
+    prev_images: dict = previous.get("images") or {}
+
+    variants_rel = paths.image_variants_dir.relative_to(paths.assets_dir).as_posix() + "/"
+    sources = [
+        p
+        for p in listing(paths.assets_dir).with_suffix(IMAGE_SOURCE_EXTS)
+        if not p.relative_to(paths.assets_dir).as_posix().startswith(variants_rel)
+    ]
+
+    images: dict[str, dict] = {}
+    processed = reused = written = 0
+    for src in sources:
+        rel = src.relative_to(paths.assets_dir).as_posix()
+        url = "/" + src.relative_to(paths.repo_root).as_posix()
+        data = src.read_bytes()
+        digest = sha256_bytes(data)
+
+        prev = prev_images.get(url)
+        if (
+            prev
+            and prev.get("sha256") == digest
+            and (Image is None or (prev.get("settings") == settings and prev.get("formats") == list(formats)))
+            and all(out.exists(paths.repo_root / v["url"].lstrip("/")) for v in prev.get("variants", []))
+        ):
+            images[url] = prev
+            reused += 1
+            continue
+
+        if Image is not None:
+            try:
+                w, h, variants, n = _process(src, data, rel, paths, formats, widths, out)
+            except OSError as e:  # unreadable or truncated image: keep going, record nothing
+                print(f"WARNING: cannot process {url}: {e}")
+                continue
+            written += n
+        else:
+            size = image_size(data)
+            if size is None:
+                print(f"WARNING: cannot read the dimensions of {url}")
+                continue
+            (w, h), variants = size, []
+        processed += 1
+        images[url] = {
+            "sha256": digest,
+            "settings": settings,
+            "formats": list(formats),
+            "width": w,
+            "height": h,
+            "variants": [{"url": v.url, "width": v.width, "format": v.format} for v in variants],
+        }
+
+    # Variant files no longer listed (source removed, renamed or re-encoded at other widths).
+    # Only a build that can re-encode prunes; without Pillow they stay for the next one.
+    removed = 0
+    if Image is not None:
+        live = {v["url"] for d in images.values() for v in d["variants"]}
+        on_disk = walk(paths.image_variants_dir)  # uncached: an earlier run may have just written there
+        for p in on_disk.paths(on_disk.files):
+            if "/" + p.relative_to(paths.repo_root).as_posix() not in live:
+                removed += out.remove(p)
+
+    manifest = {"version": IMAGE_MANIFEST_VERSION, "images": dict(sorted(images.items()))}
+    out.write_text(paths.image_manifest_path, json.dumps(manifest, indent=1) + "\n")
+    return ImagesResult(len(images), processed, reused, written, removed, formats)
+
+
+def img_attrs(info: Optional[ImageInfo]) -> str:
+    # Intrinsic size (reserves the box, no layout shift) plus lazy loading for below-the-fold slots
+    size = f' width="{info.width}" height="{info.height}"' if info else ""
+    return f'{size} loading="lazy" decoding="async"'
+
+
+def picture_html(src: str, alt: str, info: Optional[ImageInfo], sizes: str, indent: str = "  ") -> str:
+    """
+    <picture> with AVIF/WebP sources and a srcset'd fallback <img>, or a plain
+    <img> (still sized and lazy) when there are no variants for src.
+    """
+    alt = escape_html(alt)
+    if info is None or not info.variants:
+        return f'{indent}<img src="{src}" alt="{alt}"{img_attrs(info)}>\n'
+
+    lines = [f"{indent}<picture>\n"]
+    for fmt in ("avif", "webp"):
+        srcset = info.srcset(fmt)
+        if srcset:
+            lines.append(f'{indent}  <source type="{MIME[fmt]}" srcset="{srcset}" sizes="{sizes}">\n')
+    fallback_fmt = next(v.format for v in info.variants if v.format in ("jpeg", "png"))
+    # src stays the source image: it is what fill_affiliates.py reads back on --refresh-images
+    lines.append(
+        f'{indent}  <img src="{src}" srcset="{info.srcset(fallback_fmt)}" sizes="{sizes}" '
+        f'alt="{alt}"{img_attrs(info)}>\n'
+    )
+    lines.append(f"{indent}</picture>\n")
+    return "".join(lines)
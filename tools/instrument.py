@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import cProfile
+import io
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator, Optional
+
+try:
+    import resource  # Unix only
+except ImportError:  # pragma: no cover - depends on the platform
+    resource = None
+
+# Linux exposes per-process I/O byte counts (including reaped pool workers) and a
+# resettable peak RSS; elsewhere those columns are reported as "-".
+_PROC_IO = Path("/proc/self/io")
+_PROC_STATUS = Path("/proc/self/status")
+_PROC_CLEAR_REFS = Path("/proc/self/clear_refs")
+
+# (seconds, stage, label) per parallel_map item while a FileTimings collector is active
+_active_timings: Optional["FileTimings"] = None
+
+# Stage name parallel_map items are attributed to in FileTimings
+_current_stage = ""
+
+
+def _proc_io() -> Optional[tuple[int, int]]:
+    # (rchar, wchar): bytes passed through read()/write() calls, page cache hits included
+    try:
+        fields = dict(line.split(": ", 1) for line in _PROC_IO.read_text().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _reset_peak_rss() -> bool:
+    # Writing 5 to clear_refs resets VmHWM (Linux 4.0+)
+    try:
+        _PROC_CLEAR_REFS.write_text("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss(reset_ok: bool) -> Optional[int]:
+    if reset_ok:
+        try:
+            for line in _PROC_STATUS.read_text().splitlines():
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+    # Lifetime peak only (not per stage)
+    return _maxrss("RUSAGE_SELF")
+
+
+def _maxrss(who: str) -> Optional[int]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(getattr(resource, who)).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+@dataclass
+class StageStats:
+    name: str
+    wall_s: float = 0.0
+    bytes_read: Optional[int] = None
+    bytes_written: Optional[int] = None
+    # Set by the caller: pages parsed, pages rewritten, files edited, ...
+    files: int = 0
+    peak_rss: Optional[int] = None
+    # Set when a worker process reached a new peak during the stage
+    worker_peak_rss: Optional[int] = None
+
+
+class Instrument:
+    """
+    Per-stage wall time, I/O bytes, files touched and peak memory.
+
+        inst = Instrument()
+        with inst.stage("parse") as st:
+            scan = ...
+            st.files = scan.reparsed
+        for line in inst.report_lines():
+            print(line)
+
+    Byte counts include worker processes once they have exited, which
+    parallel_map guarantees by the end of each call.
+    """
+
+    def __init__(self) -> None:
+        self.stages: list[StageStats] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        st = StageStats(name)
+        io_before = _proc_io()
+        reset_ok = _reset_peak_rss()
+        children_before = _maxrss("RUSAGE_CHILDREN")
+        global _current_stage
+        outer, _current_stage = _current_stage, name
+        t0 = time.perf_counter()
+        try:
+            yield st
+        finally:
+            st.wall_s = time.perf_counter() - t0
+            _current_stage = outer
+            io_after = _proc_io()
+            if io_before is not None and io_after is not None:
+                st.bytes_read = io_after[0] - io_before[0]
+                st.bytes_written = io_after[1] - io_before[1]
+            st.peak_rss = _peak_rss(reset_ok)
+            children_after = _maxrss("RUSAGE_CHILDREN")
+            if children_after is not None and children_before is not None and children_after > children_before:
+                st.worker_peak_rss = children_after
+            self.stages.append(st)
+
+    def report_lines(self) -> list[str]:
+        def size(n: Optional[int]) -> str:
+            if n is None:
+                return "-"
+            if n < 1024 * 1024:
+                return f"{n / 1024:.1f} KB"
+            return f"{n / (1024 * 1024):.1f} MB"
+
+        lines = [f"  {'stage':<18}{'wall ms':>10}{'read':>11}{'written':>11}{'files':>7}{'peak rss':>11}{'workers':>10}"]
+        for s in self.stages:
+            lines.append(
+                f"  {s.name:<18}{s.wall_s * 1000:>10.1f}{size(s.bytes_read):>11}{size(s.bytes_written):>11}"
+                f"{s.files:>7}{size(s.peak_rss):>11}{size(s.worker_peak_rss):>10}"
+            )
+        lines.append(f"  {'total':<18}{sum(s.wall_s for s in self.stages) * 1000:>10.1f}")
+        return lines
+
+
+@dataclass
+class FileTimings:
+    # Per-item times from parallel_map (in workers too), labelled by the item's path.
+    entries: list[tuple[float, str, str]] = field(default_factory=list)
+
+    def add(self, seconds: float, label: str) -> None:
+        self.entries.append((seconds, _current_stage, label))
+
+    def slowest(self, n: int) -> list[tuple[float, str, str]]:
+        return sorted(self.entries, key=lambda e: e[0], reverse=True)[:n]
+
+
+def active_file_timings() -> Optional[FileTimings]:
+    return _active_timings
+
+
+def item_label(item: object) -> str:
+    # A path for the usual parallel_map items: Path, or a tuple/list starting with one
+    if isinstance(item, (tuple, list)) and item and isinstance(item[0], Path):
+        item = item[0]
+    if isinstance(item, Path):
+        return item.as_posix()
+    text = repr(item)
+    return text if len(text) <= 80 else text[:77] + "..."
+
+
+def default_profile_path(repo_root: Path, tool: str) -> Path:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+    return repo_root / "tools" / ".cache" / "profile" / f"{tool}-{stamp}.pstats"
+
+
+class Profiler:
+    """
+    Opt-in --profile: cProfile over the run plus per-file timings from parallel_map.
+
+    stop() writes the pstats dump to `path` and the slowest-N files next to it
+    (<name>.slowest.txt), and returns the lines to print. cProfile only sees
+    the main process; per-file timings cover workers too.
+    """
+
+    def __init__(self, path: Path, repo_root: Path, top: int = 20) -> None:
+        self.path = path
+        self.repo_root = repo_root
+        self.top = top
+        self.timings = FileTimings()
+        self._profile = cProfile.Profile()
+
+    def start(self) -> None:
+        global _active_timings
+        _active_timings = self.timings
+        self._profile.enable()
+
+    def stop(self) -> list[str]:
+        global _active_timings
+        self._profile.disable()
+        _active_timings = None
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._profile.dump_stats(str(self.path))
+
+        lines = [f"Profile: {self.path}  (python -m pstats {self.path})"]
+        buf = io.StringIO()
+        pstats.Stats(self._profile, stream=buf).sort_stats("cumulative").print_stats(self.top)
+        lines += ["  " + line for line in buf.getvalue().splitlines() if line.strip()]
+
+        slowest = self.timings.slowest(self.top)
+        if slowest:
+            rows = [f"  {'ms':>9}  {'stage':<18}file"]
+            for seconds, stage, label in slowest:
+                rows.append(f"  {seconds * 1000:>9.2f}  {stage:<18}{self._rel(label)}")
+            slowest_path = self.path.with_suffix(".slowest.txt")
+            slowest_path.write_text("\n".join(rows) + "\n", encoding="utf-8")
+            lines.append(f"Slowest {len(slowest)} of {len(self.timings.entries)} file(s): {slowest_path}")
+            lines += rows
+        return lines
+
+    def _rel(self, label: str) -> str:
+        try:
+            return Path(label).relative_to(self.repo_root).as_posix()
+        except ValueError:
+            return label
+
+
+def cpu_note(jobs: int) -> Optional[str]:
+    # cProfile cannot see into worker processes
+    if jobs != 1:
+        return f"Note: --jobs {jobs}: the call profile covers the main process only; use --jobs 1 for a full profile."
+    return None
@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# Bump when the tokenizer or the output changes (cached minified scripts are keyed by it).
+JSMIN_VERSION = 2
+
+# Token kinds
+WORD = "word"  # identifier, keyword or number
+PUNCT = "punct"
+STRING = "string"  # '...', "..." or a whole `template` (expressions inside are kept verbatim)
+REGEX = "regex"
+
+_WORD_RE = re.compile(r"(?:[A-Za-z0-9_$\u0080-\uffff]|\\u[0-9A-Fa-f]{4}|\\u\{[0-9A-Fa-f]+\})+")
+# Numbers need their own pattern: "1.5e-3", ".5", "0x1F", "1_000n"
+# (prefixed integers first, or the decimal alternative would stop at the "0" of "0x1F")
+_NUMBER_RE = re.compile(r"0[xXoObB][0-9A-Fa-f_]+n?|(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d[\d_]*)?n?")
+# Longest first
+_PUNCT_RE = re.compile(
+    r">>>=|\.\.\.|===|!==|\*\*=|<<=|>>=|>>>|&&=|\|\|=|\?\?=|=>|==|!=|<=|>=|&&|\|\||\?\?|\?\.(?!\d)"
+    r"|\+\+|--|\+=|-=|\*=|/=|%=|&=|\|=|\^=|\*\*|<<|>>|[{}()\[\];,<>+\-*/%&|^!~?:=.@#]"
+)
+# Whitespace and comments between two tokens, in one match ("//" and "/*" can never start a regex)
+_GAP_RE = re.compile(r"(?:[ \t\f\v\u00a0\ufeff\n\r\u2028\u2029]+|//[^\n\r\u2028\u2029]*|/\*.*?\*/)+", re.DOTALL)
+_NEWLINE_RE = re.compile(r"[\n\r\u2028\u2029]")
+
+# After these words a "/" starts a regex, not a division
+_REGEX_AFTER_WORDS = frozenset(
+    "return typeof instanceof in of new delete void throw case do else yield await".split()
+)
+# A newline after one of these punctuators can never end a statement (no ASI), so it can go
+_JOINS_NEXT = frozenset(
+    "{ ( [ , ; : = ? ! ~ + - * / % & | ^ < > ... => == === != !== <= >= && || ?? ?. ** << >> >>> "
+    "+= -= *= /= %= &= |= ^= **= <<= >>= >>>= &&= ||= ??=".split()
+)
+# ...and a newline before one of these never lets ASI insert a semicolon it would not otherwise
+_JOINS_PREV = frozenset(") ] } , ; .".split())
+
+
+class JSSyntaxError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Token:
+    kind: str
+    text: str
+    start: int  # offsets in the source
+    end: int
+    newline_before: bool  # a line break (or a multi-line comment) separates it from the previous token
+    space_before: bool
+
+
+def _is_word_char(c: str) -> bool:
+    return c.isalnum() or c in "_$\\" or c >= "\u0080"
+
+
+def _regex_allowed(prev: Optional[Token], before_prev: Optional[Token]) -> bool:
+    if prev is None:
+        return True
+    if prev.kind == PUNCT:
+        return prev.text not in (")", "]", "}")
+    if prev.kind == WORD:
+        # x.return / 2 is a property, not the keyword
+        return prev.text in _REGEX_AFTER_WORDS and not (before_prev is not None and before_prev.text == ".")
+    return False
+
+
+def _skip_string(src: str, i: int) -> int:
+    # i at the opening quote; returns the index after the closing one
+    quote = src[i]
+    i += 1
+    n = len(src)
+    while i < n:
+        c = src[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == quote:
+            return i + 1
+        if c in "\n\r":
+            break
+        i += 1
+    raise JSSyntaxError(f"unterminated string at offset {i}")
+
+
+def _skip_regex(src: str, i: int) -> int:
+    # i at the opening "/"; returns the index after the flags
+    i += 1
+    n = len(src)
+    in_class = False
+    while i < n:
+        c = src[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c in "\n\r":
+            break
+        if c == "[":
+            in_class = True
+        elif c == "]":
+            in_class = False
+        elif c == "/" and not in_class:
+            i += 1
+            while i < n and _is_word_char(src[i]):
+                i += 1
+            return i
+        i += 1
+    raise JSSyntaxError(f"unterminated regex at offset {i}")
+
+
+def _skip_template(src: str, i: int) -> int:
+    # i at the opening backtick; ${...} expressions are skipped as code
+    i += 1
+    n = len(src)
+    while i < n:
+        c = src[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "`":
+            return i + 1
+        if c == "$" and src.startswith("${", i):
+            i = _skip_expression(src, i + 2)
+            continue
+        i += 1
+    raise JSSyntaxError(f"unterminated template literal at offset {i}")
+
+
+def _skip_expression(src: str, i: int) -> int:
+    # Inside ${ ... }: returns the index after the matching "}"
+    depth = 0
+    prev: Optional[Token] = None
+    for tok in _scan(src, i):
+        if tok.kind == PUNCT:
+            if tok.text == "{":
+                depth += 1
+            elif tok.text == "}":
+                if depth == 0:
+                    return tok.end
+                depth -= 1
+        prev = tok
+    raise JSSyntaxError(f"unterminated template expression at offset {prev.end if prev else i}")
+
+
+def _scan(src: str, i: int = 0):
+    n = len(src)
+    prev: Optional[Token] = None
+    before_prev: Optional[Token] = None
+    while True:
+        space = newline = False
+        gap = _GAP_RE.match(src, i)
+        if gap:
+            space = True
+            # A comment spanning lines counts as a line break for ASI
+            newline = _NEWLINE_RE.search(src, i, gap.end()) is not None
+            i = gap.end()
+        if i >= n:
+            return
+        if src.startswith("/*", i):
+            raise JSSyntaxError(f"unterminated comment at offset {i}")
+
+        c = src[i]
+        if c in "'\"":
+            kind, end = STRING, _skip_string(src, i)
+        elif c == "`":
+            kind, end = STRING, _skip_template(src, i)
+        elif c == "/" and _regex_allowed(prev, before_prev):
+            kind, end = REGEX, _skip_regex(src, i)
+        elif c.isdigit() or (c == "." and i + 1 < n and src[i + 1].isdigit()):
+            kind, end = WORD, _NUMBER_RE.match(src, i).end()
+        else:
+            m = _WORD_RE.match(src, i)
+            if m:
+                kind, end = WORD, m.end()
+            else:
+                m = _PUNCT_RE.match(src, i)
+                if not m:
+                    raise JSSyntaxError(f"unexpected character {c!r} at offset {i}")
+                kind, end = PUNCT, m.end()
+
+        before_prev, prev = prev, Token(kind, src[i:end], i, end, newline, space)
+        yield prev
+        i = end
+
+
+def tokenize(src: str) -> list[Token]:
+    """
+    Split JavaScript source into tokens, dropping comments and whitespace.
+
+    Enough of the lexical grammar for minifying hand-written scripts: strings,
+    template literals, regex literals (told apart from division by the
+    previous token), numbers and punctuators. Raises JSSyntaxError on input
+    it cannot tokenize.
+    """
+    return list(_scan(src))
+
+
+def _needs_space(prev: Token, tok: Token) -> bool:
+    a, b = prev.text[-1], tok.text[0]
+    if _is_word_char(a) and _is_word_char(b):
+        return True
+    if a in "+-" and b == a:  # a + +b, a - --b
+        return True
+    if a == "/" and b in "/*":  # x / /re/ must not turn into a comment
+        return True
+    # 1 .toString(): a dot right after an integer would become a decimal point
+    return prev.kind == WORD and prev.text[0].isdigit() and b == "." and not re.search(r"[.eExXoObBn]", prev.text)
+
+
+def join_pieces(tokens: list[Token]) -> list[str]:
+    """
+    Tokens back to source with the least whitespace that keeps the meaning,
+    as one piece per token (its separator, then its text).
+
+    Line breaks are kept wherever automatic semicolon insertion could depend
+    on them; everything else becomes nothing or a single space.
+    """
+    out: list[str] = []
+    prev: Optional[Token] = None
+    for tok in tokens:
+        sep = ""
+        if prev is not None:
+            if tok.newline_before and prev.text not in _JOINS_NEXT and tok.text not in _JOINS_PREV:
+                sep = "\n"
+            elif _needs_space(prev, tok):
+                sep = " "
+        out.append(sep + tok.text)
+        prev = tok
+    return out
+
+
+def join_tokens(tokens: list[Token]) -> str:
+    return "".join(join_pieces(tokens))
+
+
+def minify(src: str) -> str:
+    # Comments dropped, whitespace collapsed; names and code are left as written
+    return join_tokens(tokenize(src))
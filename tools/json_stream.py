@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Iterable, Iterator, Optional
+
+# Chunk generators for writing large JSON outputs one entry at a time
+# (artifacts.write_chunks_if_changed takes them). Joined, the chunks are exactly
+# what json.dumps would have produced for the whole list.
+
+COMPACT = (",", ":")
+
+
+def _encoder(indent: Optional[int], separators: Optional[tuple[str, str]]) -> json.JSONEncoder:
+    return json.JSONEncoder(ensure_ascii=False, indent=indent, separators=separators)
+
+
+def _container(
+    open_: str,
+    close: str,
+    texts: Iterable[str],
+    enc: json.JSONEncoder,
+) -> Iterator[str]:
+    # One chunk per entry; with indent, entries are nested one level deeper
+    pad = "" if enc.indent is None else "\n" + " " * enc.indent
+    first = True
+    for text in texts:
+        if pad:
+            text = text.replace("\n", pad)
+        yield (open_ if first else enc.item_separator) + pad + text
+        first = False
+    if first:
+        yield open_ + close
+    else:
+        yield ("\n" if pad else "") + close
+
+
+def iter_json_array(
+    items: Iterable[Any],
+    indent: Optional[int] = None,
+    separators: Optional[tuple[str, str]] = None,
+) -> Iterator[str]:
+    # json.dumps(list(items), ensure_ascii=False, indent=..., separators=...), lazily
+    enc = _encoder(indent, separators)
+    return _container("[", "]", (enc.encode(item) for item in items), enc)
+
+
+def iter_ndjson(items: Iterable[Any]) -> Iterator[str]:
+    # One compact JSON document per line
+    enc = _encoder(None, COMPACT)
+    for item in items:
+        yield enc.encode(item) + "\n"
@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from html import unescape
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import unquote, urljoin, urlsplit
+
+from build_manifest import sha256_bytes
+from calculators_config import (
+    CANONICAL_RE,
+    LINK_ATTR_RE,
+    LINK_SCAN_RE,
+    REL_CANONICAL_RE,
+    SITE_URL,
+    Paths,
+    get_paths,
+)
+from file_discovery import listing
+from parallel import parallel_map
+
+# Bump when the extraction changes (cached pages are re-read).
+CACHE_VERSION = 1
+
+_RAW_CLOSE_RES = {name: re.compile(rf"</{name}\s*>", re.IGNORECASE) for name in ("script", "style", "textarea")}
+_SITE_ORIGIN = urlsplit(SITE_URL)
+# Not links to pages: in-page anchors and other schemes
+_SKIP_PREFIXES = ("#", "mailto:", "tel:", "javascript:", "data:", "sms:")
+
+
+@dataclass(frozen=True)
+class PageLinks:
+    # One page's extraction, cached by its sha256
+    sha256: str
+    links: tuple[tuple[int, str], ...]  # (line, href as written, entities decoded)
+    canonical: Optional[str]
+
+
+@dataclass(frozen=True)
+class LinkIssue:
+    kind: str  # "broken", "redirect", "canonical", "orphan"
+    page: str  # repo-relative file
+    line: int  # 0 when not tied to a line
+    target: str  # href, canonical or URL
+    detail: str
+
+
+@dataclass
+class LinkReport:
+    pages: int = 0
+    extracted: int = 0  # cache misses (read and scanned this run)
+    links: int = 0  # internal links checked
+    issues: list[LinkIssue] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def count(self, kind: str) -> int:
+        return sum(1 for i in self.issues if i.kind == kind)
+
+
+def page_url(rel: str) -> str:
+    """
+    URL a file is served at under vercel.json's cleanUrls + trailingSlash:
+    calculators/a/b/index.html -> /calculators/a/b/, about.html -> /about/,
+    styles/main.css -> /styles/main.css.
+    """
+    if rel == "index.html":
+        return "/"
+    if rel.endswith("/index.html"):
+        return "/" + rel[: -len("index.html")]
+    if rel.endswith(".html"):
+        return "/" + rel[: -len(".html")] + "/"
+    return "/" + rel
+
+
+def served_urls(repo_root: Path) -> dict[str, str]:
+    # In-memory path index: served URL -> repo-relative file, from the shared listing
+    return {page_url(rel): rel for rel in listing(repo_root).files}
+
+
+def _scan_links(html: str) -> Iterator[tuple[int, str, bool]]:
+    # (offset, raw value, is canonical) per href/src, in one pass; markup inside
+    # comments and <script>/<style>/<textarea> bodies is not looked at
+    finditer = LINK_SCAN_RE.finditer
+    pos = 0
+    while True:
+        for m in finditer(html, pos):
+            if m.group("comment"):
+                end = html.find("-->", m.end())
+                if end == -1:
+                    return
+                pos = end + 3
+                break
+            attrs = m.group("attrs") if m.group("tag") else m.group("raw_attrs")
+            for a in LINK_ATTR_RE.finditer(attrs):
+                value = a.group(1) if a.group(1) is not None else a.group(2)
+                is_canonical = m.group("tag") is not None and m.group("tag").lower() == "link" and bool(
+                    REL_CANONICAL_RE.search(attrs)
+                )
+                yield m.start(), value, is_canonical
+            if m.group("raw"):
+                close = _RAW_CLOSE_RES[m.group("raw").lower()].search(html, m.end())
+                if not close:
+                    return
+                pos = close.end()
+                break
+        else:
+            return
+
+
+def extract_page(path: Path) -> PageLinks:
+    """
+    Worker: every href/src in a page with its line number, plus the canonical
+    URL as CANONICAL_RE (the pattern the build parses) sees it.
+    """
+    data = path.read_bytes()
+    html = data.decode("utf-8", errors="replace")
+    links: list[tuple[int, str]] = []
+    canonical: Optional[str] = None
+    line, last = 1, 0
+    for offset, value, is_canonical in _scan_links(html):
+        line += html.count("\n", last, offset)
+        last = offset
+        if is_canonical:
+            if canonical is None:
+                m = CANONICAL_RE.search(html, offset)
+                canonical = m.group(1) if m and m.start() == offset else unescape(value)
+            continue
+        links.append((line, unescape(value).strip()))
+    return PageLinks(sha256_bytes(data), tuple(links), canonical)
+
+
+def _load_cache(path: Path) -> dict[str, PageLinks]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+        return {}
+    out: dict[str, PageLinks] = {}
+    for rel, d in (data.get("pages") or {}).items():
+        try:
+            out[rel] = PageLinks(d["sha256"], tuple((int(n), str(h)) for n, h in d["links"]), d["canonical"])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return out
+
+
+def _save_cache(path: Path, pages: dict[str, PageLinks]) -> None:
+    data = {
+        "version": CACHE_VERSION,
+        "pages": {
+            rel: {"sha256": p.sha256, "links": [list(link) for link in p.links], "canonical": p.canonical}
+            for rel, p in sorted(pages.items())
+        },
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+
+
+def resolve(href: str, base_url: str) -> Optional[str]:
+    # Site path an internal href points at (query and fragment dropped), or None if external
+    if not href or href.startswith(_SKIP_PREFIXES):
+        return None
+    parts = urlsplit(urljoin(base_url, href))
+    if parts.scheme not in ("", "http", "https"):
+        return None
+    if parts.netloc and parts.netloc.lower() not in (_SITE_ORIGIN.netloc.lower(), "www." + _SITE_ORIGIN.netloc.lower()):
+        return None
+    return unquote(parts.path) or "/"
+
+
+def classify(path: str, urls: dict[str, str]) -> tuple[str, str]:
+    # ("ok" | "redirect" | "broken", where it ends up or why)
+    if path in urls:
+        return "ok", path
+    if not path.endswith("/") and path + "/" in urls:
+        return "redirect", path + "/"  # trailingSlash: 308 to the slash form
+    if path.endswith(".html") and page_url(path.lstrip("/")) in urls:
+        return "redirect", page_url(path.lstrip("/"))  # cleanUrls: 308 to the clean form
+    return "broken", "no such page or file"
+
+
+def check_links(paths: Paths, jobs: int = 1, use_cache: bool = True) -> LinkReport:
+    """
+    Check every internal link and canonical URL on the site.
+
+    Each page is scanned once (across `jobs` workers) unless its sha256
+    matches the cache; links are then resolved against an in-memory index
+    of served URLs, so nothing is fetched. Reports broken links, links that
+    only work through a redirect (missing trailing slash, .html or
+    index.html), calculator pages no other page links to, and canonical
+    URLs that differ from the page's own URL.
+    """
+    t0 = time.perf_counter()
+    repo_root = paths.repo_root
+    report = LinkReport()
+    urls = served_urls(repo_root)
+    files = listing(repo_root).with_suffix([".html"])
+    report.pages = len(files)
+
+    cached = _load_cache(paths.link_cache_path) if use_cache else {}
+    pages: dict[str, PageLinks] = {}
+    misses: list[Path] = []
+    for p in files:
+        rel = p.relative_to(repo_root).as_posix()
+        hit = cached.get(rel)
+        if hit is not None and hit.sha256 == sha256_bytes(p.read_bytes()):
+            pages[rel] = hit
+        else:
+            misses.append(p)
+    for p, extracted in zip(misses, parallel_map(extract_page, misses, jobs=jobs)):
+        pages[p.relative_to(repo_root).as_posix()] = extracted
+    report.extracted = len(misses)
+
+    calculators_prefix = paths.calculators_dir.relative_to(repo_root).as_posix() + "/"
+    inbound: set[str] = set()
+    for rel in sorted(pages):
+        page = pages[rel]
+        base = page_url(rel)
+        for line, href in page.links:
+            target = resolve(href, base)
+            if target is None:
+                continue
+            report.links += 1
+            status, where = classify(target, urls)
+            if status == "broken":
+                report.issues.append(LinkIssue("broken", rel, line, href, where))
+            elif status == "redirect":
+                report.issues.append(LinkIssue("redirect", rel, line, href, f"redirects to {where}"))
+            if status != "broken" and where != base:
+                inbound.add(where)
+
+        expected = base
+        if page.canonical is None:
+            if rel.startswith(calculators_prefix):
+                report.issues.append(LinkIssue("canonical", rel, 0, "", f"no canonical link (expected {expected})"))
+            continue
+        canonical_path = resolve(page.canonical, base)
+        full = urlsplit(page.canonical)
+        if canonical_path != expected or (full.netloc and full.netloc.lower() != _SITE_ORIGIN.netloc.lower()):
+            report.issues.append(
+                LinkIssue("canonical", rel, 0, page.canonical, f"expected {SITE_URL.rstrip('/')}{expected}")
+            )
+
+    for rel in sorted(pages):
+        if rel.startswith(calculators_prefix) and rel.endswith("/index.html") and page_url(rel) not in inbound:
+            report.issues.append(LinkIssue("orphan", rel, 0, page_url(rel), "no other page links here"))
+
+    if use_cache:
+        _save_cache(paths.link_cache_path, pages)
+    report.seconds = time.perf_counter() - t0
+    return report
+
+
+def format_report(report: LinkReport, limit: int = 20) -> list[str]:
+    lines = [
+        f"Checked {report.links} internal link(s) on {report.pages} page(s) "
+        f"({report.extracted} scanned, {report.pages - report.extracted} cached) in {report.seconds:.2f} s",
+    ]
+    labels = {
+        "broken": "Broken links (404)",
+        "redirect": "Links through a redirect",
+        "canonical": "Canonical mismatches",
+        "orphan": "Orphan calculators",
+    }
+    for kind, label in labels.items():
+        issues = [i for i in report.issues if i.kind == kind]
+        lines.append(f"- {label}: {len(issues)}")
+        for i in issues[:limit]:
+            where = f"{i.page}:{i.line}" if i.line else i.page
+            target = f" {i.target}" if i.target else ""
+            lines.append(f"    {where}{target} ({i.detail})")
+        if len(issues) > limit:
+            lines.append(f"    ... {len(issues) - limit} more")
+    return lines
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Check internal links, canonical URLs and orphan calculator pages across the site."
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes for scanning pages (0 = one per CPU). Default: 1",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=20,
+        help="Issues listed per kind (all are counted). Default: 20",
+    )
+    parser.add_argument("--json", metavar="PATH", help="Also write every issue to PATH as JSON.")
+    parser.add_argument("--no-cache", action="store_true", help="Re-scan every page (the cache is not used or updated).")
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Also fail on redirects and orphans (broken links and canonical mismatches always fail).",
+    )
+    args = parser.parse_args()
+
+    paths = get_paths(Path(__file__).resolve().parent.parent)
+    report = check_links(paths, jobs=args.jobs, use_cache=not args.no_cache)
+    for line in format_report(report, args.limit):
+        print(line)
+    if args.json:
+        Path(args.json).write_text(
+            json.dumps([i.__dict__ for i in report.issues], indent=1) + "\n",
+            encoding="utf-8",
+        )
+
+    failing = ("broken", "canonical", "redirect", "orphan") if args.strict else ("broken", "canonical")
+    return 1 if any(report.count(kind) for kind in failing) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Staged, all-or-nothing output for the tools that write into the site.
+
+Writes go to a staging directory at the repo root instead of the live files,
+and only content that differs from what is there (by sha256) is staged:
+
+    .staging/<run id>/files/<path>     the new content, at its repo-relative path
+    .staging/<run id>/ledger.ndjson    one line per staged write or removal
+
+commit() then renames the staged files into place (os.replace, so each file
+flips atomically) and removes what was marked for removal. A run interrupted
+before committing leaves every live file as it was; its staging directory is
+cleared by the next run. Unchanged files are never touched, so their mtimes
+(and CDN etags) stay put and deploys only upload what changed.
+
+List or clear leftover staging directories:
+    python tools/output_stage.py list
+    python tools/output_stage.py clean
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+from artifacts import write_chunks_if_changed
+from file_discovery import invalidate
+
+# At the repo root so renames stay on one filesystem (excluded from file discovery)
+STAGING_DIR_NAME = ".staging"
+
+
+@dataclass
+class OutputResult:
+    written: list[Path] = field(default_factory=list)
+    removed: list[Path] = field(default_factory=list)
+    unchanged: int = 0  # writes whose content matched the live file
+    bytes_written: int = 0  # size of the published files
+    bytes_removed: int = 0
+
+    def add(self, other: "OutputResult") -> None:
+        self.written += other.written
+        self.removed += other.removed
+        self.unchanged += other.unchanged
+        self.bytes_written += other.bytes_written
+        self.bytes_removed += other.bytes_removed
+
+    def summary(self) -> str:
+        parts = [f"{len(self.written)} file(s) written ({self.bytes_written / 1024:.1f} KB)"]
+        if self.removed:
+            parts.append(f"{len(self.removed)} removed ({self.bytes_removed / 1024:.1f} KB)")
+        parts.append(f"{self.unchanged} unchanged")
+        return ", ".join(parts)
+
+
+def _sha256_file(path: Path) -> Optional[bytes]:
+    try:
+        with path.open("rb") as f:
+            h = hashlib.sha256()
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+            return h.digest()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _append_line(path: Path, obj: dict) -> None:
+    # One O_APPEND write per line: safe across worker processes on a local disk
+    line = (json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+class OutputStage:
+    """
+    One tool run's writes to the tree under root. Picklable, so parallel_map
+    workers stage their own files; only the parent process commits.
+
+    Reads through read_bytes() see staged content, so a stage can rewrite a
+    file it already wrote. Can be committed more than once (build.py commits
+    after each stage so the next one reads published files); totals
+    accumulates every commit.
+    """
+
+    def __init__(self, stage_dir: Path, root: Path) -> None:
+        self.stage_dir = stage_dir
+        self.root = root
+        self.totals = OutputResult()
+
+    def __getstate__(self) -> dict:
+        # Workers only stage; the totals stay with the parent
+        return {"stage_dir": self.stage_dir, "root": self.root}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["stage_dir"], state["root"])
+
+    @property
+    def ledger_path(self) -> Path:
+        return self.stage_dir / "ledger.ndjson"
+
+    def _rel(self, path: Path) -> str:
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            pass
+        try:
+            return path.resolve().relative_to(self.root).as_posix()
+        except ValueError:
+            raise ValueError(f"Not under the output root {self.root}: {path}") from None
+
+    def staged_path(self, path: Path) -> Path:
+        return self.stage_dir / "files" / self._rel(path)
+
+    def read_bytes(self, path: Path) -> bytes:
+        staged = self.staged_path(path)
+        return staged.read_bytes() if staged.exists() else path.read_bytes()
+
+    def exists(self, path: Path) -> bool:
+        return self.staged_path(path).exists() or path.exists()
+
+    def write_bytes(self, path: Path, data: bytes) -> bool:
+        # Stage data for path; False (and nothing staged) when the live file already has it
+        staged = self.staged_path(path)
+        if hashlib.sha256(data).digest() == _sha256_file(path):
+            staged.unlink(missing_ok=True)  # undoes an earlier write to it in this run
+            _append_line(self.ledger_path, {"op": "same", "path": self._rel(path)})
+            return False
+        staged.parent.mkdir(parents=True, exist_ok=True)
+        tmp = staged.with_name(f".{staged.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, staged)
+        _append_line(self.ledger_path, {"op": "write", "path": self._rel(path)})
+        return True
+
+    def write_text(self, path: Path, content: str) -> bool:
+        # Like utils.write_text: utf-8, "\n" line endings
+        return self.write_bytes(path, content.encode("utf-8"))
+
+    def write_chunks(self, path: Path, chunks: Iterable[str]) -> bool:
+        # Streamed write (json_stream generators): staged without holding the whole content
+        staged = self.staged_path(path)
+        staged.parent.mkdir(parents=True, exist_ok=True)
+        staged.unlink(missing_ok=True)
+        write_chunks_if_changed(staged, chunks)
+        if _sha256_file(staged) == _sha256_file(path):
+            staged.unlink()
+            _append_line(self.ledger_path, {"op": "same", "path": self._rel(path)})
+            return False
+        _append_line(self.ledger_path, {"op": "write", "path": self._rel(path)})
+        return True
+
+    def remove(self, path: Path) -> bool:
+        # Mark path for removal at commit (and drop anything staged for it)
+        self.staged_path(path).unlink(missing_ok=True)
+        if not path.exists():
+            return False
+        _append_line(self.ledger_path, {"op": "remove", "path": self._rel(path)})
+        return True
+
+    def _pending(self) -> dict[str, str]:
+        # Last operation per path, in first-staged order
+        ops: dict[str, str] = {}
+        if not self.ledger_path.exists():
+            return ops
+        with self.ledger_path.open(encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    e = json.loads(line)
+                    ops[e["path"]] = e["op"]
+        return ops
+
+    def commit(self) -> OutputResult:
+        """
+        Publish everything staged since the last commit: each changed file is
+        renamed into place (atomically, keeping the live file's permissions),
+        removals are applied (directories they empty are removed), and the
+        ledger starts over.
+        """
+        result = OutputResult()
+        for rel, op in self._pending().items():
+            target = self.root / rel
+            staged = self.stage_dir / "files" / rel
+            if op == "write" and staged.exists():
+                existed = target.exists()
+                os.chmod(staged, target.stat().st_mode & 0o777 if existed else 0o644)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                size = staged.stat().st_size
+                os.replace(staged, target)
+                if not existed:
+                    invalidate(target.parent)  # a new file: cached listings are out of date
+                result.written.append(target)
+                result.bytes_written += size
+            elif op == "remove" and target.exists():
+                result.bytes_removed += target.stat().st_size
+                target.unlink()
+                result.removed.append(target)
+                invalidate(target.parent)
+                self._prune_dirs(target.parent)
+            elif op == "same":
+                result.unchanged += 1
+        self.ledger_path.unlink(missing_ok=True)
+        self.totals.add(result)
+        return result
+
+    def _prune_dirs(self, d: Path) -> None:
+        # A directory emptied by removals goes too (e.g. sitemaps/ after un-splitting)
+        while d != self.root and d.is_dir() and not any(d.iterdir()):
+            d.rmdir()
+            d = d.parent
+
+    def abort(self) -> None:
+        # Drop everything staged since the last commit; live files are untouched
+        shutil.rmtree(self.stage_dir / "files", ignore_errors=True)
+        self.ledger_path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        self.abort()
+        shutil.rmtree(self.stage_dir, ignore_errors=True)
+        parent = self.stage_dir.parent
+        if parent.is_dir() and not any(parent.iterdir()):
+            parent.rmdir()
+
+    def __enter__(self) -> "OutputStage":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        # Commit on success; on any error (or Ctrl+C) nothing staged reaches the site
+        try:
+            if exc_type is None:
+                self.commit()
+        finally:
+            self.close()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def leftover_stages(root: Path) -> list[Path]:
+    # Staging directories whose process is gone (interrupted runs); never published
+    base = root / STAGING_DIR_NAME
+    if not base.is_dir():
+        return []
+    out = []
+    for d in sorted(base.iterdir()):
+        pid = d.name.rsplit("-", 1)[-1]
+        if not pid.isdigit() or not _pid_alive(int(pid)):
+            out.append(d)
+    return out
+
+
+def begin_output(tool: str, root: Path) -> OutputStage:
+    # Clears what interrupted runs left behind, then starts a new staging directory
+    root = root.resolve()
+    for d in leftover_stages(root):
+        shutil.rmtree(d, ignore_errors=True)
+    stamp = datetime.now(timezone.utc)
+    stage_dir = root / STAGING_DIR_NAME / f"{tool}-{stamp:%Y%m%d_%H%M%S_%f}-{os.getpid()}"
+    stage_dir.mkdir(parents=True)
+    return OutputStage(stage_dir, root)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Staging directories of the site tools (.staging/).")
+    parser.add_argument("command", choices=("list", "clean"))
+    parser.add_argument("--root", default=str(Path(__file__).resolve().parent.parent), help="Repo root.")
+    args = parser.parse_args()
+
+    root = Path(args.root).resolve()
+    stale = leftover_stages(root)
+    if args.command == "list":
+        for d in stale:
+            files = sum(1 for p in (d / "files").rglob("*") if p.is_file()) if (d / "files").is_dir() else 0
+            print(f"{d.name}  {files} staged file(s), not published")
+        if not stale:
+            print("No leftover staging directories.")
+        return 0
+
+    for d in stale:
+        shutil.rmtree(d, ignore_errors=True)
+    print(f"Removed {len(stale)} leftover staging director(ies).")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Optional, Pattern, Sequence
+
+from calculators_config import BODY_CLOSE_RE, BODY_OPEN_RE, HEAD_CLOSE_RE, HEAD_OPEN_RE, REGION_MARKER_RE
+
+# Bump when the stage plan format or the planning rules change (invalidates cached plans).
+ENGINE_VERSION = 1
+
+KINDS = ("literal", "regex", "ws")
+SCOPES = ("all", "head", "body")
+FLAG_LETTERS = {"i": re.IGNORECASE, "s": re.DOTALL, "m": re.MULTILINE}
+
+
+@dataclass(frozen=True)
+class Rule:
+    # One find -> replace rule, in rule-file order.
+    name: str
+    find: str
+    replace: str
+    # literal: exact text; regex: Python re (replace may use \1 / \g<name>);
+    # ws: literal text where any run of whitespace matches any run of whitespace
+    kind: str = "literal"
+    # all: whole file; head/body: only inside the first <head>/<body> element
+    scope: str = "all"
+    # Any of "i", "s", "m" (re.IGNORECASE, re.DOTALL, re.MULTILINE)
+    flags: str = ""
+
+
+@dataclass(frozen=True)
+class Stage:
+    # Rules applied together in one left-to-right pass over their scope.
+    pattern: Pattern[str]
+    rules: tuple[int, ...]
+    scope: str
+    # find text -> rule index for a literal stage (first rule wins on duplicates);
+    # None for a single regex/ws rule
+    by_find: Optional[dict[str, int]]
+
+
+def trie_regex(needles: Sequence[str]) -> str:
+    """
+    Regex matching any of needles, built as a character trie ("abc|abd" -> "ab(?:c|d)").
+
+    sre then follows one branch per character instead of trying every needle at
+    every position, which is what keeps hundreds of needles cheap: effectively an
+    Aho-Corasick scan driven by the C regex engine. Longer needles are preferred
+    where one is a prefix of another.
+    """
+    trie: dict = {}
+    for n in needles:
+        node = trie
+        for ch in n:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def edges(node: dict) -> list[tuple[str, dict]]:
+        # (escaped label, next node) per child; runs of single-child nodes that end
+        # no needle collapse into one label
+        out = []
+        for ch, child in sorted(node.items()):
+            if ch == "":
+                continue
+            label = [ch]
+            while len(child) == 1 and "" not in child:
+                (c, child), = child.items()
+                label.append(c)
+            out.append((re.escape("".join(label)), child))
+        return out
+
+    # Post-order walk with an explicit stack: a FIND thousands of characters long
+    # would otherwise mean a Python frame per character.
+    bodies: dict[int, str] = {}
+    stack: list[tuple[dict, Optional[list[tuple[str, dict]]]]] = [(trie, None)]
+    while stack:
+        node, children = stack.pop()
+        if children is None:
+            children = edges(node)
+            stack.append((node, children))
+            stack.extend((child, None) for _, child in children)
+            continue
+        alts = [label + bodies.pop(id(child)) for label, child in children]
+        if not alts:
+            body = ""
+        else:
+            body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+            if "" in node:
+                body = f"(?:{body})?"
+        bodies[id(node)] = body
+    return bodies[id(trie)]
+
+
+def rule_flags(rule: Rule) -> int:
+    out = 0
+    for ch in rule.flags:
+        out |= FLAG_LETTERS[ch]
+    return out
+
+
+def rule_source(rule: Rule) -> str:
+    # Regex source for a rule that runs as its own pass
+    if rule.kind == "regex":
+        return rule.find
+    if rule.kind == "ws":
+        return r"\s+".join(re.escape(tok) for tok in rule.find.split())
+    return re.escape(rule.find)
+
+
+def validate_rule(rule: Rule) -> None:
+    # Raises ValueError with the rule name; compiling here surfaces bad regexes at load time.
+    if rule.kind not in KINDS:
+        raise ValueError(f"Rule '{rule.name}': unknown KIND={rule.kind} (expected one of {', '.join(KINDS)})")
+    if rule.scope not in SCOPES:
+        raise ValueError(f"Rule '{rule.name}': unknown SCOPE={rule.scope} (expected one of {', '.join(SCOPES)})")
+    bad = set(rule.flags) - set(FLAG_LETTERS)
+    if bad:
+        raise ValueError(f"Rule '{rule.name}': unknown FLAGS {''.join(sorted(bad))} (expected i, s, m)")
+    if rule.kind == "ws" and not rule.find.split():
+        raise ValueError(f"Rule '{rule.name}': KIND=ws needs a non-blank [FIND]")
+    try:
+        re.compile(rule_source(rule), rule_flags(rule))
+    except re.error as e:
+        raise ValueError(f"Rule '{rule.name}': invalid regex: {e}") from e
+
+
+def _suffix_is_prefix(a: str, b: str) -> bool:
+    # Some proper suffix of a is a prefix of b. Only positions where b's first
+    # character occurs in a are candidates, which keeps this fast for markup.
+    p = a.find(b[0], 1)
+    while p != -1:
+        if b.startswith(a[p:]):
+            return True
+        p = a.find(b[0], p + 1)
+    return False
+
+
+def _overlaps(a: str, b: str) -> bool:
+    # True if an occurrence of a and an occurrence of b can share characters
+    # (containment, or a suffix of one being a prefix of the other).
+    if a in b or b in a:
+        return True
+    return _suffix_is_prefix(a, b) or _suffix_is_prefix(b, a)
+
+
+def _may_create(replace: str, find: str) -> bool:
+    # Can writing `replace` into a text produce a new occurrence of `find`?
+    # Any new occurrence must overlap the replacement; an empty replacement joins
+    # its neighbours, so it can create anything.
+    return not replace or _overlaps(replace, find)
+
+
+def _stageable(rule: Rule) -> bool:
+    # Plain literal rules whose edits can't move a <head>/<body> boundary
+    if rule.kind != "literal" or rule.flags or not rule.find:
+        return False
+    if rule.scope != "all" and (REGION_MARKER_RE.search(rule.find) or REGION_MARKER_RE.search(rule.replace)):
+        return False
+    return True
+
+
+def _independent(earlier: Rule, later: Rule) -> bool:
+    if earlier.scope != later.scope:
+        return False
+    if earlier.find == later.find:
+        # The later duplicate only ever sees what the earlier one creates.
+        return not _may_create(earlier.replace, later.find)
+    return not _overlaps(earlier.find, later.find) and not _may_create(earlier.replace, later.find)
+
+
+def plan_stages(rules: Sequence[Rule]) -> list[list[int]]:
+    """
+    Split rules into consecutive stages that each run as one pass.
+
+    Literal rules are grouped while they stay mutually independent, so running
+    the stages in order gives exactly the result of applying every rule one by
+    one in file order. Regex, ws, flagged and empty-find rules each get a stage
+    of their own. Typical rule files (unrelated markup migrations) need very few.
+    """
+    stages: list[list[int]] = []
+    current: list[int] = []
+    for i, rule in enumerate(rules):
+        if (
+            current
+            and _stageable(rule)
+            and _stageable(rules[current[0]])
+            and all(_independent(rules[j], rule) for j in current)
+        ):
+            current.append(i)
+            continue
+        if current:
+            stages.append(current)
+        current = [i]
+    if current:
+        stages.append(current)
+    return stages
+
+
+def stage_source(rules: Sequence[Rule], idxs: Sequence[int]) -> tuple[str, int]:
+    # (regex source, flags) for one planned stage
+    if len(idxs) == 1 and not _stageable(rules[idxs[0]]):
+        rule = rules[idxs[0]]
+        return rule_source(rule), rule_flags(rule)
+    return trie_regex(sorted({rules[i].find for i in idxs})), 0
+
+
+def _prefilter_segment(rule: Rule) -> Optional[str]:
+    # A piece of text every match of the rule contains verbatim in the raw file
+    # bytes (newlines are normalized on read, U+FFFD can come from decoding
+    # errors), or None if there is no such piece.
+    if rule.kind == "regex" or "i" in rule.flags:
+        return None
+    pieces = [p for p in re.split(r"[\s\ufffd]+" if rule.kind == "ws" else r"[\r\n\ufffd]+", rule.find) if p]
+    return max(pieces, key=len) if pieces else None
+
+
+def _region(content: str, scope: str) -> Optional[tuple[int, int]]:
+    if scope == "all":
+        return 0, len(content)
+    open_re, close_re = (HEAD_OPEN_RE, HEAD_CLOSE_RE) if scope == "head" else (BODY_OPEN_RE, BODY_CLOSE_RE)
+    m = open_re.search(content)
+    if not m:
+        return None
+    end = close_re.search(content, m.end())
+    return m.end(), end.start() if end else len(content)
+
+
+class ReplaceEngine:
+    """
+    Applies rules in file order, one regex pass per stage.
+
+    matches(data) is a cheap pre-filter on the raw bytes of a file: False means
+    no rule can change it, so it does not need decoding or rewriting.
+    """
+
+    def __init__(self, rules: Sequence[Rule], plan: Optional[list[dict]] = None) -> None:
+        self.rules = list(rules)
+        if plan is None:
+            plan = self.make_plan(self.rules)
+
+        self.stages: list[Stage] = []
+        for st in plan:
+            idxs = tuple(st["rules"])
+            by_find: Optional[dict[str, int]] = None
+            if st["literal"]:
+                by_find = {}
+                for i in idxs:
+                    by_find.setdefault(self.rules[i].find, i)
+            self.stages.append(
+                Stage(
+                    pattern=re.compile(st["source"], st["flags"]),
+                    rules=idxs,
+                    scope=self.rules[idxs[0]].scope,
+                    by_find=by_find,
+                )
+            )
+
+        # Raw-bytes pre-filter over one needle per rule; _always when some rule can't be pre-filtered
+        segments = [_prefilter_segment(r) for r in self.rules]
+        self._prefilter: Optional[re.Pattern[bytes]] = None
+        self._always = not all(segments)
+        if segments and not self._always:
+            needles = sorted({s.encode("utf-8").decode("latin-1") for s in segments if s})
+            self._prefilter = re.compile(trie_regex(needles).encode("latin-1"))
+
+    @staticmethod
+    def make_plan(rules: Sequence[Rule]) -> list[dict]:
+        # JSON-serializable stage plan (what find_replace caches on disk)
+        plan = []
+        for idxs in plan_stages(rules):
+            source, flags = stage_source(rules, idxs)
+            literal = len(idxs) > 1 or _stageable(rules[idxs[0]])
+            plan.append({"rules": idxs, "source": source, "flags": flags, "literal": literal})
+        return plan
+
+    def matches(self, data: bytes) -> bool:
+        if self._always:
+            return True
+        return self._prefilter is not None and self._prefilter.search(data) is not None
+
+    def apply(self, content: str) -> tuple[str, list[str]]:
+        """Returns (new_content, names of rules that changed something, in rule order)."""
+        fired: set[int] = set()
+        for stage in self.stages:
+            span = _region(content, stage.scope)
+            if span is None:
+                continue
+            start, end = span
+            region = content[start:end]
+
+            if stage.by_find is None:
+                # One regex/ws/flagged/empty-find rule: plain re.sub semantics
+                rule = self.rules[stage.rules[0]]
+                if rule.kind == "regex":
+                    new = stage.pattern.sub(rule.replace, region)
+                else:
+                    new = stage.pattern.sub(lambda m, r=rule.replace: r, region)
+                if new != region:
+                    fired.add(stage.rules[0])
+            else:
+                by_find = stage.by_find
+
+                def repl(m: re.Match[str]) -> str:
+                    i = by_find[m.group(0)]
+                    rule = self.rules[i]
+                    if rule.replace != rule.find:
+                        fired.add(i)
+                    return rule.replace
+
+                new = stage.pattern.sub(repl, region)
+
+            if new != region:
+                content = content[:start] + new + content[end:]
+        return content, [self.rules[i].name for i in sorted(fired)]
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Optional
+
+from calculators_config import SEARCH_NON_ALNUM_RE, SEARCH_SHARD_FILE_RE
+from output_stage import OutputStage
+from utils import CalculatorRecord, record_aliases
+
+# Bump when the shard layout changes; scripts/search.js checks it and falls back to search-index.min.json.
+SHARD_FORMAT_VERSION = 1
+
+MANIFEST_NAME = "manifest.json"
+
+# Same per-item alias cap as scripts/search.js applies to the legacy index
+MAX_ALIASES = 10
+
+# Terms are indexed under their first two characters (see "prefix" in the shard layout)
+PREFIX_LEN = 2
+
+
+def normalize_search_text(s: str) -> str:
+    # Must stay in sync with normalize() in scripts/search.js
+    s = s.lower().strip().replace("&", " and ")
+    return SEARCH_NON_ALNUM_RE.sub(" ", s).strip()
+
+
+def shard_key(term: str) -> str:
+    # One shard per leading letter; all digits share a shard.
+    return "0" if term[0].isdigit() else term[0]
+
+
+def record_terms(r: CalculatorRecord, aliases: list[str]) -> set[str]:
+    # The words search.js used to substring-match against: title, category and aliases.
+    words: set[str] = set()
+    for s in (r.title, r.category_name, *aliases[:MAX_ALIASES]):
+        words.update(normalize_search_text(s).split())
+    return words
+
+
+def build_search_shards(
+    records: list[CalculatorRecord],
+    aliases: Optional[list[list[str]]] = None,
+) -> tuple[dict, dict[str, dict]]:
+    """
+    Build the sharded search index: (manifest, {shard_key: shard}).
+
+    Doc ids are positions in `records`, which is also the result order. A shard
+    holds every term starting with its key, and only the docs those terms point to.
+    Each shard looks like:
+
+        {
+          "v": 1,
+          "strings": [...],                 # deduped titles, urls and category names
+          "docs": [[id, title, url, category], ...],   # string-table indexes
+          "terms": ["loan", "loans", ...],  # sorted
+          "postings": [[doc, ...], ...],    # per term; indexes into "docs"
+          "prefix": {"lo": [start, end]}    # term range per 2-char prefix
+        }
+
+    The client fetches the shard of each query word and keeps docs where every
+    word is a prefix of one of the doc's terms. Shards cannot answer mid-word
+    queries ("mortgage" in "remortgage" is under "r"); for those the client adds
+    substring hits from search-index.min.json when it has fewer than a page of results.
+    """
+    if aliases is None:
+        aliases = record_aliases(records)
+    by_shard: dict[str, dict[str, list[int]]] = {}
+    for doc_id, r in enumerate(records):
+        for term in record_terms(r, aliases[doc_id]):
+            by_shard.setdefault(shard_key(term), {}).setdefault(term, []).append(doc_id)
+
+    shards: dict[str, dict] = {}
+    for key in sorted(by_shard):
+        term_docs = by_shard[key]
+        terms = sorted(term_docs)
+        doc_ids = sorted({d for ids in term_docs.values() for d in ids})
+        local = {d: i for i, d in enumerate(doc_ids)}
+
+        strings: list[str] = []
+        string_ids: dict[str, int] = {}
+
+        def intern(s: str) -> int:
+            if s not in string_ids:
+                string_ids[s] = len(strings)
+                strings.append(s)
+            return string_ids[s]
+
+        docs = [
+            [d, intern(records[d].title), intern(records[d].url), intern(records[d].category_name)]
+            for d in doc_ids
+        ]
+
+        prefix: dict[str, list[int]] = {}
+        for i, term in enumerate(terms):
+            span = prefix.setdefault(term[:PREFIX_LEN], [i, i])
+            span[1] = i + 1
+
+        shards[key] = {
+            "v": SHARD_FORMAT_VERSION,
+            "strings": strings,
+            "docs": docs,
+            "terms": terms,
+            "postings": [sorted(local[d] for d in term_docs[t]) for t in terms],
+            "prefix": prefix,
+        }
+
+    manifest = {
+        "v": SHARD_FORMAT_VERSION,
+        "docs": len(records),
+        "shards": {key: shard_file_name(key, shard) for key, shard in shards.items()},
+    }
+    return manifest, shards
+
+
+def _dumps(obj: dict) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def shard_file_name(key: str, shard: dict) -> str:
+    # Content hash in the name: shards can be cached forever, only the manifest is revalidated.
+    digest = hashlib.sha256(_dumps(shard).encode("utf-8")).hexdigest()[:10]
+    return f"{key}.{digest}.json"
+
+
+def write_search_shards(
+    out_dir: Path,
+    records: list[CalculatorRecord],
+    aliases: Optional[list[list[str]]] = None,
+    *,
+    out: OutputStage,
+) -> int:
+    """
+    Stage the manifest and shard files under out_dir; returns the number of files written.
+
+    Unchanged shards keep their file (same hash, same name) and are not rewritten.
+    Shard files no longer referenced by the manifest are removed.
+    """
+    manifest, shards = build_search_shards(records, aliases)
+    written = 0
+
+    for key, shard in shards.items():
+        p = out_dir / manifest["shards"][key]
+        if not p.exists():
+            written += out.write_text(p, _dumps(shard))
+
+    written += out.write_text(out_dir / MANIFEST_NAME, _dumps(manifest))
+
+    live = set(manifest["shards"].values())
+    if out_dir.is_dir():
+        for p in out_dir.iterdir():
+            if SEARCH_SHARD_FILE_RE.match(p.name) and p.name not in live:
+                out.remove(p)
+
+    return written
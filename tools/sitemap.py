@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import subprocess
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from calculators_config import SITE_URL, SITEMAP_ROOT_PAGES, SITEMAP_URL_LASTMOD_RE, Paths
+from file_discovery import listing
+from output_stage import OutputStage
+from utils import read_text, scan_calculator_index_files, scan_category_index_files, slug_from_calc_path
+
+# sitemaps.org protocol limits per sitemap file
+MAX_URLS = 50_000
+MAX_BYTES = 50 * 1024 * 1024
+
+# Switch sitemap.xml to an index of per-category sitemaps at this fraction of
+# either limit, well before a single file would be rejected.
+SPLIT_AT = 0.8
+
+XMLNS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+_XML_HEAD = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+# Child sitemap holding the root, hub and category pages
+PAGES_GROUP = "pages"
+
+
+@dataclass(frozen=True)
+class SitemapPage:
+    loc: str
+    source: Path
+    changefreq: str
+    priority: str
+    # Child sitemap this URL goes to when the sitemap is split
+    group: str
+
+
+@dataclass(frozen=True)
+class SitemapResult:
+    files: list[Path]  # sitemap.xml first, then child sitemaps (if split)
+    urls: int
+    lastmod_bumped: int  # URLs whose lastmod differs from the sitemap on disk (or are new)
+    written: int
+    split: bool
+
+
+def escape_xml(s: str) -> str:
+    # Same entities as scripts/generate-sitemap.js
+    return (
+        s.replace("&", "&amp;")
+        .replace("'", "&apos;")
+        .replace('"', "&quot;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+    )
+
+
+def collect_pages(paths: Paths) -> list[SitemapPage]:
+    # Same URLs, priorities and changefreqs as the old Node generator, plus the category
+    # pages it never found (it looked for categories/*.html; pages live at categories/<slug>/index.html).
+    # Calculators come from the file scan, not the parsed records, so a page the
+    # search index skips (no title) is still listed.
+    pages: list[SitemapPage] = []
+    for file, changefreq, priority in SITEMAP_ROOT_PAGES:
+        src = paths.repo_root / file
+        if src.exists():
+            loc = f"{SITE_URL}/" if file == "index.html" else f"{SITE_URL}/{file[: -len('.html')]}/"
+            pages.append(SitemapPage(loc, src, changefreq, priority, PAGES_GROUP))
+
+    for src in listing(paths.hubpages_dir).glob("*.html"):
+        pages.append(SitemapPage(f"{SITE_URL}/hubpages/{src.stem}/", src, "monthly", "0.7", PAGES_GROUP))
+
+    for src in scan_category_index_files(paths.categories_dir):
+        pages.append(SitemapPage(f"{SITE_URL}/categories/{src.parent.name}/", src, "monthly", "0.7", PAGES_GROUP))
+
+    for src in scan_calculator_index_files(paths.calculators_dir):
+        category_slug, calc_slug = slug_from_calc_path(src, paths.calculators_dir)
+        loc = f"{SITE_URL}/calculators/{category_slug}/{calc_slug}/"
+        pages.append(SitemapPage(loc, src, "monthly", "0.8", f"calculators-{category_slug}"))
+    return pages
+
+
+def _git(repo_root: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", "-C", str(repo_root), "-c", "core.quotepath=off", *args],
+        check=True,
+        capture_output=True,
+        encoding="utf-8",
+        errors="surrogateescape",
+    ).stdout
+
+
+def git_lastmods(repo_root: Path, today: str) -> Optional[dict[str, tuple[str, bool]]]:
+    """
+    Repo-relative posix path of every .html page git knows -> (lastmod, exact).
+
+    lastmod is the UTC date of the last commit touching the page, or today for a
+    page with uncommitted changes. exact is False when that commit has no parent:
+    the first commit, or the boundary of a shallow clone, which only say when the
+    page was imported. None when git or the repository is unavailable.
+    """
+    try:
+        if Path(_git(repo_root, "rev-parse", "--show-toplevel").strip()).resolve() != repo_root.resolve():
+            return None  # repo_root is not a checkout of its own (e.g. a copy inside another repo)
+        log = _git(repo_root, "log", "--no-renames", "--name-only", "--format=%x00%P%x00%ct", "--", "*.html")
+        status = _git(repo_root, "status", "--porcelain", "-z", "--untracked-files=all", "--", "*.html")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    out: dict[str, tuple[str, bool]] = {}
+    # Newest first; each commit is "\0<parents>\0<time>\n\n<file>\n<file>..."
+    fields = log.split("\x00")[1:]
+    for parents, body in zip(fields[0::2], fields[1::2]):
+        stamp, _, names = body.partition("\n")
+        lastmod = datetime.fromtimestamp(int(stamp), timezone.utc).date().isoformat()
+        for name in names.split("\n"):
+            if name and name not in out:
+                out[name] = (lastmod, bool(parents.strip()))
+
+    # "XY path\0", plus the original path as its own field after a rename or copy
+    entries = iter(status.split("\x00"))
+    for entry in entries:
+        if len(entry) > 3:
+            out[entry[3:]] = (today, True)
+            if entry[0] in "RC":
+                next(entries, None)
+    return out
+
+
+def _previous_lastmods(paths: Paths) -> dict[str, str]:
+    # lastmod per loc from the sitemap(s) on disk
+    out: dict[str, str] = {}
+    for p in [paths.sitemap_path, *sorted(paths.sitemaps_dir.glob("*.xml"))]:
+        if p.exists():
+            for loc, lastmod in SITEMAP_URL_LASTMOD_RE.findall(read_text(p)):
+                out.setdefault(loc.replace("&amp;", "&"), lastmod)
+    return out
+
+
+def url_entry(loc: str, lastmod: str, changefreq: str, priority: str) -> str:
+    return (
+        f"  <url>\n    <loc>{escape_xml(loc)}</loc>\n    <lastmod>{lastmod}</lastmod>\n"
+        f"    <changefreq>{changefreq}</changefreq>\n    <priority>{priority}</priority>\n  </url>\n"
+    )
+
+
+def urlset_xml(entries: list[str]) -> str:
+    return f'{_XML_HEAD}<urlset xmlns="{XMLNS}">\n{"".join(entries)}</urlset>\n'
+
+
+def _chunks(entries: list[tuple[str, str]]) -> list[list[tuple[str, str]]]:
+    # Split one group's (xml, lastmod) entries so each file stays under the hard limits.
+    overhead = len(urlset_xml([]).encode("utf-8"))
+    chunks: list[list[tuple[str, str]]] = [[]]
+    size = overhead
+    for entry in entries:
+        n = len(entry[0].encode("utf-8"))
+        if chunks[-1] and (len(chunks[-1]) >= MAX_URLS or size + n > MAX_BYTES):
+            chunks.append([])
+            size = overhead
+        chunks[-1].append(entry)
+        size += n
+    return chunks
+
+
+def write_sitemap(
+    paths: Paths,
+    force_index: bool = False,
+    today: Optional[str] = None,
+    *,
+    out: OutputStage,
+) -> SitemapResult:
+    """
+    Write sitemap.xml for the site's pages, with lastmod from git history.
+
+    A page's lastmod is the date of the last commit that changed it (today while
+    it has uncommitted changes), so every checkout of a commit, Vercel's
+    included, builds the same dates. Where git cannot tell (no repository, or the
+    page was last touched by the first commit or a shallow clone's boundary
+    commit), the URL keeps its lastmod from the sitemap on disk; a URL that is
+    not there either gets the commit date if there is one, else today.
+
+    Past SPLIT_AT of the URL or byte limit (or with force_index), sitemap.xml
+    becomes a sitemap index over sitemaps/pages.xml and one
+    sitemaps/calculators-<category>.xml per category.
+    """
+    today = today or datetime.now(timezone.utc).date().isoformat()
+    committed = git_lastmods(paths.repo_root, today) or {}
+    previous = _previous_lastmods(paths)
+
+    groups: dict[str, list[tuple[str, str]]] = {}
+    urls = bumped = 0
+    total_bytes = 0
+    for page in collect_pages(paths):
+        git_date = committed.get(page.source.relative_to(paths.repo_root).as_posix())
+        if git_date is not None and git_date[1]:
+            lastmod = git_date[0]
+        elif page.loc in previous:
+            lastmod = previous[page.loc]
+        else:
+            lastmod = git_date[0] if git_date is not None else today
+        urls += 1
+        bumped += previous.get(page.loc) != lastmod
+
+        xml = url_entry(page.loc, lastmod, page.changefreq, page.priority)
+        total_bytes += len(xml.encode("utf-8"))
+        groups.setdefault(page.group, []).append((xml, lastmod))
+
+    split = force_index or urls > MAX_URLS * SPLIT_AT or total_bytes > MAX_BYTES * SPLIT_AT
+
+    written = 0
+    children: dict[str, str] = {}  # file name -> max lastmod
+    if split:
+        for group, entries in groups.items():
+            chunks = _chunks(entries)
+            for i, chunk in enumerate(chunks):
+                name = f"{group}.xml" if len(chunks) == 1 else f"{group}-{i + 1}.xml"
+                content = urlset_xml([xml for xml, _ in chunk])
+                written += out.write_text(paths.sitemaps_dir / name, content)
+                children[name] = max(lastmod for _, lastmod in chunk)
+        index = "".join(
+            f"  <sitemap>\n    <loc>{escape_xml(f'{SITE_URL}/sitemaps/{name}')}</loc>\n"
+            f"    <lastmod>{lastmod}</lastmod>\n  </sitemap>\n"
+            for name, lastmod in children.items()
+        )
+        top = f'{_XML_HEAD}<sitemapindex xmlns="{XMLNS}">\n{index}</sitemapindex>\n'
+    else:
+        top = urlset_xml([xml for entries in groups.values() for xml, _ in entries])
+    written += out.write_text(paths.sitemap_path, top)
+
+    # Child sitemaps from an earlier split that are no longer listed (and their .gz/.br)
+    if paths.sitemaps_dir.exists():
+        for p in paths.sitemaps_dir.iterdir():
+            base = p.name.split(".xml", 1)[0] + ".xml"
+            if p.name.endswith((".xml", ".xml.gz", ".xml.br")) and base not in children:
+                out.remove(p)  # the emptied sitemaps/ goes with its last file
+
+    return SitemapResult(
+        files=[paths.sitemap_path, *(paths.sitemaps_dir / name for name in children)],
+        urls=urls,
+        lastmod_bumped=bumped,
+        written=written,
+        split=split,
+    )
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Synthetic calculator corpus for benchmarks.
+
+Writes calculators/<cat>/<calc>/index.html and categories/<cat>/index.html
+under a root directory, shaped like the real pages: same head (title, meta,
+canonical, Open Graph/Twitter, JSON-LD, scripts), breadcrumbs, calculator
+form, ad-blocks and SEO copy, at a similar size spread (~11-20 KB per page).
+Output is fully determined by (pages, categories, seed).
+
+Run from anywhere:
+    python tools/synth_corpus.py OUT_DIR --pages 10000 [--categories 15] [--seed 0]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from calculators_config import SITE_URL
+from utils import escape_html, write_text
+
+# Written last; a directory whose marker matches the requested spec is reused as-is.
+MARKER_NAME = ".synth-corpus.json"
+
+_CATEGORY_NAMES = (
+    "Business & Accounting",
+    "Construction & Materials",
+    "Conversions (Units, Currencies, etc.)",
+    "Education & Exams",
+    "Engineering & Technical",
+    "Everyday Life Tools",
+    "Health & Fitness",
+    "Loans & Credit",
+    "Math & General Calculators",
+    "Personal Finance",
+    "Real Estate & Property",
+    "Savings & Investments",
+    "Time, Date & Scheduling",
+    "Travel & Transport",
+    "Home & Garden",
+)
+
+_TITLE_WORDS = (
+    "loan", "mortgage", "interest", "payment", "savings", "budget", "tax", "income", "salary", "hourly",
+    "overtime", "tip", "discount", "margin", "markup", "profit", "break-even", "depreciation", "fuel",
+    "mileage", "trip", "time", "date", "age", "bmi", "calorie", "protein", "water", "concrete", "paint",
+    "tile", "roof", "fence", "deck", "gravel", "mulch", "area", "volume", "percentage", "ratio",
+    "fraction", "grade", "gpa", "compound", "retirement", "inflation", "rent", "lease", "currency", "unit",
+)
+_TITLE_KINDS = ("Calculator", "Estimator", "Converter", "Planner", "Checker")
+
+_LOREM = (
+    "Enter your values and the calculator applies the standard formula step by step. "
+    "Results update instantly and every intermediate value is shown so you can check the math. "
+    "Assumptions are listed below; change any input to compare scenarios side by side. "
+    "Rounding happens only at the final step, which keeps totals consistent with spreadsheets. "
+    "For planning purposes only: confirm figures that matter with a qualified professional. "
+)
+
+
+@dataclass(frozen=True)
+class CorpusSpec:
+    pages: int
+    categories: int
+    seed: int
+
+
+def slugify(s: str) -> str:
+    out = "".join(c if c.isalnum() else "-" for c in s.lower())
+    return "-".join(p for p in out.split("-") if p)
+
+
+def category_names(n: int) -> list[str]:
+    names = list(_CATEGORY_NAMES[:n])
+    for i in range(len(names), n):
+        names.append(f"{_CATEGORY_NAMES[i % len(_CATEGORY_NAMES)]} {i // len(_CATEGORY_NAMES) + 1}")
+    return names
+
+
+def _paragraphs(rng: random.Random, count: int) -> str:
+    return "".join(f"<p>{_LOREM * rng.randint(1, 3)}</p>\n" for _ in range(count))
+
+
+def calculator_page(rng: random.Random, title: str, cat_slug: str, cat_name: str, calc_slug: str) -> str:
+    url = f"{SITE_URL}/calculators/{cat_slug}/{calc_slug}/"
+    name = f"{title} | SnapCalc"
+    desc = f"Free {title.lower()} for quick, transparent results. " + _LOREM[: rng.randint(40, 140)].strip()
+    ld = json.dumps(
+        {
+            "@context": "https://schema.org",
+            "@type": "SoftwareApplication",
+            "name": title,
+            "applicationCategory": "Calculator",
+            "operatingSystem": "All",
+            "url": url,
+            "description": desc,
+        },
+        indent=6,
+    )
+    # Like the live pages, most write content= before name= and href= before rel=, which
+    # the description/canonical patterns skip; 10% use the order they match.
+    if rng.random() < 0.1:
+        desc_tag = f'<meta name="description" content="{escape_html(desc)}"/>'
+        canonical_tag = f'<link rel="canonical" href="{url}"/>'
+    else:
+        desc_tag = f'<meta content="{escape_html(desc)}" name="description"/>'
+        canonical_tag = f'<link href="{url}" rel="canonical"/>'
+
+    # A few percent of pages take the parser's fallback paths (empty <title>, no breadcrumbs).
+    roll = rng.random()
+    title_tag = "" if roll < 0.01 else escape_html(name)
+    crumbs = (
+        ""
+        if 0.01 <= roll < 0.03
+        else (
+            '<nav class="breadcrumbs">\n<a href="/">Home</a> ›\n'
+            f'        <a href="/categories/{cat_slug}/">{escape_html(cat_name)}</a> ›\n'
+            f"        <span>{escape_html(title)}</span>\n</nav>\n"
+        )
+    )
+    fields = "".join(
+        f'<div class="form-group">\n<label for="in{i}">Input {i + 1}</label>\n'
+        f'<input id="in{i}" inputmode="decimal" placeholder="e.g. {rng.randint(1, 999)}" type="text"/>\n</div>\n'
+        for i in range(rng.randint(2, 6))
+    )
+    ad = '<div class="grid-slot">\n      <div class="ad-block" aria-label="Sponsored content"></div>\n        <p></p>\n      </div>\n'
+    return (
+        "<!DOCTYPE html>\n\n<html>\n<head>\n"
+        '<meta charset="utf-8"/>\n<meta content="width=device-width, initial-scale=1.0" name="viewport"/>\n'
+        f"<!-- SEO: title and description -->\n<title>{title_tag}</title>\n"
+        '<link href="/favicon.ico" rel="icon" type="image/x-icon"/>\n'
+        f"{desc_tag}\n{canonical_tag}\n"
+        f'<meta content="{escape_html(name)}" property="og:title"/>\n'
+        f'<meta content="{escape_html(desc)}" property="og:description"/>\n'
+        f'<meta content="website" property="og:type"/>\n<meta content="{url}" property="og:url"/>\n'
+        f'<meta content="{SITE_URL}/assets/share-default.png" property="og:image"/>\n'
+        f'<meta content="summary_large_image" name="twitter:card"/>\n<meta content="{escape_html(name)}" name="twitter:title"/>\n'
+        f'<meta content="{escape_html(desc)}" name="twitter:description"/>\n'
+        f'<script type="application/ld+json">\n    {ld}\n    </script>\n'
+        '<link href="/styles/main.css" rel="stylesheet"/>\n\n'
+        '<script defer="" src="/scripts/main.js"></script>\n<script defer="" src="/scripts/search.js"></script>\n'
+        '<script defer="" src="script.js"></script>\n\n'
+        '<script src="https://pl28401807.effectivegatecpm.com/16/d6/13/16d6138b6d74e1866cb0f7a3960bfd77.js"></script>\n'
+        "</head>\n<body>\n"
+        '<header class="site-header">\n<div class="site-header-inner">\n<a class="site-logo" href="/">SnapCalc</a>\n'
+        '<div class="site-search">\n<input aria-label="Search calculators" autocomplete="off" id="siteSearchInput" type="search"/>\n'
+        '<div aria-hidden="true" class="site-search-results" id="siteSearchResults"></div>\n</div>\n'
+        '<nav class="site-nav">\n  <a href="/">Home</a>\n  <a href="/#categories">Categories</a>\n'
+        '  <a href="/about.html">About</a>\n  <a href="/methodology.html">Methodology</a>\n</nav>\n</div>\n</header>\n'
+        '<main class="site-main">\n'
+        '  <script async="async" data-cfasync="false" src="https://pl28402284.effectivegatecpm.com/0ebd073c7baf207558a86b92738ee2ed/invoke.js"></script>\n'
+        '  <div id="container-0ebd073c7baf207558a86b92738ee2ed"></div>\n'
+        f"{crumbs}"
+        f'<div class="page-layout">\n<h1>{escape_html(title)}</h1>\n<div class="page-grid">\n'
+        '<div class="grid-slot"></div>\n<div class="grid-slot">\n<div class="calculator-container">\n'
+        f"<h2>{escape_html(title)}</h2>\n<p class=\"calculator-intro\">{_LOREM}</p>\n"
+        f"<!-- CALCULATOR UI START -->\n{fields}<!-- CALCULATOR UI END -->\n"
+        '<button id="calculateButton" type="button">Calculate</button>\n<div aria-live="polite" id="result"></div>\n'
+        "</div>\n</div>\n"
+        f"{ad}"
+        f'<div class="grid-slot">\n<a class="related-card" href="/categories/{cat_slug}/">\n'
+        f'<h3 class="related-title">{escape_html(cat_name)}</h3>\n</a>\n</div>\n'
+        f"{ad}"
+        f'<div class="grid-slot">\n<section class="seo-section">\n<h2>About the {escape_html(title.lower())}</h2>\n'
+        f"{_paragraphs(rng, rng.randint(5, 14))}"
+        '<div class="last-updated">Last updated: 2025-12-30</div>\n</section>\n</div>\n'
+        f"{ad}"
+        "</div>\n</div>\n</main>\n"
+        '<footer class="site-footer">\n<div class="site-footer-inner">\n<span>© 2026 SnapCalc</span>\n'
+        '<a href="/privacy-policy.html">Privacy Policy</a>\n<a href="/terms.html">Terms</a>\n</div>\n</footer>\n'
+        "</body>\n</html>\n"
+    )
+
+
+def category_page(name: str) -> str:
+    # Just what the build reads: <h1> (name map), the grid, a content block and </main>.
+    return (
+        "<!DOCTYPE html>\n<html>\n  <head>\n    <meta charset=\"UTF-8\" />\n"
+        f"    <title>{escape_html(name)} Calculators</title>\n  </head>\n  <body>\n"
+        '    <main class="site-main">\n      <div class="category-layout">\n'
+        f"          <h1>{escape_html(name)}</h1>\n"
+        '        <div class="category-grid">\n        </div>\n      \n'
+        '          <div class="category-content-block">\n'
+        f"            {_paragraphs(random.Random(name), 4)}"
+        "          </div>\n      </div>\n    </main>\n  </body>\n</html>\n"
+    )
+
+
+def generate_corpus(root: Path, spec: CorpusSpec) -> bool:
+    """
+    Write the corpus for spec under root; returns False if root already holds it.
+
+    Pages are spread round-robin over the categories, so every category grid
+    grows with the corpus (at 50k pages and 15 categories a grid has ~3,300 tiles).
+    """
+    marker = root / MARKER_NAME
+    if marker.exists() and json.loads(marker.read_text(encoding="utf-8")) == asdict(spec):
+        return False
+
+    rng = random.Random(spec.seed)
+    names = category_names(spec.categories)
+    slugs = [slugify(n) for n in names]
+    for name, slug in zip(names, slugs):
+        write_text(root / "categories" / slug / "index.html", category_page(name))
+
+    for i in range(spec.pages):
+        c = i % spec.categories
+        words = rng.sample(_TITLE_WORDS, rng.randint(1, 3))
+        title = " ".join(w.capitalize() for w in words) + f" {rng.choice(_TITLE_KINDS)} {i}"
+        calc_slug = slugify(title)
+        page = calculator_page(rng, title, slugs[c], names[c], calc_slug)
+        write_text(root / "calculators" / slugs[c] / calc_slug / "index.html", page)
+
+    write_text(marker, json.dumps(asdict(spec)) + "\n")
+    return True
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Generate a synthetic calculator corpus for benchmarks.")
+    parser.add_argument("out_dir", help="Directory to write calculators/ and categories/ into.")
+    parser.add_argument("--pages", type=int, default=1000, help="Calculator pages. Default: 1000")
+    parser.add_argument("--categories", type=int, default=15, help="Categories. Default: 15 (as on the site)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed. Default: 0")
+    args = parser.parse_args()
+
+    if args.pages < 1 or args.categories < 1:
+        print("ERROR: --pages and --categories must be at least 1")
+        return 2
+
+    root = Path(args.out_dir).resolve()
+    spec = CorpusSpec(pages=args.pages, categories=args.categories, seed=args.seed)
+    if generate_corpus(root, spec):
+        print(f"Wrote {spec.pages} calculator page(s) in {spec.categories} categories to {root}")
+    else:
+        print(f"Corpus already present at {root}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The tools are a flat script directory that imports its siblings by name.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
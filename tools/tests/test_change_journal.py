@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from change_journal import JournalWriter, make_hunks, revert_journal
+
+ORIGINAL = b"<html>\n<head>\n<title>Old</title>\n</head>\n<body>\n<p>old footer</p>\n</body>\n</html>\n"
+EDITED = b"<html>\n<head>\n<title>New</title>\n</head>\n<body>\n<p>new footer</p>\n</body>\n</html>\n"
+
+
+def journal_edit(root: Path, name: str = "page.html") -> tuple[Path, Path]:
+    page = root / name
+    page.write_bytes(EDITED)
+    journal = root / "journal.ndjson"
+    writer = JournalWriter(journal, root, {})
+    writer.record(page, ORIGINAL, EDITED)
+    writer.close()
+    return page, journal
+
+
+def test_hunks_carry_the_line_before():
+    hunks = make_hunks(ORIGINAL, EDITED)
+    assert [h[3] for h in hunks] == ["<head>\n", "<body>\n"]
+
+
+def test_revert_restores_original(tmp_path):
+    page, journal = journal_edit(tmp_path)
+    result = revert_journal(journal)
+    assert result.reverted == [page]
+    assert page.read_bytes() == ORIGINAL
+
+
+def test_revert_survives_insertion_before_hunk(tmp_path):
+    page, journal = journal_edit(tmp_path)
+    # A later edit above both hunks moves them; the offsets in the journal are stale
+    page.write_bytes(EDITED.replace(b"<html>\n", b"<!doctype html>\n<html>\n"))
+    result = revert_journal(journal)
+    assert result.reverted == [page]
+    assert page.read_bytes() == ORIGINAL.replace(b"<html>\n", b"<!doctype html>\n<html>\n")
+
+
+def test_revert_survives_removal_before_hunk(tmp_path):
+    page, journal = journal_edit(tmp_path)
+    page.write_bytes(EDITED.replace(b"<html>\n", b""))
+    result = revert_journal(journal)
+    assert result.reverted == [page]
+    assert page.read_bytes() == ORIGINAL.replace(b"<html>\n", b"")
+
+
+def test_revert_skips_edit_next_to_hunk(tmp_path):
+    page, journal = journal_edit(tmp_path)
+    # The line above a hunk is its anchor; changing it is a conflict
+    changed = EDITED.replace(b"<body>\n", b'<body class="x">\n')
+    page.write_bytes(changed)
+    result = revert_journal(journal)
+    assert result.reverted == []
+    assert page.read_bytes() == changed
+
+
+def test_revert_skips_edited_hunk(tmp_path):
+    page, journal = journal_edit(tmp_path)
+    changed = EDITED.replace(b"new footer", b"newer footer")
+    page.write_bytes(changed)
+    result = revert_journal(journal)
+    assert result.reverted == []
+    assert [reason for _, reason in result.skipped] == ["edited since the journaled run (hunks do not match)"]
+    assert page.read_bytes() == changed
+
+
+def test_revert_dry_run_leaves_file(tmp_path):
+    page, journal = journal_edit(tmp_path)
+    result = revert_journal(journal, write=False)
+    assert result.reverted == [page]
+    assert page.read_bytes() == EDITED
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from fill_affiliates import build_img_block, refresh_img_block_edits, splice
+from images import ImageInfo, ImageVariant
+
+ITEM = {"href": "https://example.com/?a=1&b=2", "img": "/assets/ads/a.png", "alt": "Books & more"}
+SIZED = ImageInfo(url="/assets/ads/a.png", width=300, height=200, sha256="")
+VARIANTS = ImageInfo(
+    url="/assets/ads/a.png",
+    width=300,
+    height=200,
+    sha256="",
+    variants=(
+        ImageVariant("/assets/optimized/ads/a-300w.webp", 300, "webp"),
+        ImageVariant("/assets/optimized/ads/a-300w.png", 300, "png"),
+    ),
+)
+
+
+def refresh(text: str, images) -> str:
+    return splice(text, refresh_img_block_edits(text, 0, len(text), images))
+
+
+def test_bare_img_gets_size():
+    bare = (
+        f'<a class="affiliate-link" href="{ITEM["href"]}" target="_blank" rel="nofollow sponsored noopener">\n'
+        f'<img src="{ITEM["img"]}" alt="Books &amp; more">\n</a>\n'
+    )
+    assert refresh(bare, {ITEM["img"]: SIZED}) == build_img_block(ITEM, {ITEM["img"]: SIZED})
+
+
+def test_sized_img_upgrades_to_picture():
+    sized = build_img_block(ITEM, {ITEM["img"]: SIZED})
+    new = refresh(sized, {ITEM["img"]: VARIANTS})
+    assert new == build_img_block(ITEM, {ITEM["img"]: VARIANTS})
+    assert "<picture>" in new
+
+
+def test_picture_refresh_is_stable_and_reversible():
+    picture = build_img_block(ITEM, {ITEM["img"]: VARIANTS})
+    assert refresh_img_block_edits(picture, 0, len(picture), {ITEM["img"]: VARIANTS}) == []
+    # Variants gone (e.g. the image was replaced): back to a sized <img>
+    assert refresh(picture, {ITEM["img"]: SIZED}) == build_img_block(ITEM, {ITEM["img"]: SIZED})
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from utils import breadcrumb_category, head_fields
+
+PAGE = (
+    "<html><head><title> Area | SnapCalc </title></head><body>\n"
+    '<nav class="breadcrumbs"><a href="/">Home</a> / '
+    '<a href="/categories/math-general-calculators/">Math &amp; General</a></nav>\n'
+    "<h1>Area</h1><p><a href=\"/categories/other/\">Other</a></p></body></html>"
+)
+
+
+def test_breadcrumb_category():
+    assert breadcrumb_category(PAGE) == ("math-general-calculators", "Math &amp; General")
+    assert breadcrumb_category(PAGE.replace('class="breadcrumbs"', 'class="menu"')) is None
+    # Without a </nav> after the link there is no category, and no backtracking over the page
+    broken = PAGE.replace("</nav>", "") + '<p><a href="/x/">x</a></p>' * 5000
+    assert breadcrumb_category(broken) is None
+
+
+def test_head_fields_h1_only_for_blank_title():
+    assert head_fields(PAGE).h1 is None
+    fields = head_fields(PAGE.replace(" Area | SnapCalc ", " "))
+    assert fields.title == "" and fields.h1 == "Area"
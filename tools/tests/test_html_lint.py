@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from calculators_config import get_paths
+from html_lint import lint_html, lint_site, save_baseline
+
+
+def kinds(html: str) -> list[tuple[str, str]]:
+    return [(i.kind, i.detail) for i in lint_html(html)]
+
+
+def test_balanced_page_is_clean():
+    html = (
+        '<main><div class="category-grid">'
+        '<div class="category-item"><a href="/x/">X</a></div>'
+        "<!-- </div> -->"
+        "<script>document.write('</div>')</script>"
+        "<p>unclosed paragraphs are fine<br>"
+        "</div></main>"
+    )
+    assert lint_html(html) == []
+
+
+def test_stray_and_unclosed():
+    assert kinds("<div></div></div>") == [("stray-close", "</div> with no open <div>")]
+    assert kinds('<section><div class="a"></section>') == [
+        ("unclosed", '<div class="a"> not closed before </section>')
+    ]
+    assert kinds('<main id="m">') == [("unclosed", '<main id="m"> never closed')]
+
+
+def test_containment_and_duplicate_ids():
+    html = (
+        '<main><div class="category-grid"></div></main>'
+        '<div class="category-item" id="x"></div>'
+        '<div id="x"></div>'
+    )
+    assert kinds(html) == [
+        ("containment", '<div class="category-item"> not directly inside .category-grid'),
+        ("duplicate-id", 'id "x" used again'),
+    ]
+
+
+def test_stray_close_in_grid_is_caught():
+    # The case the grid splicer has to survive: a tile with one </div> too many
+    html = (
+        '<main><div class="category-grid">'
+        '<div class="category-item">A</div></div>'
+        '<div class="category-item">B</div>'
+        "</div></main>"
+    )
+    assert kinds(html) == [
+        ("containment", '<div class="category-item"> not directly inside .category-grid (parent: <main>)'),
+        ("stray-close", "</div> with no open <div>"),
+    ]
+
+
+def test_baseline_fails_only_on_new_issues(tmp_path: Path):
+    paths = get_paths(tmp_path)
+    page = tmp_path / "index.html"
+    page.write_text("<div></div></div>", encoding="utf-8")
+    first = lint_site(paths, use_cache=False)
+    assert first.regression_count == 1
+
+    paths.lint_baseline_path.parent.mkdir(parents=True)
+    save_baseline(paths.lint_baseline_path, first.issues)
+    assert lint_site(paths).regression_count == 0
+
+    page.write_text("<div></div></div></div>", encoding="utf-8")
+    again = lint_site(paths)
+    assert again.linted == 1 and again.regression_count == 1
+
+    page.write_text("<div></div>", encoding="utf-8")
+    assert lint_site(paths).fixed == 1
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import pytest
+
+from fill_affiliates import find_ad_block_spans
+from html_regions import find_category_grid, find_elements, matching_close
+from utils import replace_category_grid
+
+
+def category_page(tiles: str, tail: str = "") -> str:
+    return (
+        "<html><body><main>\n"
+        '  <div class="category-layout">\n'
+        '    <div class="category-grid">\n'
+        f"{tiles}"
+        "    </div>\n"
+        f"{tail}"
+        "  </div>\n"
+        "</main></body></html>\n"
+    )
+
+
+TILE = '      <div class="category-item"><a href="/calculators/x/a/">A</a></div>\n'
+
+
+def test_grid_splice_replaces_tiles():
+    page = category_page(TILE * 3)
+    new = replace_category_grid(page, '<div class="category-item">B</div>')
+    assert new == (
+        '<html><body><main>\n  <div class="category-layout">\n    <div class="category-grid">\n'
+        '<div class="category-item">B</div>\n        </div>\n  </div>\n</main></body></html>\n'
+    )
+    assert "/calculators/x/a/" not in new
+
+
+def test_grid_splice_stray_close_leaves_no_stale_tiles():
+    # A hand-edited tile with one </div> too many must not end the grid early.
+    tiles = TILE + '      <div class="category-item">A</div></div>\n' + TILE.replace("/a/", "/stale/")
+    new = replace_category_grid(category_page(tiles), "<p>new</p>")
+    assert "/stale/" not in new and "/calculators/x/a/" not in new
+    assert new.count('<div class="category-layout">') == 1
+    assert new.endswith('<div class="category-grid">\n<p>new</p>\n        </div>\n  </div>\n</main></body></html>\n')
+
+
+def test_grid_splice_unclosed_tile_and_long_tail():
+    # A missing </div> inside the grid, and more than a search window of markup after it
+    tiles = '      <div class="category-item">A\n' + TILE * 2
+    tail = "    <p>" + "x" * 20000 + "</p>\n"
+    page = category_page(tiles, tail)
+    grid = find_category_grid(page)
+    assert page[grid.close_start :].startswith("</div>\n" + tail)
+    assert "category-item" not in replace_category_grid(page, "")
+
+
+def test_grid_errors():
+    with pytest.raises(ValueError):
+        find_category_grid("<main></main>")
+    with pytest.raises(ValueError):
+        find_category_grid('<div class="category-grid"><p></p>')
+    with pytest.raises(ValueError):
+        find_category_grid('<div class="category-grid"></div></main>')
+
+
+def test_matching_close_skips_comments_and_raw_text():
+    html = '<div id="a"><!-- </div> --><script>x = "</div>";</script><div></div></div><div></div>'
+    open_end = html.index(">") + 1
+    close = matching_close(html, open_end)
+    assert close is not None and html[close.end :] == "<div></div>"
+
+
+def test_find_elements_and_ad_blocks():
+    html = (
+        '<div class="ad-block"><div class="ad-placeholder">Ad</div></div>'
+        "<script>'<div class=\"ad-block\">'</script>"
+        '<div class="ad-block wide"></div>'
+    )
+    spans = find_ad_block_spans(html)
+    assert [html[a:d] for a, _, _, d in spans] == [
+        '<div class="ad-block"><div class="ad-placeholder">Ad</div></div>',
+        '<div class="ad-block wide"></div>',
+    ]
+    assert len(find_elements(html, "div", lambda tag: "ad-block" in tag, limit=1)) == 1
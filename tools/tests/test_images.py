@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import json
+import struct
+from pathlib import Path
+
+import images
+from calculators_config import get_paths
+from images import ImageInfo, ImageVariant, load_image_manifest, optimize_images, picture_html
+from output_stage import begin_output
+
+
+def png(width: int, height: int) -> bytes:
+    # Signature and IHDR are all image_size() reads
+    return b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", width, height) + b"\x08\x06\0\0\0"
+
+
+def write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def run(root: Path):
+    with begin_output("images", root) as out:
+        return optimize_images(get_paths(root), out=out)
+
+
+def test_dimensions_without_pillow(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, "Image", None)
+    write(tmp_path / "assets" / "ads" / "a.png", png(300, 200))
+    result = run(tmp_path)
+    assert (result.images, result.processed, result.formats) == (1, 1, ())
+    info = load_image_manifest(get_paths(tmp_path).image_manifest_path)["/assets/ads/a.png"]
+    assert (info.width, info.height, info.variants) == (300, 200, ())
+
+
+def test_pillow_variants_survive_a_build_without_pillow(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, "Image", None)
+    paths = get_paths(tmp_path)
+    data = png(300, 200)
+    write(tmp_path / "assets" / "ads" / "a.png", data)
+    variant = paths.image_variants_dir / "ads" / "a-300w.webp"
+    write(variant, b"webp")
+    orphan = paths.image_variants_dir / "ads" / "gone-300w.webp"
+    write(orphan, b"webp")
+    # As a Pillow build with other settings would have left it
+    entry = {
+        "sha256": images.sha256_bytes(data),
+        "settings": "from-another-build",
+        "formats": ["webp"],
+        "width": 300,
+        "height": 200,
+        "variants": [{"url": "/assets/optimized/ads/a-300w.webp", "width": 300, "format": "webp"}],
+    }
+    write(paths.image_manifest_path, json.dumps({"version": 1, "images": {"/assets/ads/a.png": entry}}).encode())
+
+    result = run(tmp_path)
+    assert (result.reused, result.processed, result.removed) == (1, 0, 0)
+    assert variant.exists() and orphan.exists()
+    info = load_image_manifest(paths.image_manifest_path)["/assets/ads/a.png"]
+    assert [v.url for v in info.variants] == ["/assets/optimized/ads/a-300w.webp"]
+
+
+def test_picture_keeps_source_as_img_src():
+    info = ImageInfo(
+        url="/assets/a.png",
+        width=300,
+        height=200,
+        sha256="",
+        variants=(
+            ImageVariant("/assets/optimized/a-300w.webp", 300, "webp"),
+            ImageVariant("/assets/optimized/a-300w.png", 300, "png"),
+        ),
+    )
+    out = picture_html("/assets/a.png", "A & B", info, "100vw")
+    assert '<source type="image/webp" srcset="/assets/optimized/a-300w.webp 300w" sizes="100vw">' in out
+    assert '<img src="/assets/a.png" srcset="/assets/optimized/a-300w.png 300w"' in out
+    assert 'alt="A &amp; B"' in out
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import pytest
+
+from jsmin import PUNCT, REGEX, STRING, WORD, JSSyntaxError, minify, tokenize
+
+
+@pytest.mark.parametrize(
+    "number",
+    [
+        "0",
+        "42",
+        "017",
+        "1_000",
+        "3.14",
+        "5.",
+        ".5",
+        "1e3",
+        "1.5e-3",
+        "2E+10",
+        "1_000.000_1e1_0",
+        "0x1F",
+        "0XFF",
+        "0xdead_beef",
+        "0b101",
+        "0B1_0",
+        "0o17",
+        "0O7_7",
+        "10n",
+        "0x1Fn",
+        "0b101n",
+        "0o17n",
+    ],
+)
+def test_numbers_are_one_token(number):
+    tokens = tokenize(f"x = {number};")
+    assert [(t.kind, t.text) for t in tokens] == [(WORD, "x"), (PUNCT, "="), (WORD, number), (PUNCT, ";")]
+
+
+def test_prefixed_numbers_survive_minify():
+    assert minify("var a = 0x1F + 0b101 - 0o17 * 0xFFn;\n") == "var a=0x1F+0b101-0o17*0xFFn;"
+
+
+def test_member_access_on_numbers():
+    # A dot after a plain integer would be read as a decimal point; after these it can't be.
+    assert minify("1 .toString(); 1.5.toFixed(1); 0x1F.toString(2); 0b1.toString()") == (
+        "1 .toString();1.5.toFixed(1);0x1F.toString(2);0b1.toString()"
+    )
+
+
+def test_regex_or_division():
+    tokens = tokenize("a = b / c; d = /x\\/y[/]/g.test(s); return /z/")
+    assert [t.text for t in tokens if t.kind == REGEX] == ["/x\\/y[/]/g", "/z/"]
+
+
+def test_strings_templates_and_comments():
+    src = "// top\nlet s = 'a // b' + \"c /* d */\" + `e ${ f /* g */ } h`; /* tail\n */ go()"
+    tokens = tokenize(src)
+    assert [t.text for t in tokens if t.kind == STRING] == ["'a // b'", '"c /* d */"', "`e ${ f /* g */ } h`"]
+    assert minify(src) == "let s='a // b'+\"c /* d */\"+`e ${ f /* g */ } h`;go()"
+
+
+def test_line_breaks_kept_where_asi_needs_them():
+    assert minify("a = b\n++c\nreturn\nx") == "a=b\n++c\nreturn\nx"
+    assert minify("f(a,\n  b)\n.then(g)") == "f(a,b).then(g)"
+    assert minify("a + +b; c - -d") == "a+ +b;c- -d"
+
+
+def test_syntax_errors():
+    for src in ("x = 'open", "/* open", "x = `open ${"):
+        with pytest.raises(JSSyntaxError):
+            tokenize(src)
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from calculators_config import SITE_URL, get_paths
+from link_check import check_links, classify, page_url, resolve
+
+
+def write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def calculator(slug: str, body: str = "", canonical: str = "") -> str:
+    canonical = canonical or f"{SITE_URL}/calculators/math/{slug}/"
+    return f'<html><head><link rel="canonical" href="{canonical}"></head><body>{body}</body></html>'
+
+
+def test_page_url():
+    assert page_url("index.html") == "/"
+    assert page_url("about.html") == "/about/"
+    assert page_url("calculators/a/b/index.html") == "/calculators/a/b/"
+    assert page_url("styles/main.css") == "/styles/main.css"
+
+
+def test_resolve_and_classify():
+    urls = {"/": "index.html", "/about/": "about.html", "/styles/main.css": "styles/main.css"}
+    assert resolve("../../about/?x=1#top", "/calculators/a/") == "/about/"
+    assert resolve(f"{SITE_URL}/about/", "/") == "/about/"
+    assert resolve("https://example.com/about/", "/") is None
+    assert resolve("mailto:me@example.com", "/") is None
+    assert classify("/about/", urls) == ("ok", "/about/")
+    assert classify("/about", urls) == ("redirect", "/about/")
+    assert classify("/about.html", urls) == ("redirect", "/about/")
+    assert classify("/nope/", urls) == ("broken", "no such page or file")
+
+
+def test_check_links(tmp_path):
+    write(tmp_path / "styles" / "main.css", "")
+    write(
+        tmp_path / "index.html",
+        '<a href="/calculators/math/area/">Area</a>\n'
+        '<a href="/about">About</a>\n'
+        '<link rel="stylesheet" href="/styles/main.css">\n'
+        "<!-- <a href=\"/commented-out/\"></a> -->\n"
+        "<script>const u = '<a href=\"/in-script/\">';</script>\n"
+        '<a href="/missing/">Missing</a>\n',
+    )
+    write(tmp_path / "about.html", "<p>About</p>")
+    write(tmp_path / "calculators" / "math" / "area" / "index.html", calculator("area"))
+    write(
+        tmp_path / "calculators" / "math" / "orphan" / "index.html",
+        calculator("orphan", canonical=f"{SITE_URL}/calculators/math/other/"),
+    )
+
+    report = check_links(get_paths(tmp_path), use_cache=False)
+    found = sorted((i.kind, i.page, i.line, i.target) for i in report.issues)
+    assert found == [
+        ("broken", "index.html", 6, "/missing/"),
+        ("canonical", "calculators/math/orphan/index.html", 0, f"{SITE_URL}/calculators/math/other/"),
+        ("orphan", "calculators/math/orphan/index.html", 0, "/calculators/math/orphan/"),
+        ("redirect", "index.html", 2, "/about"),
+    ]
+    assert report.links == 4
+
+
+def test_cache_reuses_unchanged_pages(tmp_path):
+    paths = get_paths(tmp_path)
+    write(tmp_path / "index.html", '<a href="/missing/">x</a>')
+    write(tmp_path / "about.html", "<p>About</p>")
+    assert check_links(paths).extracted == 2
+
+    write(tmp_path / "about.html", '<a href="/">home</a>')
+    second = check_links(paths)
+    assert second.extracted == 1
+    assert [i.target for i in second.issues] == ["/missing/"]
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import pickle
+
+import pytest
+
+from file_discovery import listing
+from output_stage import STAGING_DIR_NAME, begin_output, leftover_stages
+
+
+def test_writes_are_staged_until_commit(tmp_path):
+    live = tmp_path / "a.txt"
+    live.write_text("old", encoding="utf-8")
+    out = begin_output("test", tmp_path)
+    try:
+        assert out.write_text(live, "new")
+        assert out.write_text(tmp_path / "sub" / "b.txt", "b")
+        assert live.read_text(encoding="utf-8") == "old"
+        assert not (tmp_path / "sub").exists()
+        assert out.read_bytes(live) == b"new"
+        assert out.exists(tmp_path / "sub" / "b.txt")
+
+        result = out.commit()
+        assert sorted(p.name for p in result.written) == ["a.txt", "b.txt"]
+        assert live.read_text(encoding="utf-8") == "new"
+        assert (tmp_path / "sub" / "b.txt").read_text(encoding="utf-8") == "b"
+    finally:
+        out.close()
+    assert not (tmp_path / STAGING_DIR_NAME).exists()
+
+
+def test_unchanged_write_is_skipped(tmp_path):
+    live = tmp_path / "a.txt"
+    live.write_text("same", encoding="utf-8")
+    mtime = live.stat().st_mtime_ns
+    with begin_output("test", tmp_path) as out:
+        assert out.write_text(live, "changed")
+        # Writing the live content again undoes the earlier staged write
+        assert not out.write_text(live, "same")
+        result = out.commit()
+    assert result.written == [] and result.unchanged == 1
+    assert live.stat().st_mtime_ns == mtime
+
+
+def test_remove_prunes_emptied_dirs_and_invalidates_listing(tmp_path):
+    (tmp_path / "keep.txt").write_text("k", encoding="utf-8")
+    gone = tmp_path / "sitemaps" / "pages.xml"
+    gone.parent.mkdir()
+    gone.write_text("x", encoding="utf-8")
+    assert "sitemaps/pages.xml" in listing(tmp_path).files
+
+    with begin_output("test", tmp_path) as out:
+        assert out.remove(gone)
+        assert not out.remove(tmp_path / "missing.txt")
+        assert out.write_text(tmp_path / "new.txt", "n")
+    assert not (tmp_path / "sitemaps").exists()
+    assert list(listing(tmp_path).files) == ["keep.txt", "new.txt"]
+
+
+def test_error_publishes_nothing(tmp_path):
+    live = tmp_path / "a.txt"
+    live.write_text("old", encoding="utf-8")
+    with pytest.raises(RuntimeError):
+        with begin_output("test", tmp_path) as out:
+            out.write_text(live, "half-done")
+            raise RuntimeError("stage failed")
+    assert live.read_text(encoding="utf-8") == "old"
+    assert not (tmp_path / STAGING_DIR_NAME).exists()
+
+
+def test_workers_stage_through_a_pickled_copy(tmp_path):
+    with begin_output("test", tmp_path) as out:
+        worker = pickle.loads(pickle.dumps(out))
+        worker.write_text(tmp_path / "w.txt", "from a worker")
+        result = out.commit()
+    assert [p.name for p in result.written] == ["w.txt"]
+    assert out.totals.written == result.written
+
+
+def test_leftover_stage_of_dead_process_is_cleared(tmp_path):
+    stale = tmp_path / STAGING_DIR_NAME / "build-20260101_000000_000000-999999999" / "files"
+    stale.mkdir(parents=True)
+    assert leftover_stages(tmp_path) == [stale.parent]
+    with begin_output("test", tmp_path):
+        assert not stale.parent.exists()
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import re
+
+from find_replace import load_engine, parse_rules, process_file
+from replace_engine import ReplaceEngine, Rule, trie_regex
+
+
+def rules_text(find: str, replace: str) -> str:
+    return f"[RULE]\nNAME=long\n[FIND]\n{find}\n[/FIND]\n[REPLACE]\n{replace}\n[/REPLACE]\n[/RULE]\n"
+
+
+def one_by_one(rules: list[Rule], content: str) -> str:
+    for rule in rules:
+        content = ReplaceEngine([rule]).apply(content)[0]
+    return content
+
+
+def test_trie_regex_matches_each_needle_and_prefers_longer():
+    needles = ["abc", "abd", "ab", "x.y"]
+    pattern = re.compile(trie_regex(sorted(needles)))
+    for n in needles:
+        assert pattern.fullmatch(n)
+    assert pattern.match("abcd").group() == "abc"
+    assert not pattern.search("xzy")
+
+
+def test_trie_regex_long_needles():
+    long_a = "<p>" + "a" * 5000 + "</p>"
+    long_b = "<p>" + "a" * 4000 + "b"
+    pattern = re.compile(trie_regex(sorted([long_a, long_b, "<p>"])))
+    assert pattern.search("xx" + long_a).group() == long_a
+    assert pattern.search(long_b + "yy").group() == long_b
+
+
+def test_long_find_single_literal_stage_and_prefilter():
+    find = "<div class=\"legacy\">\n" + "lorem ipsum dolor sit amet " * 200 + "\n</div>"
+    assert len(find) > 5000
+    rule = Rule(name="long", find=find, replace="<div class=\"modern\"></div>")
+    engine = ReplaceEngine([rule])
+    assert ReplaceEngine.make_plan([rule])[0]["literal"]
+
+    page = f"<html><body>\n{find}\n</body></html>"
+    assert engine.matches(page.encode("utf-8"))
+    assert not engine.matches(page.replace("dolor", "color").encode("utf-8"))
+    assert engine.apply(page) == (page.replace(find, rule.replace), ["long"])
+
+
+def test_long_find_through_rules_file(tmp_path):
+    find = "\n".join(f"<li>item {i}</li>" for i in range(400))
+    text = rules_text(find, "<li>all</li>")
+    engine, cached = load_engine(text, tmp_path / "cache")
+    assert not cached
+    assert load_engine(text, tmp_path / "cache")[1]
+
+    page = tmp_path / "page.html"
+    page.write_text(f"<ul>\n{find}\n</ul>\n", encoding="utf-8")
+    change = process_file(page, engine, tmp_path, want_diff=True)
+    assert change is not None and change.triggered == ["long"]
+    assert change.new.decode("utf-8").replace("\r\n", "\n") == "<ul>\n<li>all</li>\n</ul>\n"
+
+
+def test_staged_rules_match_sequential_application():
+    text = "".join(
+        rules_text(f, r)
+        for f, r in [("<b>", "<strong>"), ("</b>", "</strong>"), ("old", "new"), ("new", "newer"), ("<i>", "")]
+    )
+    rules = parse_rules(text)
+    content = "<b>old</b> <i>new</i> <b>x</b>"
+    assert ReplaceEngine(rules).apply(content)[0] == one_by_one(rules, content)
+
+
+def test_scoped_and_ws_rules():
+    rules = [
+        Rule(name="head", find="<meta x>", replace="<meta y>", scope="head"),
+        Rule(name="ws", find="a  b\n c", replace="abc", kind="ws"),
+    ]
+    content = "<head><meta x></head><body><meta x> a b c</body>"
+    new, triggered = ReplaceEngine(rules).apply(content)
+    assert new == "<head><meta y></head><body><meta x> abc</body>"
+    assert triggered == ["head", "ws"]
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from search_shards import build_search_shards, normalize_search_text, shard_key
+from utils import CalculatorRecord
+
+
+def record(title: str, slug: str) -> CalculatorRecord:
+    return CalculatorRecord(
+        title=title,
+        url=f"/calculators/finance/{slug}/",
+        category_slug="finance",
+        category_name="Finance",
+        description="",
+        calculator_slug=slug,
+        source_path=Path(slug),
+    )
+
+
+RECORDS = [
+    record("Mortgage Calculator", "mortgage"),
+    record("Remortgage Calculator", "remortgage"),
+]
+
+
+def shard_matches(shards: dict, query: str) -> list[str]:
+    # Mirrors getShardMatches() in scripts/search.js: every word a prefix of a term
+    hits = None
+    for word in normalize_search_text(query).split():
+        shard = shards.get(shard_key(word))
+        docs = set()
+        if shard:
+            for term, posting in zip(shard["terms"], shard["postings"]):
+                if term.startswith(word):
+                    docs.update(shard["docs"][i][0] for i in posting)
+        hits = docs if hits is None else hits & docs
+    return [RECORDS[d].url for d in sorted(hits or ())]
+
+
+def substring_matches(query: str) -> list[str]:
+    # Mirrors getMatches() over search-index.min.json
+    q = normalize_search_text(query)
+    return [r.url for r in RECORDS if q in normalize_search_text(f"{r.title} {r.category_name}")]
+
+
+def test_shards_match_word_prefixes_only():
+    _, shards = build_search_shards(RECORDS, [[] for _ in RECORDS])
+    assert shard_matches(shards, "mort") == ["/calculators/finance/mortgage/"]
+    assert shard_matches(shards, "remort calc") == ["/calculators/finance/remortgage/"]
+    # "remortgage" is only in the "r" shard, so a mid-word query misses it there
+    assert shard_matches(shards, "mortgage") == ["/calculators/finance/mortgage/"]
+
+
+def test_substring_fallback_finds_mid_word_matches():
+    # What search.js adds from the legacy index when shards give less than a page
+    assert substring_matches("mortgage") == [
+        "/calculators/finance/mortgage/",
+        "/calculators/finance/remortgage/",
+    ]
+
+
+def test_prefix_spans_cover_terms():
+    _, shards = build_search_shards(RECORDS, [[] for _ in RECORDS])
+    for shard in shards.values():
+        for prefix, (start, end) in shard["prefix"].items():
+            assert all(t.startswith(prefix) for t in shard["terms"][start:end])
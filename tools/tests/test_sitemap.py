@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import os
+import subprocess
+from pathlib import Path
+
+from calculators_config import SITE_URL, SITEMAP_URL_LASTMOD_RE, get_paths
+from output_stage import begin_output
+from sitemap import collect_pages, write_sitemap
+
+
+def write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def site(root: Path) -> None:
+    write(root / "index.html", "<html><title>Home</title></html>")
+    write(root / "categories" / "math" / "index.html", "<main></main>")
+    write(root / "calculators" / "math" / "area" / "index.html", "<title>Area</title>")
+    # No <title> and no <h1>: the search index skips it, the sitemap must not
+    write(root / "calculators" / "math" / "untitled" / "index.html", "<p>work in progress</p>")
+
+
+def test_calculators_listed_from_files(tmp_path):
+    site(tmp_path)
+    locs = [p.loc for p in collect_pages(get_paths(tmp_path))]
+    assert locs == [
+        f"{SITE_URL}/",
+        f"{SITE_URL}/categories/math/",
+        f"{SITE_URL}/calculators/math/area/",
+        f"{SITE_URL}/calculators/math/untitled/",
+    ]
+
+
+def git(root: Path, *args: str, date: str = "2026-01-01") -> None:
+    env = {**os.environ, "GIT_AUTHOR_DATE": f"{date}T12:00:00Z", "GIT_COMMITTER_DATE": f"{date}T12:00:00Z"}
+    subprocess.run(
+        ["git", "-C", str(root), "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        check=True,
+        capture_output=True,
+        env=env,
+    )
+
+
+def build(root: Path, today: str):
+    paths = get_paths(root)
+    with begin_output("test", root) as out:
+        result = write_sitemap(paths, today=today, out=out)
+        out.commit()
+    dates = dict(SITEMAP_URL_LASTMOD_RE.findall(paths.sitemap_path.read_text(encoding="utf-8")))
+    return result, dates
+
+
+AREA = f"{SITE_URL}/calculators/math/area/"
+UNTITLED = f"{SITE_URL}/calculators/math/untitled/"
+
+
+def test_lastmod_from_git_history(tmp_path):
+    site(tmp_path)
+    git(tmp_path, "init", "-q")
+    git(tmp_path, "add", "-A")
+    git(tmp_path, "commit", "-q", "-m", "import", date="2026-01-01")
+
+    # Only the first commit so far: its date, for want of an earlier sitemap
+    first, dates = build(tmp_path, "2026-03-01")
+    assert first.urls == 4 and first.lastmod_bumped == 4
+    assert set(dates.values()) == {"2026-01-01"}
+
+    write(tmp_path / "calculators" / "math" / "area" / "index.html", "<title>Area (m2)</title>")
+    git(tmp_path, "commit", "-q", "-am", "edit", date="2026-02-01")
+    second, dates = build(tmp_path, "2026-03-01")
+    assert second.lastmod_bumped == 1
+    assert dates[AREA] == "2026-02-01"
+    assert dates[UNTITLED] == "2026-01-01"
+
+    # Uncommitted edits are dated today; rebuilding changes nothing else
+    write(tmp_path / "calculators" / "math" / "untitled" / "index.html", "<p>still in progress</p>")
+    third, dates = build(tmp_path, "2026-03-01")
+    assert third.lastmod_bumped == 1
+    assert (dates[AREA], dates[UNTITLED]) == ("2026-02-01", "2026-03-01")
+
+
+def test_first_commit_keeps_published_lastmod(tmp_path):
+    # An import commit says nothing about when a page last changed: keep the published date
+    site(tmp_path)
+    build(tmp_path, "2025-06-01")
+    git(tmp_path, "init", "-q")
+    git(tmp_path, "add", "-A")
+    git(tmp_path, "commit", "-q", "-m", "import", date="2026-01-01")
+    result, dates = build(tmp_path, "2026-03-01")
+    assert result.lastmod_bumped == 0
+    assert set(dates.values()) == {"2025-06-01"}
+
+
+def test_lastmod_without_git(tmp_path):
+    site(tmp_path)
+    first, dates = build(tmp_path, "2026-01-01")
+    assert first.lastmod_bumped == 4 and set(dates.values()) == {"2026-01-01"}
+
+    # Nothing to date a change by: dates on disk are kept, new URLs get today
+    write(tmp_path / "calculators" / "math" / "volume" / "index.html", "<title>Volume</title>")
+    second, dates = build(tmp_path, "2026-02-01")
+    assert second.lastmod_bumped == 1
+    assert dates[AREA] == "2026-01-01"
+    assert dates[f"{SITE_URL}/calculators/math/volume/"] == "2026-02-01"
@@ -1,24 +1,36 @@
 from __future__ import annotations
 
-import json
 import re
-from dataclasses import dataclass
+from functools import partial
 from html import unescape
+from itertools import chain
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Iterable, NamedTuple, Optional, Pattern, Tuple, Union
 
+from backup_store import BackupRun
 from calculators_config import (
     BREADCRUMBS_CATEGORY_LINK_RE,
+    BREADCRUMBS_NAV_OPEN_RE,
     CANONICAL_RE,
-    CATEGORY_GRID_OPEN,
     CATEGORY_H1_RE,
+    H1_TEXT_RE,
     META_DESC_RE,
+    NAV_CLOSE_RE,
+    NON_ALNUM_RE,
+    TAG_RE,
     TITLE_TAG_RE,
+    WHITESPACE_RE,
 )
+from file_discovery import listing
+from html_regions import find_category_grid
+from json_stream import iter_json_array
+from output_stage import OutputStage
+from parallel import parallel_map
 
 
-@dataclass(frozen=True)
-class CalculatorRecord:
+class CalculatorRecord(NamedTuple):
+    # A NamedTuple rather than a dataclass: no per-instance __dict__, and the build
+    # holds one per page. source_path is the Path from the scan, not a copy.
     title: str
     url: str
     category_slug: str
@@ -28,6 +40,15 @@ class CalculatorRecord:
     source_path: Path
 
 
+class HeadFields(NamedTuple):
+    # Raw (still escaped) HTML fragments; record_from_head_fields runs them through html_text.
+    title: Optional[str]
+    description: Optional[str]
+    canonical: Optional[str]
+    breadcrumb_category: Optional[Tuple[str, str]]
+    h1: Optional[str]
+
+
 def read_text(path: Path) -> str:
     # Tolerate mixed line endings and odd encodings.
     return path.read_text(encoding="utf-8", errors="replace")
@@ -39,29 +60,31 @@ def write_text(path: Path, content: str) -> None:
 
 
 def normalize_ws(s: str) -> str:
-    return re.sub(r"\s+", " ", s).strip()
+    return WHITESPACE_RE.sub(" ", s).strip()
 
 
 def strip_tags(s: str) -> str:
-    return re.sub(r"<[^>]+>", "", s)
+    return TAG_RE.sub("", s)
 
 
 def html_text(s: str) -> str:
     return normalize_ws(unescape(strip_tags(s)))
 
 
-def re_first(pattern: str, text: str, flags: int = re.DOTALL | re.IGNORECASE) -> Optional[str]:
-    m = re.search(pattern, text, flags)
-    if not m:
-        return None
-    return m.group(1)
+def _search(pattern: Union[str, Pattern[str]], text: str, flags: int) -> Optional[re.Match[str]]:
+    # Compiled patterns (calculators_config) carry their own flags.
+    if isinstance(pattern, re.Pattern):
+        return pattern.search(text)
+    return re.search(pattern, text, flags)
 
 
-def re_first_two(pattern: str, text: str, flags: int = re.DOTALL | re.IGNORECASE) -> Optional[Tuple[str, str]]:
-    m = re.search(pattern, text, flags)
+def re_first(
+    pattern: Union[str, Pattern[str]], text: str, flags: int = re.DOTALL | re.IGNORECASE
+) -> Optional[str]:
+    m = _search(pattern, text, flags)
     if not m:
         return None
-    return m.group(1), m.group(2)
+    return m.group(1)
 
 
 def rel_url_from_canonical(canonical: str) -> str:
@@ -85,15 +108,12 @@ def slug_from_calc_path(calc_index_path: Path, calculators_dir: Path) -> Tuple[s
 
 
 def scan_calculator_index_files(calculators_dir: Path) -> list[Path]:
-    if not calculators_dir.exists():
-        return []
-    return sorted(calculators_dir.glob("*/*/index.html"))
+    # Sorted by path; backups and other excluded names are never listed
+    return listing(calculators_dir).glob("*/*/index.html")
 
 
 def scan_category_index_files(categories_dir: Path) -> list[Path]:
-    if not categories_dir.exists():
-        return []
-    return sorted(categories_dir.glob("*/index.html"))
+    return listing(categories_dir).glob("*/index.html")
 
 
 def build_category_name_map(categories_dir: Path) -> dict[str, str]:
@@ -107,34 +127,71 @@ def build_category_name_map(categories_dir: Path) -> dict[str, str]:
     return out
 
 
+def breadcrumb_category(raw: str) -> Optional[Tuple[str, str]]:
+    # (slug, link text) of the first category link after <nav class="breadcrumbs">
+    nav = BREADCRUMBS_NAV_OPEN_RE.search(raw)
+    if not nav:
+        return None
+    m = BREADCRUMBS_CATEGORY_LINK_RE.search(raw, nav.end())
+    if not m or not NAV_CLOSE_RE.search(raw, m.end()):
+        return None
+    return m.group(1), m.group(2)
+
+
+def head_fields(raw: str) -> HeadFields:
+    # One search per field; the <h1> is only looked for when the title is blank.
+    title = re_first(TITLE_TAG_RE, raw)
+    h1 = re_first(H1_TEXT_RE, raw) if not html_text(title or "") else None
+    return HeadFields(
+        title=title,
+        description=re_first(META_DESC_RE, raw),
+        canonical=re_first(CANONICAL_RE, raw),
+        breadcrumb_category=breadcrumb_category(raw),
+        h1=h1,
+    )
+
+
 def parse_calculator_page(
     index_path: Path,
     calculators_dir: Path,
     category_name_map: dict[str, str],
 ) -> Optional[CalculatorRecord]:
-    raw = read_text(index_path)
+    return parse_calculator_html(read_text(index_path), index_path, calculators_dir, category_name_map)
 
-    title = re_first(TITLE_TAG_RE, raw)
-    title = html_text(title or "")
 
-    desc = re_first(META_DESC_RE, raw)
-    desc = html_text(desc or "")
+def parse_calculator_html(
+    raw: str,
+    index_path: Path,
+    calculators_dir: Path,
+    category_name_map: dict[str, str],
+) -> Optional[CalculatorRecord]:
+    # Same as parse_calculator_page, for callers that already hold the page text.
+    return record_from_head_fields(head_fields(raw), index_path, calculators_dir, category_name_map)
+
+
+def record_from_head_fields(
+    fields: HeadFields,
+    index_path: Path,
+    calculators_dir: Path,
+    category_name_map: dict[str, str],
+) -> Optional[CalculatorRecord]:
+    # Calc slug + category slug from path are authoritative for file placement
+    category_slug_from_path, calc_slug = slug_from_calc_path(index_path, calculators_dir)
 
-    canonical = re_first(CANONICAL_RE, raw)
+    title = html_text(fields.title or "")
+    desc = html_text(fields.description or "")
+
+    canonical = fields.canonical
     if canonical:
         url = rel_url_from_canonical(canonical)
     else:
-        cat_slug, calc_slug = slug_from_calc_path(index_path, calculators_dir)
-        url = f"/calculators/{cat_slug}/{calc_slug}/"
+        url = f"/calculators/{category_slug_from_path}/{calc_slug}/"
 
-    # Prefer breadcrumbs category link for both slug + name
-    crumbs = re_first_two(BREADCRUMBS_CATEGORY_LINK_RE, raw)
+    # Prefer breadcrumbs category link for the readable name
+    crumbs = fields.breadcrumb_category
     if crumbs:
-        category_slug_from_breadcrumbs = crumbs[0].strip()
         category_name = html_text(crumbs[1])
     else:
-        category_slug_from_breadcrumbs = ""
-        category_slug_from_path, _ = slug_from_calc_path(index_path, calculators_dir)
         category_name = category_name_map.get(
             category_slug_from_path,
             category_slug_from_path.replace("-", " ").title(),
@@ -142,24 +199,15 @@ def parse_calculator_page(
 
     # Fallback title if missing
     if not title:
-        h1 = re_first(r"<h1>\s*(.*?)\s*</h1>", raw)
-        title = html_text(h1 or "")
+        title = html_text(fields.h1 or "")
     if not title:
         return None
 
-    # Calc slug + category slug from path are authoritative for file placement
-    category_slug_from_path, calc_slug = slug_from_calc_path(index_path, calculators_dir)
-
-    # Keep URL and category slug consistent with path, but keep readable category name from breadcrumbs if present
-    category_slug = category_slug_from_path
-    if category_slug_from_breadcrumbs:
-        # breadcrumbs name already captured; slug mismatch not used
-        pass
-
+    # Keep URL and category slug consistent with path; the breadcrumbs slug is not used
     return CalculatorRecord(
         title=title,
         url=url,
-        category_slug=category_slug,
+        category_slug=category_slug_from_path,
         category_name=category_name,
         description=desc,
         calculator_slug=calc_slug,
@@ -167,17 +215,28 @@ def parse_calculator_page(
     )
 
 
+def record_sort_key(r: CalculatorRecord) -> tuple[str, str]:
+    return r.category_slug.lower(), r.title.lower()
+
+
+def sort_records(records: list[CalculatorRecord]) -> list[CalculatorRecord]:
+    # Stable output order for the index, shards and sitemap. Sorts in place (no
+    # second list) and returns the same list; only the keys are built on the side.
+    records.sort(key=record_sort_key)
+    return records
+
+
 def build_aliases(title: str, calculator_slug: str, category_name: str) -> list[str]:
     # Keep this simple and deterministic.
     t = title.lower()
-    t_clean = re.sub(r"[^a-z0-9\s]+", " ", t)
+    t_clean = NON_ALNUM_RE.sub(" ", t)
     t_clean = normalize_ws(t_clean)
 
     slug_words = calculator_slug.replace("-", " ").lower()
     slug_words = normalize_ws(slug_words)
 
     # Acronym from title words (skip trivial)
-    words = [w for w in re.split(r"\s+", t_clean) if w and w not in {"and", "or", "the", "a", "an", "of", "to"}]
+    words = [w for w in WHITESPACE_RE.split(t_clean) if w and w not in {"and", "or", "the", "a", "an", "of", "to"}]
     acronym = "".join(w[0] for w in words)[:6]
 
     aliases: list[str] = []
@@ -204,19 +263,28 @@ def build_aliases(title: str, calculator_slug: str, category_name: str) -> list[
     return aliases[:12]
 
 
-def write_search_index_json(path: Path, records: list[CalculatorRecord]) -> None:
-    data = []
-    for r in records:
-        data.append(
-            {
-                "title": r.title,
-                "url": r.url,
-                "category": r.category_name,
-                "aliases": build_aliases(r.title, r.calculator_slug, r.category_name),
-            }
-        )
-    content = json.dumps(data, ensure_ascii=False, indent=2)
-    write_text(path, content + "\n")
+def record_aliases(records: list[CalculatorRecord]) -> list[list[str]]:
+    # build_aliases for every record, computed once and shared by the index writers
+    return [build_aliases(r.title, r.calculator_slug, r.category_name) for r in records]
+
+
+def write_search_index_json(
+    path: Path,
+    records: list[CalculatorRecord],
+    aliases: Optional[Iterable[list[str]]] = None,
+    *,
+    out: OutputStage,
+) -> bool:
+    # aliases: record_aliases(records), if the caller already has them.
+    # Streamed one entry at a time: the same text as json.dumps(indent=2) of the
+    # whole list, without building the list of dicts or the string.
+    if aliases is None:
+        aliases = (build_aliases(r.title, r.calculator_slug, r.category_name) for r in records)
+    entries = (
+        {"title": r.title, "url": r.url, "category": r.category_name, "aliases": a}
+        for r, a in zip(records, aliases)
+    )
+    return out.write_chunks(path, chain(iter_json_array(entries, indent=2), ["\n"]))
 
 
 def escape_html(s: str) -> str:
@@ -243,149 +311,71 @@ def make_category_tile_html(r: CalculatorRecord, indent: str = "          ") ->
     )
 
 
-def _find_matching_div_close(html: str, open_tag_end_index: int) -> int:
-    """
-    Return the index (in html) of the '<' that begins the closing </div> tag
-    that matches the currently-open <div ...> whose '>' ended at open_tag_end_index.
-
-    This is a real tag scanner (not regex counting), and skips:
-    - comments <!-- ... -->
-    - <script> ... </script>
-    - <style> ... </style>
-    """
-    i = open_tag_end_index
-    depth = 1
-    n = len(html)
-
-    def starts_with_ci(pos: int, s: str) -> bool:
-        return html[pos : pos + len(s)].lower() == s.lower()
-
-    while i < n:
-        ch = html[i]
-        if ch != "<":
-            i += 1
-            continue
-
-        # Comments
-        if starts_with_ci(i, "<!--"):
-            end = html.find("-->", i + 4)
-            if end == -1:
-                # malformed comment; bail out safely
-                return -1
-            i = end + 3
-            continue
-
-        # Find end of tag
-        gt = html.find(">", i + 1)
-        if gt == -1:
-            return -1
-
-        tag_inner = html[i + 1 : gt].strip()
-        tag_inner_l = tag_inner.lower()
-
-        # Skip doctype and other declarations
-        if tag_inner_l.startswith("!doctype") or tag_inner_l.startswith("!"):
-            i = gt + 1
-            continue
-
-        # Extract tag name
-        is_close = tag_inner_l.startswith("/")
-        tag_body = tag_inner_l[1:].lstrip() if is_close else tag_inner_l
-        tag_name = ""
-        for c in tag_body:
-            if c.isalnum() or c in {"-", ":"}:
-                tag_name += c
-            else:
-                break
-
-        # Skip script/style blocks as raw text
-        if not is_close and tag_name in {"script", "style"}:
-            close_pat = f"</{tag_name}>"
-            end_block = html.lower().find(close_pat, gt + 1)
-            if end_block == -1:
-                return -1
-            i = end_block + len(close_pat)
-            continue
-
-        if tag_name == "div":
-            if not is_close:
-                # self-closing div is not valid HTML, but tolerate "<div ... />"
-                if tag_inner_l.endswith("/"):
-                    i = gt + 1
-                    continue
-                depth += 1
-            else:
-                depth -= 1
-                if depth == 0:
-                    return i  # index of '<' for matching </div>
-
-        i = gt + 1
-
-    return -1
-
 def replace_category_grid(category_index_html: str, new_inner_html: str) -> str:
     """
     Replace ONLY the inner HTML of <div class="category-grid"> ... </div>.
 
-    This implementation is tolerant of messy/unbalanced <div> tags inside the grid.
-    It does NOT try to count nested <div> depth. Instead it:
-      - finds the grid open tag
-      - finds </main>
-      - finds the last two </div> tags before </main>
-      - treats the second-last </div> as the grid close tag
+    The grid bounds come from html_regions.find_category_grid (the second-last
+    </div> before </main>, so unbalanced <div> tags inside the grid don't
+    matter); the grid's own open and close tags and everything outside them
+    are kept intact.
     """
-    open_match = re.search(CATEGORY_GRID_OPEN, category_index_html, re.IGNORECASE)
-    if not open_match:
-        raise ValueError('Could not find <div class="category-grid"> in category page.')
-
-    open_end = open_match.end()
-
-    main_close = category_index_html.lower().find("</main>", open_end)
-    if main_close == -1:
-        raise ValueError("Could not find </main> after category-grid open.")
-
-    between = category_index_html[open_end:main_close]
-
-    # Find ALL closing div tags between grid open and </main>
-    closes = list(re.finditer(r"(?is)</div\s*>", between))
-    if len(closes) < 2:
-        raise ValueError("Not enough </div> tags between category-grid and </main> to identify grid close.")
-
-    # The last </div> closes the category-layout; the second-last closes category-grid
-    grid_close_in_between = closes[-2].start()
-    grid_close_abs = open_end + grid_close_in_between
-
-    before = category_index_html[:open_end]
-    after = category_index_html[grid_close_abs:]  # keep the grid closing </div> and everything after intact
-
+    grid = find_category_grid(category_index_html)
     inner = "\n" + new_inner_html.rstrip() + "\n        "
-    return before + inner + after
-
-def rewrite_category_pages(categories_dir: Path, records: list[CalculatorRecord]) -> list[Path]:
+    return category_index_html[: grid.open_end] + inner + category_index_html[grid.close_start :]
+
+
+def _rewrite_category_page(
+    task: tuple[Path, list[CalculatorRecord]],
+    out: OutputStage,
+    backup: Optional[BackupRun] = None,
+) -> bool:
+    # Worker: rewrite one category page grid; returns True if the file changed.
+    cat_index, items = task
+    items_sorted = sorted(items, key=lambda x: x.title.lower())
+    tiles = "".join(make_category_tile_html(r) for r in items_sorted)
+
+    page = read_text(cat_index)
+    try:
+        new_page = replace_category_grid(page, tiles)
+    except Exception as e:
+        print(f"\nERROR rewriting category page: {cat_index}")
+        print(f"Reason: {e}\n")
+        raise
+
+    if new_page != page:
+        if backup is not None:
+            backup.save(cat_index, cat_index.read_bytes(), new_page.encode("utf-8"))
+        out.write_text(cat_index, new_page)
+        return True
+    return False
+
+
+def rewrite_category_pages(
+    categories_dir: Path,
+    records: list[CalculatorRecord],
+    only: Optional[set[str]] = None,
+    jobs: int = 1,
+    backup: Optional[BackupRun] = None,
+    *,
+    out: OutputStage,
+) -> list[Path]:
     # Group calculators by category slug, then rewrite that category page's grid tiles.
+    # When `only` is given, categories outside that set are left untouched.
+    # With `backup`, each page is saved to the backup store before it is rewritten.
+    # Rewritten pages are staged in `out` and go live when the caller commits it.
     by_cat: dict[str, list[CalculatorRecord]] = {}
     for r in records:
         by_cat.setdefault(r.category_slug, []).append(r)
 
-    touched: list[Path] = []
+    tasks: list[tuple[Path, list[CalculatorRecord]]] = []
     for cat_slug, items in by_cat.items():
+        if only is not None and cat_slug not in only:
+            continue
         cat_index = categories_dir / cat_slug / "index.html"
         if not cat_index.exists():
             continue
+        tasks.append((cat_index, items))
 
-        items_sorted = sorted(items, key=lambda x: x.title.lower())
-        tiles = "".join(make_category_tile_html(r) for r in items_sorted)
-
-        page = read_text(cat_index)
-        try:
-            new_page = replace_category_grid(page, tiles)
-        except Exception as e:
-            print(f"\nERROR rewriting category page: {cat_index}")
-            print(f"Reason: {e}\n")
-            raise
-
-        if new_page != page:
-            write_text(cat_index, new_page)
-            touched.append(cat_index)
-
-    return touched
+    changed = parallel_map(partial(_rewrite_category_page, out=out, backup=backup), tasks, jobs=jobs)
+    return [cat_index for (cat_index, _), did_change in zip(tasks, changed) if did_change]
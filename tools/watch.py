@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Optional
+
+from backup_store import BackupRun
+from build_manifest import (
+    BuildManifest,
+    IncrementalScan,
+    category_map_sha256,
+    load_entry,
+    manifest_key,
+    record_from_dict,
+    scan_incremental,
+)
+from calculators_config import Paths
+from file_discovery import invalidate
+from html_lint import lint_site
+from output_stage import begin_output
+from search_shards import write_search_shards
+from utils import (
+    CalculatorRecord,
+    build_aliases,
+    build_category_name_map,
+    rewrite_category_pages,
+    scan_calculator_index_files,
+    scan_category_index_files,
+    sort_records,
+    write_search_index_json,
+)
+
+# (mtime_ns, size) per watched file
+Snapshot = dict[Path, tuple[int, int]]
+
+
+@dataclass
+class RebuildResult:
+    changed_files: int
+    reparsed: int = 0
+    removed: int = 0
+    index_written: bool = False
+    shard_files: int = 0
+    categories: list[Path] = field(default_factory=list)
+    # New structural issues on the changed and rewritten pages, as "page:line kind: detail"
+    lint: list[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+
+def _stat(p: Path) -> Optional[tuple[int, int]]:
+    try:
+        st = p.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def take_snapshot(paths: Paths) -> Snapshot:
+    # Polling instead of inotify: no extra dependency, and a few hundred stats take ~1 ms.
+    # Fresh listings every time, so new pages show up.
+    invalidate(paths.calculators_dir)
+    invalidate(paths.categories_dir)
+    out: Snapshot = {}
+    for p in scan_calculator_index_files(paths.calculators_dir) + scan_category_index_files(paths.categories_dir):
+        s = _stat(p)
+        if s is not None:
+            out[p] = s
+    return out
+
+
+def changed_paths(old: Snapshot, new: Snapshot) -> set[Path]:
+    # Added, removed or modified files
+    return {p for p in old.keys() | new.keys() if old.get(p) != new.get(p)}
+
+
+class WatchSession:
+    """
+    In-memory build state for build.py --watch.
+
+    Holds the manifest (parsed record per page), the category name map and
+    the search aliases per page. rebuild() re-parses only the pages that
+    changed, then rewrites search-index.json and its shards (if any record
+    changed) and only the affected category grids. Output is identical to a
+    full build of the same tree.
+    """
+
+    def __init__(self, repo_root: Path, paths: Paths, backup: Optional[BackupRun] = None) -> None:
+        self.repo_root = repo_root
+        self.paths = paths
+        # One backup run for the whole session; grids are saved before each rewrite
+        self.backup = backup
+        self.category_name_map: dict[str, str] = {}
+        self.manifest = BuildManifest()
+        self.records: dict[str, CalculatorRecord] = {}
+        self.aliases: dict[str, list[str]] = {}
+        self.snapshot: Snapshot = {}
+
+    def start(self) -> None:
+        # Seeded from the manifest the initial build just saved, so nothing is re-parsed.
+        self.category_name_map = build_category_name_map(self.paths.categories_dir)
+        self._full_scan(BuildManifest.load(self.paths.build_manifest_path))
+        self.snapshot = take_snapshot(self.paths)
+
+    def poll(self) -> set[Path]:
+        new = take_snapshot(self.paths)
+        changed = changed_paths(self.snapshot, new)
+        self.snapshot = new
+        return changed
+
+    def rebuild(self, changed: set[Path]) -> RebuildResult:
+        t0 = time.perf_counter()
+        result = RebuildResult(changed_files=len(changed))
+        dirty_categories: set[str] = set()
+        all_categories = False
+        records_changed = False
+
+        cat_pages = {p for p in changed if p.is_relative_to(self.paths.categories_dir)}
+        calc_pages = changed - cat_pages
+        if cat_pages:
+            # A hand-edited category page gets its grid re-rendered
+            dirty_categories |= {p.parent.name for p in cat_pages}
+            name_map = build_category_name_map(self.paths.categories_dir)
+            if category_map_sha256(name_map) != self.manifest.category_map_sha256:
+                # Breadcrumb fallbacks depend on the map: re-parse everything, as a full build would
+                self.category_name_map = name_map
+                result.reparsed += self._full_scan(self.manifest).reparsed
+                all_categories = records_changed = True
+                calc_pages = set()
+
+        for p in sorted(calc_pages):
+            key = manifest_key(p, self.repo_root)
+            old = self.manifest.entries.get(key)
+            old_record = old.record if old else None
+            if p.exists():
+                entry, reparsed = load_entry(p, old, self.paths.calculators_dir, self.category_name_map)
+                self.manifest.entries[key] = entry
+                result.reparsed += reparsed
+                new_record = entry.record
+            else:
+                self.manifest.entries.pop(key, None)
+                result.removed += old is not None
+                new_record = None
+            if new_record == old_record:
+                continue
+
+            records_changed = True
+            for rec in (old_record, new_record):
+                if rec is not None:
+                    dirty_categories.add(rec["category_slug"])
+            self.records.pop(key, None)
+            self.aliases.pop(key, None)
+            if new_record is not None:
+                self._add_record(key, record_from_dict(new_record, p))
+
+        records = self.sorted_records()
+        # Published together at the end of the block; a failed rebuild changes nothing
+        with begin_output("watch", self.repo_root) as out:
+            if records_changed:
+                aliases = [self.aliases[manifest_key(r.source_path, self.repo_root)] for r in records]
+                write_search_index_json(self.paths.search_index_path, records, aliases, out=out)
+                result.shard_files = write_search_shards(self.paths.search_shards_dir, records, aliases, out=out)
+                result.index_written = True
+
+            if dirty_categories or all_categories:
+                result.categories = rewrite_category_pages(
+                    self.paths.categories_dir,
+                    records,
+                    only=None if all_categories else dirty_categories,
+                    backup=self.backup,
+                    out=out,
+                )
+
+        # Our own writes must not come back as changes on the next poll
+        for p in result.categories:
+            s = _stat(p)
+            if s is not None:
+                self.snapshot[p] = s
+
+        lint = lint_site(self.paths, files=sorted({p for p in changed if p.exists()} | set(result.categories)))
+        result.lint = [
+            f"{rel}:{i.line} {i.kind}: {i.detail}" for rel, issues in lint.regressions.items() for i in issues
+        ]
+
+        result.seconds = time.perf_counter() - t0
+        return result
+
+    def sorted_records(self) -> list[CalculatorRecord]:
+        # Path order first, like the build's scan, so ties sort the same way
+        return sort_records(sorted(self.records.values(), key=lambda r: r.source_path))
+
+    def save_manifest(self) -> None:
+        self.manifest.save(self.paths.build_manifest_path)
+
+    def _full_scan(self, previous: BuildManifest) -> IncrementalScan:
+        calc_files = scan_calculator_index_files(self.paths.calculators_dir)
+        scan = scan_incremental(
+            calc_files, self.repo_root, self.paths.calculators_dir, self.category_name_map, previous
+        )
+        self.manifest = scan.manifest
+        self.records = {}
+        self.aliases = {}
+        for r in scan.records:
+            self._add_record(manifest_key(r.source_path, self.repo_root), r)
+        return scan
+
+    def _add_record(self, key: str, r: CalculatorRecord) -> None:
+        self.records[key] = r
+        self.aliases[key] = build_aliases(r.title, r.calculator_slug, r.category_name)
+
+
+def format_rebuild(result: RebuildResult, repo_root: Path) -> str:
+    parts = [f"{result.changed_files} change(s)", f"{result.reparsed} re-parsed"]
+    if result.removed:
+        parts.append(f"{result.removed} removed")
+    parts.append(f"index {'written' if result.index_written else 'unchanged'}")
+    if result.shard_files:
+        parts.append(f"{result.shard_files} shard file(s)")
+    grids = ", ".join(p.parent.relative_to(repo_root).as_posix() for p in result.categories)
+    parts.append(f"grids: {grids or 'none'}")
+    if result.lint:
+        parts.append(f"{len(result.lint)} new lint issue(s)")
+    line = f"[{time.strftime('%H:%M:%S')}] rebuilt in {result.seconds * 1000:.1f} ms: " + "; ".join(parts)
+    return "\n    ".join([line, *result.lint])
+
+
+def watch_loop(
+    session: WatchSession,
+    interval: float,
+    debounce: float,
+    on_rebuild: Callable[[RebuildResult], None],
+    on_error: Callable[[Exception], None],
+) -> None:
+    """
+    Poll every `interval` seconds; rebuild once changes have been quiet for `debounce` seconds.
+
+    Saves arriving in a burst (an editor writing several files, a formatter
+    running after save) are coalesced into a single rebuild. Runs until
+    interrupted.
+    """
+    pending: set[Path] = set()
+    last_change = 0.0
+    while True:
+        changed = session.poll()
+        now = time.monotonic()
+        if changed:
+            pending |= changed
+            last_change = now
+        if pending and now - last_change >= debounce:
+            batch, pending = pending, set()
+            try:
+                on_rebuild(session.rebuild(batch))
+            except Exception as e:  # keep watching: the next save may fix the page
+                on_error(e)
+        time.sleep(min(interval, debounce) if pending else interval)
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def serve(root: Path, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    # Static preview of the site root on a daemon thread (dies with the watcher)
+    server = ThreadingHTTPServer((host, port), partial(_QuietHandler, directory=str(root)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server